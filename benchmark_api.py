@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for /api/optimize
+
+Starts local fakes for the Google Maps web services (fake_maps_server.py) and the
+Route Optimization gRPC API (fake_route_optimization_server.py), points main.py
+at them and drives /api/optimize end to end through the Flask test client over
+seeded synthetic instances (synthetic_instances.py). No Google credentials or
+network access are needed.
+
+Reports p50/p95 latency, throughput and external call counts per instance size.
+
+Usage:
+    python benchmark_api.py
+    python benchmark_api.py --stops 5,25,100,500 --requests 20 --concurrency 4
+    python benchmark_api.py --engine local --matrix-source distance_matrix --maps-latency 0.05
+    python benchmark_api.py --route-latency 0.5 --error-rate 0.05 --json results.json
+    python benchmark_api.py --stops 10,100,1000,2000 --requests 3 --priority-fraction 0.1
+    python benchmark_api.py --priority-fraction 0.1 --stage1-mode estimate --route-latency 0.5
+    python benchmark_api.py --priority-fraction 0.1 --stage1-mode estimate --calibrate
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_maps_server import FakeMapsServer
+from fake_route_optimization_server import FakeRouteOptimizationServer
+from synthetic_instances import generate_instance
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile (q in 0..100) of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def configure_environment(args, maps_server, route_server):
+    """Point main.py at the fakes; must run before main is imported."""
+    os.environ['GOOGLE_MAPS_BASE_URL'] = maps_server.base_url
+    os.environ['ROUTE_OPTIMIZATION_ENDPOINT'] = route_server.endpoint
+    os.environ['GOOGLE_MAPS_API_KEY'] = 'benchmark'
+    os.environ['GOOGLE_CLOUD_PROJECT_ID'] = 'benchmark'
+    os.environ['DEFAULT_OPTIMIZATION_ENGINE'] = args.engine
+    os.environ['LOCAL_MATRIX_SOURCE'] = args.matrix_source
+    os.environ['DEFAULT_STAGE1_MODE'] = args.stage1_mode
+    os.environ['JOB_STORE_PATH'] = ''
+    os.environ['ROUTE_STORE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='route-store-'), 'routes.sqlite3')
+    os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    if args.warm_caches:
+        cache_dir = tempfile.mkdtemp(prefix='route-benchmark-')
+        os.environ['GEOCODE_CACHE_PATH'] = os.path.join(cache_dir, 'geocode.sqlite3')
+        os.environ['TRAVEL_TIME_CACHE_PATH'] = os.path.join(cache_dir, 'travel_time.sqlite3')
+    else:
+        os.environ['GEOCODE_CACHE_PATH'] = ''
+        os.environ['TRAVEL_TIME_CACHE_PATH'] = ''
+        os.environ['ROUTE_RESPONSE_CACHE_MAX_ENTRIES'] = '0'
+    # A fresh calibration store per run: the local estimate learns only from this run's responses
+    os.environ['CALIBRATION_STORE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='route-calibration-'), 'calibration.sqlite3') if args.calibrate else ''
+
+
+def run_size(app, stops, args, maps_server, route_server):
+    """Run args.requests optimizations of `stops` addresses and collect statistics."""
+    distinct = args.distinct_instances or args.requests
+    payloads = []
+    for i in range(args.requests):
+        payload, geocodes = generate_instance(
+            stops, seed=args.seed + i % distinct, clusters=args.clusters,
+            priority_fraction=args.priority_fraction, time_window_fraction=args.time_window_fraction
+        )
+        maps_server.add_geocodes(geocodes)
+        payloads.append(payload)
+    maps_before = dict(maps_server.calls)
+    route_before = dict(route_server.calls)
+
+    def post(payload):
+        started_at = time.perf_counter()
+        response = app.test_client().post('/api/optimize', json=payload)
+        elapsed = time.perf_counter() - started_at
+        return elapsed, response.status_code, response.get_json(silent=True) or {}
+
+    started_at = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # main.py prints DEBUG lines
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(post, payloads))
+    wall_seconds = time.perf_counter() - started_at
+
+    latencies = [elapsed * 1000 for elapsed, status, _ in results if status == 200]
+    stage_totals = {}
+    estimate_errors = []
+    for _, status, body in results:
+        for stage, ms in body.get('performance', {}).get('stages_ms', {}).items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + ms
+        if body.get('stage1_estimate', {}).get('error_percent') is not None:
+            estimate_errors.append(abs(body['stage1_estimate']['error_percent']))
+    succeeded = len(latencies)
+
+    return {
+        'stops': stops,
+        'requests': len(results),
+        'errors': len(results) - succeeded,
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'throughput_rps': round(len(results) / wall_seconds, 2) if wall_seconds else 0.0,
+        'external_calls': {
+            'geocoding': maps_server.calls['geocode'] - maps_before['geocode'],
+            'distance_matrix': maps_server.calls['distancematrix'] - maps_before['distancematrix'],
+            'distance_matrix_elements': maps_server.calls['distancematrix_elements'] - maps_before['distancematrix_elements'],
+            'optimize_tours': route_server.calls['OptimizeTours'] - route_before['OptimizeTours'],
+            'injected_errors': (maps_server.calls['injected_errors'] - maps_before['injected_errors'] +
+                                route_server.calls['InjectedErrors'] - route_before['InjectedErrors'])
+        },
+        'mean_stage_ms': {stage: round(total / succeeded, 1) for stage, total in stage_totals.items()} if succeeded else {},
+        'stage1_estimate_mean_abs_error_percent': round(sum(estimate_errors) / len(estimate_errors), 1) if estimate_errors else None
+    }
+
+
+def print_report(results, args):
+    print("=" * 96)
+    print(f"BENCHMARK /api/optimize - engine={args.engine}, stage1={args.stage1_mode}, concurrency={args.concurrency}, "
+          f"maps latency={args.maps_latency}s, route latency={args.route_latency}s, error rate={args.error_rate}")
+    print("=" * 96)
+    print(f"{'stops':>6} {'requests':>8} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'req/s':>7} "
+          f"{'geocode':>8} {'matrix':>7} {'elements':>9} {'optimize':>9}")
+    for result in results:
+        calls = result['external_calls']
+        print(f"{result['stops']:>6} {result['requests']:>8} {result['errors']:>6} {result['p50_ms']:>9} "
+              f"{result['p95_ms']:>9} {result['throughput_rps']:>7} {calls['geocoding']:>8} "
+              f"{calls['distance_matrix']:>7} {calls['distance_matrix_elements']:>9} {calls['optimize_tours']:>9}")
+    print()
+    for result in results:
+        stages = ', '.join(f"{stage}={ms}" for stage, ms in sorted(result['mean_stage_ms'].items()))
+        print(f"  {result['stops']:>4} stops, mean stage ms: {stages}")
+        if result['stage1_estimate_mean_abs_error_percent'] is not None:
+            print(f"  {result['stops']:>4} stops, stage 1 estimate mean absolute error: {result['stage1_estimate_mean_abs_error_percent']}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline /api/optimize benchmark against local Google API fakes')
+    parser.add_argument('--stops', default='5,10,25,50,100,250,500', help='Comma-separated instance sizes (addresses per route)')
+    parser.add_argument('--requests', type=int, default=10, help='Requests per instance size')
+    parser.add_argument('--concurrency', type=int, default=1, help='Concurrent requests')
+    parser.add_argument('--distinct-instances', type=int, default=0, help='Distinct instances per size (default: one per request)')
+    parser.add_argument('--clusters', type=int, default=6, help='Towns the stops are clustered around')
+    parser.add_argument('--priority-fraction', type=float, default=0.0, help='Fraction of stops with a priority')
+    parser.add_argument('--time-window-fraction', type=float, default=0.0, help='Fraction of stops with a soft time window')
+    parser.add_argument('--engine', default='remote', choices=['remote', 'local', 'auto'])
+    parser.add_argument('--matrix-source', default='haversine', choices=['haversine', 'distance_matrix'],
+                        help='Travel matrix source of the local engine')
+    parser.add_argument('--stage1-mode', default='solve', choices=['solve', 'estimate'],
+                        help='Stage 1 of the priority path: full solve or local duration estimate')
+    parser.add_argument('--maps-latency', type=float, default=0.0, help='Seconds added to each Geocoding/Distance Matrix call')
+    parser.add_argument('--route-latency', type=float, default=0.0, help='Seconds added to each OptimizeTours call')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of fake API calls that fail')
+    parser.add_argument('--warm-caches', action='store_true', help='Keep geocode, travel time and response caches enabled')
+    parser.add_argument('--calibrate', action='store_true', help='Calibrate local travel times from the fake route responses')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    maps_server = FakeMapsServer(latency_seconds=args.maps_latency, error_rate=args.error_rate, seed=args.seed).start()
+    route_server = FakeRouteOptimizationServer(latency_seconds=args.route_latency, error_rate=args.error_rate, seed=args.seed).start()
+    try:
+        configure_environment(args, maps_server, route_server)
+        import main as app_module
+        logging.getLogger('main').setLevel(logging.WARNING)
+
+        results = []
+        for stops in [int(value) for value in args.stops.split(',')]:
+            results.append(run_size(app_module.app, stops, args, maps_server, route_server))
+            print(f"Finished {stops} stops", file=sys.stderr)
+
+        print_report(results, args)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'arguments': vars(args), 'results': results}, f, indent=2)
+    finally:
+        maps_server.stop()
+        route_server.stop()
+
+
+if __name__ == '__main__':
+    main()
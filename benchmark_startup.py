@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark for main.py
+
+Every run starts a fresh Python process (like a new App Engine instance or gunicorn
+worker), imports main and sends the first /health and /api/optimize requests
+against the local Google API fakes. Reports the import time, the first request
+latencies and which heavy modules (OR-Tools, NumPy, Route Optimization client)
+were loaded at each point.
+
+Scenarios:
+    cold        WARMUP_ON_START=false, the first requests pay for everything they need
+    warmup      WARMUP_ON_START=false, GET /_ah/warmup before the first requests
+    background  WARMUP_ON_START=true, requests arrive while the warm-up thread runs
+
+Usage:
+    python benchmark_startup.py
+    python benchmark_startup.py --runs 10 --engines remote,local --stops 25
+    python benchmark_startup.py --scenarios cold,warmup --json startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from fake_maps_server import FakeMapsServer
+from fake_route_optimization_server import FakeRouteOptimizationServer
+from synthetic_instances import generate_instance
+
+HEAVY_MODULES = ['ortools.constraint_solver.pywrapcp', 'numpy', 'google.maps.routeoptimization_v1', 'prometheus_client']
+SCENARIOS = ['cold', 'warmup', 'background']
+RESULT_PREFIX = 'STARTUP_RESULT '
+
+# Runs in the child process; timings are taken around the first use of each endpoint
+PROBE = r'''
+import contextlib, io, json, logging, sys, time
+
+HEAVY_MODULES = json.loads(sys.argv[1])
+payload = json.loads(sys.argv[2])
+send_warmup_request = sys.argv[3] == 'true'
+
+def loaded():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+result = {}
+started_at = time.perf_counter()
+import main
+result['import_ms'] = (time.perf_counter() - started_at) * 1000
+result['loaded_after_import'] = loaded()
+logging.getLogger('main').setLevel(logging.WARNING)
+client = main.app.test_client()
+
+if send_warmup_request:
+    started_at = time.perf_counter()
+    client.get('/_ah/warmup')
+    result['warmup_request_ms'] = (time.perf_counter() - started_at) * 1000
+
+started_at = time.perf_counter()
+client.get('/health')
+result['first_health_ms'] = (time.perf_counter() - started_at) * 1000
+
+started_at = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    response = client.post('/api/optimize', json=payload)
+result['first_optimize_ms'] = (time.perf_counter() - started_at) * 1000
+result['first_optimize_status'] = response.status_code
+
+started_at = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    client.post('/api/optimize', json=payload)
+result['second_optimize_ms'] = (time.perf_counter() - started_at) * 1000
+result['loaded_after_requests'] = loaded()
+print(RESULT_PREFIX + json.dumps(result))
+'''.replace('RESULT_PREFIX', repr(RESULT_PREFIX))
+
+
+def run_probe(scenario, engine, payload, maps_server, route_server):
+    """Start a fresh interpreter for one cold start and return its measurements."""
+    env = dict(os.environ)
+    env.update({
+        'GOOGLE_MAPS_BASE_URL': maps_server.base_url,
+        'ROUTE_OPTIMIZATION_ENDPOINT': route_server.endpoint,
+        'GOOGLE_MAPS_API_KEY': 'benchmark',
+        'GOOGLE_CLOUD_PROJECT_ID': 'benchmark',
+        'DEFAULT_OPTIMIZATION_ENGINE': engine,
+        'WARMUP_ON_START': 'true' if scenario == 'background' else 'false',
+        'GEOCODE_CACHE_PATH': '',
+        'TRAVEL_TIME_CACHE_PATH': '',
+        'JOB_STORE_PATH': '',
+        'ROUTE_STORE_PATH': '',
+        'CALIBRATION_STORE_PATH': '',
+        'ROUTE_RESPONSE_CACHE_MAX_ENTRIES': '0',
+        'LOCAL_SOLVER_TIME_LIMIT_SECONDS': '1',
+    })
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    completed = subprocess.run(
+        [sys.executable, '-c', PROBE, json.dumps(HEAVY_MODULES), json.dumps(payload),
+         'true' if scenario == 'warmup' else 'false'],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=300
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError(f"Startup probe failed ({scenario}, {engine}): {completed.stderr[-2000:]}")
+
+
+def summarize(scenario, engine, runs):
+    """Median of each timing over the runs of one scenario."""
+    summary = {'scenario': scenario, 'engine': engine, 'runs': len(runs)}
+    for key in ['import_ms', 'warmup_request_ms', 'first_health_ms', 'first_optimize_ms', 'second_optimize_ms']:
+        values = [run[key] for run in runs if key in run]
+        if values:
+            summary[key] = round(statistics.median(values), 1)
+    summary['errors'] = sum(1 for run in runs if run['first_optimize_status'] != 200)
+    summary['loaded_after_import'] = runs[-1]['loaded_after_import']
+    summary['loaded_after_requests'] = runs[-1]['loaded_after_requests']
+    return summary
+
+
+def print_report(results):
+    print("=" * 100)
+    print("COLD START BENCHMARK (median per scenario, fresh process per run)")
+    print("=" * 100)
+    print(f"{'scenario':<11} {'engine':<7} {'import ms':>9} {'warmup ms':>9} {'health ms':>9} "
+          f"{'1st opt ms':>10} {'2nd opt ms':>10} {'errors':>6}")
+    for result in results:
+        print(f"{result['scenario']:<11} {result['engine']:<7} {result['import_ms']:>9} "
+              f"{result.get('warmup_request_ms', '-'):>9} {result['first_health_ms']:>9} "
+              f"{result['first_optimize_ms']:>10} {result['second_optimize_ms']:>10} {result['errors']:>6}")
+    print()
+    for result in results:
+        print(f"  {result['scenario']}/{result['engine']}: loaded after import {result['loaded_after_import'] or 'none'}, "
+              f"after requests {result['loaded_after_requests'] or 'none'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold start benchmark for main.py against local Google API fakes')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh processes per scenario and engine')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f'Comma-separated scenarios ({", ".join(SCENARIOS)})')
+    parser.add_argument('--engines', default='remote,local', help='Comma-separated DEFAULT_OPTIMIZATION_ENGINE values')
+    parser.add_argument('--stops', type=int, default=10, help='Addresses in the optimized route')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    payload, geocodes = generate_instance(args.stops, seed=args.seed)
+    maps_server = FakeMapsServer(geocodes=geocodes).start()
+    route_server = FakeRouteOptimizationServer().start()
+    try:
+        results = []
+        for engine in args.engines.split(','):
+            for scenario in args.scenarios.split(','):
+                if scenario not in SCENARIOS:
+                    parser.error(f"Unknown scenario {scenario}")
+                runs = [run_probe(scenario, engine, payload, maps_server, route_server) for _ in range(args.runs)]
+                results.append(summarize(scenario, engine, runs))
+                print(f"Finished {scenario}/{engine}", file=sys.stderr)
+
+        print_report(results)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'arguments': vars(args), 'results': results}, f, indent=2)
+    finally:
+        maps_server.stop()
+        route_server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Local fake of the Google Maps Geocoding and Distance Matrix web services for
+tests and benchmarks.
+
+Addresses are geocoded from an optional fixture ({address: [lat, lng]}) or, for
+unknown addresses, placed deterministically around Nuremberg from a hash of the
+address. Distance Matrix elements are straight-line distances times a road
+circuity factor at a fixed speed. Latency and error rates are configurable.
+
+Usage:
+    python fake_maps_server.py --port 8090 --latency 0.05
+
+    GOOGLE_MAPS_BASE_URL=http://127.0.0.1:8090 GOOGLE_MAPS_API_KEY=fake python main.py
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_CENTER = (49.4521, 11.0767)  # Nuremberg
+DEFAULT_RADIUS_KM = 60.0
+CIRCUITY_FACTOR = 1.3
+FAKE_SPEED_KMH = 50.0
+
+
+def fake_coordinates(address, center=DEFAULT_CENTER, radius_km=DEFAULT_RADIUS_KM):
+    """Deterministic pseudo-random coordinates for an address."""
+    digest = hashlib.sha256(address.strip().lower().encode('utf-8')).digest()
+    angle = int.from_bytes(digest[:4], 'big') / 2 ** 32 * 2 * math.pi
+    distance_km = math.sqrt(int.from_bytes(digest[4:8], 'big') / 2 ** 32) * radius_km
+    lat = center[0] + distance_km / 111.32 * math.sin(angle)
+    lng = center[1] + distance_km / (111.32 * math.cos(math.radians(center[0]))) * math.cos(angle)
+    return round(lat, 6), round(lng, 6)
+
+
+def _distance_meters(a, b):
+    lat1, lng1, lat2, lng2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371008.8 * math.asin(math.sqrt(h))
+
+
+class FakeMapsServer:
+    """
+    In-process fake Maps web service server (Geocoding + Distance Matrix).
+
+    Args:
+        port: Port to listen on (0 picks a free port, see .base_url)
+        latency_seconds: Artificial delay added to every request
+        error_rate: Fraction of requests answered with HTTP 500
+        over_query_limit_rate: Fraction of Distance Matrix requests answered with OVER_QUERY_LIMIT
+        geocodes: Optional fixture {address: (lat, lng)}; other addresses get hashed coordinates
+        seed: Seed for error injection
+    """
+
+    def __init__(self, port=0, latency_seconds=0.0, error_rate=0.0, over_query_limit_rate=0.0, geocodes=None, seed=0):
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.over_query_limit_rate = over_query_limit_rate
+        self.geocodes = {address: tuple(location) for address, location in (geocodes or {}).items()}
+        self.calls = {'geocode': 0, 'distancematrix': 0, 'distancematrix_elements': 0, 'injected_errors': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-maps', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_geocodes(self, geocodes):
+        """Register fixture coordinates {address: (lat, lng)}."""
+        with self._lock:
+            self.geocodes.update({address: tuple(location) for address, location in geocodes.items()})
+
+    def _count(self, name, count=1):
+        with self._lock:
+            self.calls[name] += count
+
+    def _chance(self, rate):
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    def _location(self, value):
+        parts = value.split(',')
+        if len(parts) == 2:
+            try:
+                return float(parts[0]), float(parts[1])
+            except ValueError:
+                pass
+        return self.geocodes.get(value) or fake_coordinates(value)
+
+    def geocode(self, params):
+        self._count('geocode')
+        address = params.get('address', '')
+        if not address:
+            return {'status': 'INVALID_REQUEST', 'results': []}
+        lat, lng = self._location(address)
+        return {
+            'status': 'OK',
+            'results': [{'formatted_address': address, 'geometry': {'location': {'lat': lat, 'lng': lng}}}]
+        }
+
+    def distance_matrix(self, params):
+        self._count('distancematrix')
+        if self._chance(self.over_query_limit_rate):
+            return {'status': 'OVER_QUERY_LIMIT', 'rows': []}
+        origins = [self._location(value) for value in params.get('origins', '').split('|') if value]
+        destinations = [self._location(value) for value in params.get('destinations', '').split('|') if value]
+        self._count('distancematrix_elements', len(origins) * len(destinations))
+        rows = []
+        for origin in origins:
+            elements = []
+            for destination in destinations:
+                meters = int(_distance_meters(origin, destination) * CIRCUITY_FACTOR)
+                elements.append({
+                    'status': 'OK',
+                    'distance': {'value': meters},
+                    'duration': {'value': int(meters / (FAKE_SPEED_KMH / 3.6))}
+                })
+            rows.append({'elements': elements})
+        return {'status': 'OK', 'rows': rows}
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if fake.latency_seconds:
+                    time.sleep(fake.latency_seconds)
+
+                if fake._chance(fake.error_rate):
+                    fake._count('injected_errors')
+                    self._send(500, {'error_message': 'Injected error'})
+                elif url.path == '/maps/api/geocode/json':
+                    self._send(200, fake.geocode(params))
+                elif url.path == '/maps/api/distancematrix/json':
+                    self._send(200, fake.distance_matrix(params))
+                else:
+                    self._send(404, {'error_message': f'Unknown path {url.path}'})
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake Google Maps Geocoding/Distance Matrix server')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    parser.add_argument('--geocodes', help='JSON fixture {address: [lat, lng]}')
+    args = parser.parse_args()
+
+    geocodes = None
+    if args.geocodes:
+        with open(args.geocodes, 'r', encoding='utf-8') as f:
+            geocodes = json.load(f)
+
+    server = FakeMapsServer(args.port, args.latency, args.error_rate, geocodes=geocodes).start()
+    print(f"Fake Maps server listening on {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
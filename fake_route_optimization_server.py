@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Local fake of the Google Route Optimization gRPC service for tests and benchmarks.
+
+Serves OptimizeTours, BatchOptimizeTours and the google.longrunning GetOperation
+call on an insecure port. Routes are built greedily (nearest neighbour from the
+vehicle start) with straight-line travel at a fixed speed, which is enough to
+exercise the request/response mapping in main.py without Google Cloud access.
+
+Batch input and output URIs are treated as local file paths, matching
+ROUTE_BATCH_STORAGE_URI set to a local directory.
+
+Usage:
+    python fake_route_optimization_server.py --port 50051
+
+    ROUTE_OPTIMIZATION_ENDPOINT=localhost:50051 \\
+    ROUTE_BATCH_STORAGE_URI=/tmp/route-batches python main.py
+"""
+
+import argparse
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent import futures
+from datetime import timedelta
+
+import grpc
+from google.longrunning import operations_pb2
+from google.maps import routeoptimization_v1 as ro
+from google.protobuf import any_pb2
+
+SERVICE_NAME = 'google.maps.routeoptimization.v1.RouteOptimization'
+OPERATIONS_SERVICE_NAME = 'google.longrunning.Operations'
+FAKE_SPEED_KMH = 40.0
+
+
+def _distance_meters(a, b):
+    lat1, lng1, lat2, lng2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return int(2 * 6371008.8 * math.asin(math.sqrt(h)))
+
+
+def _point(location):
+    return location.latitude, location.longitude
+
+
+def solve_optimize_tours(request):
+    """Build a greedy single-vehicle OptimizeToursResponse for an OptimizeToursRequest."""
+    model = request.model
+    vehicle = model.vehicles[0]
+    speed = FAKE_SPEED_KMH / 3.6
+
+    # Plain tuples: proto-plus attribute access is too slow for large instances
+    pickups = [shipment.pickups[0] for shipment in model.shipments]
+    points = [_point(pickup.arrival_location) for pickup in pickups]
+    remaining = list(range(len(pickups)))
+    position = _point(vehicle.start_location)
+    current_time = model.global_start_time
+    visits = []
+    transitions = []
+    total_distance = 0
+
+    while remaining:
+        shipment_index = min(remaining, key=lambda i: _distance_meters(position, points[i]))
+        remaining.remove(shipment_index)
+        pickup = pickups[shipment_index]
+        distance = _distance_meters(position, points[shipment_index])
+        travel = timedelta(seconds=int(distance / speed))
+        transitions.append(ro.ShipmentRoute.Transition(
+            travel_duration=travel, travel_distance_meters=distance, start_time=current_time
+        ))
+        current_time = current_time + travel
+        visits.append(ro.ShipmentRoute.Visit(shipment_index=shipment_index, start_time=current_time))
+        current_time = current_time + pickup.duration
+        position = points[shipment_index]
+        total_distance += distance
+
+    distance = _distance_meters(position, _point(vehicle.end_location))
+    travel = timedelta(seconds=int(distance / speed))
+    transitions.append(ro.ShipmentRoute.Transition(
+        travel_duration=travel, travel_distance_meters=distance, start_time=current_time
+    ))
+    current_time = current_time + travel
+    total_distance += distance
+
+    route = ro.ShipmentRoute(
+        vehicle_start_time=model.global_start_time,
+        vehicle_end_time=current_time,
+        visits=visits,
+        transitions=transitions,
+        metrics=ro.AggregatedMetrics(
+            total_duration=current_time - model.global_start_time,
+            travel_distance_meters=total_distance
+        )
+    )
+    return ro.OptimizeToursResponse(routes=[route])
+
+
+class FakeRouteOptimizationServer:
+    """
+    In-process fake Route Optimization server.
+
+    Args:
+        port: Port to listen on (0 picks a free port, see .endpoint)
+        operation_polls: GetOperation calls answered with done=False before a batch operation completes
+        latency_seconds: Artificial delay added to every OptimizeTours call
+        error_rate: Fraction of OptimizeTours calls answered with UNAVAILABLE
+        seed: Seed for error injection
+    """
+
+    def __init__(self, port=0, operation_polls=1, latency_seconds=0.0, error_rate=0.0, seed=0):
+        self.operation_polls = operation_polls
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.calls = {'OptimizeTours': 0, 'BatchOptimizeTours': 0, 'GetOperation': 0, 'InjectedErrors': 0}
+        self._operations = {}
+        self._lock = threading.Lock()
+        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=16))
+        self._server.add_generic_rpc_handlers((
+            grpc.method_handlers_generic_handler(SERVICE_NAME, {
+                'OptimizeTours': grpc.unary_unary_rpc_method_handler(
+                    self._optimize_tours,
+                    request_deserializer=ro.OptimizeToursRequest.deserialize,
+                    response_serializer=ro.OptimizeToursResponse.serialize
+                ),
+                'BatchOptimizeTours': grpc.unary_unary_rpc_method_handler(
+                    self._batch_optimize_tours,
+                    request_deserializer=ro.BatchOptimizeToursRequest.deserialize,
+                    response_serializer=operations_pb2.Operation.SerializeToString
+                ),
+            }),
+            grpc.method_handlers_generic_handler(OPERATIONS_SERVICE_NAME, {
+                'GetOperation': grpc.unary_unary_rpc_method_handler(
+                    self._get_operation,
+                    request_deserializer=operations_pb2.GetOperationRequest.FromString,
+                    response_serializer=operations_pb2.Operation.SerializeToString
+                ),
+            }),
+        ))
+        self.port = self._server.add_insecure_port(f'127.0.0.1:{port}')
+        self.endpoint = f'127.0.0.1:{self.port}'
+
+    def start(self):
+        self._server.start()
+        return self
+
+    def stop(self):
+        self._server.stop(grace=None)
+
+    def _count(self, method):
+        with self._lock:
+            self.calls[method] += 1
+
+    def _optimize_tours(self, request, context):
+        self._count('OptimizeTours')
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with self._lock:
+            inject_error = self._random.random() < self.error_rate
+        if inject_error:
+            self._count('InjectedErrors')
+            context.abort(grpc.StatusCode.UNAVAILABLE, 'Injected error')
+        return solve_optimize_tours(request)
+
+    def _batch_optimize_tours(self, request, context):
+        self._count('BatchOptimizeTours')
+        # Solve every model up front; the operation is reported done after operation_polls polls
+        for config in request.model_configs:
+            with open(config.input_config.gcs_source.uri, 'r', encoding='utf-8') as f:
+                optimize_request = ro.OptimizeToursRequest.from_json(f.read(), ignore_unknown_fields=True)
+            response = solve_optimize_tours(optimize_request)
+            output_path = config.output_config.gcs_destination.uri
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(ro.OptimizeToursResponse.to_json(response))
+
+        name = f'{request.parent}/operations/{uuid.uuid4().hex}'
+        with self._lock:
+            self._operations[name] = self.operation_polls
+        return self._operation(name, done=self.operation_polls <= 0)
+
+    def _get_operation(self, request, context):
+        self._count('GetOperation')
+        with self._lock:
+            if request.name not in self._operations:
+                context.abort(grpc.StatusCode.NOT_FOUND, f'Operation {request.name} not found')
+            self._operations[request.name] -= 1
+            done = self._operations[request.name] < 0
+        return self._operation(request.name, done=done)
+
+    def _operation(self, name, done):
+        metadata = any_pb2.Any()
+        metadata.Pack(ro.BatchOptimizeToursMetadata.pb(ro.BatchOptimizeToursMetadata()))
+        operation = operations_pb2.Operation(name=name, done=done, metadata=metadata)
+        if done:
+            operation.response.Pack(ro.BatchOptimizeToursResponse.pb(ro.BatchOptimizeToursResponse()))
+        return operation
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake Google Route Optimization gRPC server')
+    parser.add_argument('--port', type=int, default=50051)
+    parser.add_argument('--operation-polls', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every OptimizeTours call')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of OptimizeTours calls that fail')
+    args = parser.parse_args()
+
+    server = FakeRouteOptimizationServer(args.port, args.operation_polls, args.latency, args.error_rate).start()
+    print(f"Fake Route Optimization server listening on {server.endpoint}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -1,14 +1,24 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, flash, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, send_file, flash, jsonify
 import requests
+import contextlib
+import contextvars
+import functools
+import hashlib
+import importlib
 import json
 import os
 import logging
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 import pytz
-from ortools.constraint_solver import routing_enums_pb2, pywrapcp
-from google.maps import routeoptimization_v1 as ro
-from google.auth import default
-from google.oauth2 import service_account
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev')
@@ -25,17 +35,511 @@ logger = logging.getLogger(__name__)
 
 GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY')
 GOOGLE_CLOUD_PROJECT_ID = os.environ.get('GOOGLE_CLOUD_PROJECT_ID')
+GOOGLE_MAPS_BASE_URL = os.environ.get('GOOGLE_MAPS_BASE_URL', 'https://maps.googleapis.com')  # Overridden by the offline benchmark fakes
 
-# Initialize Route Optimization client
+# Persistent geocoding cache (SQLite). Set GEOCODE_CACHE_PATH to an empty string to disable.
+# /tmp is the only writable location on App Engine and survives gunicorn worker restarts.
+GEOCODE_CACHE_PATH = os.environ.get('GEOCODE_CACHE_PATH', '/tmp/geocode_cache.sqlite3')
+GEOCODE_CACHE_TTL_DAYS = int(os.environ.get('GEOCODE_CACHE_TTL_DAYS', 30))
+GEOCODE_CACHE_MAX_ENTRIES = int(os.environ.get('GEOCODE_CACHE_MAX_ENTRIES', 20000))
+
+# Persistent pairwise Distance Matrix cache (SQLite). Set TRAVEL_TIME_CACHE_PATH to an empty string to disable.
+TRAVEL_TIME_CACHE_PATH = os.environ.get('TRAVEL_TIME_CACHE_PATH', '/tmp/travel_time_cache.sqlite3')
+TRAVEL_TIME_CACHE_TTL_DAYS = int(os.environ.get('TRAVEL_TIME_CACHE_TTL_DAYS', 30))
+TRAVEL_TIME_CACHE_MAX_ENTRIES = int(os.environ.get('TRAVEL_TIME_CACHE_MAX_ENTRIES', 2000000))
+
+# Travel time calibration (SQLite): road legs observed in optimize_tours responses calibrate the circuity
+# and speed of the local haversine estimates per region. Set CALIBRATION_STORE_PATH to an empty string to disable.
+CALIBRATION_STORE_PATH = os.environ.get('CALIBRATION_STORE_PATH', '/tmp/travel_calibration.sqlite3')
+CALIBRATION_MAX_LEGS = int(os.environ.get('CALIBRATION_MAX_LEGS', 500000))
+CALIBRATION_REGION_DEGREES = float(os.environ.get('CALIBRATION_REGION_DEGREES', 0.25))  # ~28 km grid cells
+CALIBRATION_MIN_LEGS = int(os.environ.get('CALIBRATION_MIN_LEGS', 30))
+
+# In-memory cache of optimize_tours responses keyed on the request model. Set max entries to 0 to disable.
+ROUTE_RESPONSE_CACHE_TTL_SECONDS = int(os.environ.get('ROUTE_RESPONSE_CACHE_TTL_SECONDS', 900))
+ROUTE_RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('ROUTE_RESPONSE_CACHE_MAX_ENTRIES', 256))
+
+# Background optimization jobs. The SQLite job table is shared by all gunicorn workers of an instance.
+JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH', '/tmp/optimization_jobs.sqlite3')
+JOB_MAX_WORKERS = int(os.environ.get('JOB_MAX_WORKERS', 2))
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 20))
+JOB_RESULT_TTL_SECONDS = int(os.environ.get('JOB_RESULT_TTL_SECONDS', 3600))
+
+# Optimized routes by route id (empty path disables it). Payloads and results are stored zlib-compressed.
+ROUTE_STORE_PATH = os.environ.get('ROUTE_STORE_PATH', '/tmp/routes.sqlite3')
+ROUTE_STORE_TTL_DAYS = int(os.environ.get('ROUTE_STORE_TTL_DAYS', 90))
+
+# Mid-route replans: late cost per hour of stops whose hard time window has already closed
+REPLAN_CLOSED_WINDOW_COST_PER_HOUR = float(os.environ.get('REPLAN_CLOSED_WINDOW_COST_PER_HOUR', 1000))
+
+# Batch optimization (/api/optimize/batch)
+BATCH_ENGINES = ['inline', 'batch_operation']
+BATCH_MAX_ROUTES = int(os.environ.get('BATCH_MAX_ROUTES', 100))
+BATCH_MAX_PARALLEL = int(os.environ.get('BATCH_MAX_PARALLEL', 4))
+
+# BatchOptimizeTours long-running operations (/api/optimize/batch with "engine": "batch_operation")
+ROUTE_BATCH_STORAGE_URI = os.environ.get('ROUTE_BATCH_STORAGE_URI')  # gs://bucket/prefix (a local directory for fakes)
+ROUTE_BATCH_POLL_SECONDS = float(os.environ.get('ROUTE_BATCH_POLL_SECONDS', 5))
+ROUTE_BATCH_TIMEOUT_SECONDS = float(os.environ.get('ROUTE_BATCH_TIMEOUT_SECONDS', 1800))
+# Batch operations poll for up to ROUTE_BATCH_TIMEOUT_SECONDS on their own executor, never on the job executor
+ROUTE_BATCH_MAX_WORKERS = int(os.environ.get('ROUTE_BATCH_MAX_WORKERS', 4))
+
+# Bulk geocoding worker pool and shared HTTP connection pool for Google Maps web services
+GEOCODING_MAX_WORKERS = int(os.environ.get('GEOCODING_MAX_WORKERS', 8))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 16))
+
+# Distance Matrix batch fetching: parallel batches, client-side rate limits and OVER_QUERY_LIMIT retries
+DISTANCE_MATRIX_MAX_WORKERS = int(os.environ.get('DISTANCE_MATRIX_MAX_WORKERS', 4))
+DISTANCE_MATRIX_MAX_QPS = float(os.environ.get('DISTANCE_MATRIX_MAX_QPS', 10))
+DISTANCE_MATRIX_MAX_ELEMENTS_PER_SECOND = float(os.environ.get('DISTANCE_MATRIX_MAX_ELEMENTS_PER_SECOND', 1000))
+DISTANCE_MATRIX_MAX_RETRIES = int(os.environ.get('DISTANCE_MATRIX_MAX_RETRIES', 3))
+
+# Distance Matrix API per-request limits used by the tile planner
+DISTANCE_MATRIX_MAX_ORIGINS = 25
+DISTANCE_MATRIX_MAX_DESTINATIONS = 25
+DISTANCE_MATRIX_MAX_ELEMENTS = 100
+DISTANCE_MATRIX_MAX_PATTERN_GROUPS = 64
+
+# Pooled HTTP session so repeated Maps API calls reuse TLS connections
+http_session = requests.Session()
+http_session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE))
+http_session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE))  # Local fakes
+
+
+class RateLimiter:
+    """Thread-safe token bucket limiting an amount per second (requests, elements, ...)."""
+
+    def __init__(self, rate_per_second, capacity=None):
+        self.rate = rate_per_second
+        self.capacity = capacity or rate_per_second
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """Block until `amount` tokens are available and consume them."""
+        if self.rate <= 0:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait_seconds = (amount - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+distance_matrix_request_limiter = RateLimiter(DISTANCE_MATRIX_MAX_QPS)
+distance_matrix_element_limiter = RateLimiter(DISTANCE_MATRIX_MAX_ELEMENTS_PER_SECOND)
+
+# Route Optimization client configuration
 SERVICE_ACCOUNT_FILE = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
-if SERVICE_ACCOUNT_FILE:
-    credentials = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE)
-else:
+ROUTE_CLIENT_POOL_SIZE = int(os.environ.get('ROUTE_CLIENT_POOL_SIZE', 2))
+GRPC_KEEPALIVE_SECONDS = int(os.environ.get('GRPC_KEEPALIVE_SECONDS', 60))
+# Optional host:port of a local (insecure) Route Optimization gRPC server, e.g. a fake used in tests
+ROUTE_OPTIMIZATION_ENDPOINT = os.environ.get('ROUTE_OPTIMIZATION_ENDPOINT')
+ROUTE_OPTIMIZATION_TIMEOUT_SECONDS = float(os.environ.get('ROUTE_OPTIMIZATION_TIMEOUT_SECONDS', 50))
+
+# Optimization engines: 'remote' (Route Optimization API), 'local' (OR-Tools) or 'auto' (remote, local fallback)
+OPTIMIZATION_ENGINES = ['remote', 'local', 'auto']
+DEFAULT_OPTIMIZATION_ENGINE = os.environ.get('DEFAULT_OPTIMIZATION_ENGINE', 'remote')
+AUTO_ENGINE_REMOTE_TIMEOUT_SECONDS = float(os.environ.get('AUTO_ENGINE_REMOTE_TIMEOUT_SECONDS', 15))
+LOCAL_SOLVER_TIME_LIMIT_SECONDS = float(os.environ.get('LOCAL_SOLVER_TIME_LIMIT_SECONDS', 2))
+# Guided local search runs until its time limit, which scales with the route size. Routes of up to
+# LOCAL_SOLVER_GLS_MIN_ADDRESSES addresses stop at the first local optimum (optimal in practice, a few ms).
+LOCAL_SOLVER_SECONDS_PER_ADDRESS = float(os.environ.get('LOCAL_SOLVER_SECONDS_PER_ADDRESS', 0.02))
+LOCAL_SOLVER_GLS_MIN_ADDRESSES = int(os.environ.get('LOCAL_SOLVER_GLS_MIN_ADDRESSES', 12))
+
+# Stage 1 of two_stage_optimization (priority addresses): 'solve' optimizes the route without priorities
+# to learn its duration, 'estimate' estimates the duration locally so only stage 2 calls the engine
+STAGE1_MODES = ['solve', 'estimate']
+DEFAULT_STAGE1_MODE = os.environ.get('DEFAULT_STAGE1_MODE', 'solve')
+STAGE1_ESTIMATE_TIME_LIMIT_SECONDS = float(os.environ.get('STAGE1_ESTIMATE_TIME_LIMIT_SECONDS', 0.2))
+
+# Start-up warm-up: load the heavy client/solver modules and connect the gRPC channels in a background
+# thread after import instead of on the first request. Defaults to on when running on App Engine.
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', 'true' if os.environ.get('GAE_ENV') else 'false').lower() in ('1', 'true', 'yes')
+WARMUP_TIMEOUT_SECONDS = float(os.environ.get('WARMUP_TIMEOUT_SECONDS', 10))
+
+# Travel matrix for the local engine: 'haversine' (free estimate) or 'distance_matrix' (Distance Matrix API)
+LOCAL_MATRIX_SOURCE = os.environ.get('LOCAL_MATRIX_SOURCE', 'haversine')
+LOCAL_ROAD_CIRCUITY_FACTOR = float(os.environ.get('LOCAL_ROAD_CIRCUITY_FACTOR', 1.3))
+LOCAL_SPEED_PROFILE = os.environ.get('LOCAL_SPEED_PROFILE', 'mixed')
+
+# Speed profiles as (leg distance band upper bound in km, average speed in km/h).
+# Short legs are driven at urban speeds, the remainder of longer legs at faster road speeds.
+SPEED_PROFILES_KMH = {
+    'urban': [(2, 20), (10, 30), (float('inf'), 50)],
+    'mixed': [(2, 25), (10, 45), (50, 70), (float('inf'), 90)],
+    'rural': [(2, 35), (10, 60), (float('inf'), 85)],
+}
+EARTH_RADIUS_METERS = 6371008.8
+
+
+
+class PerformanceTracker:
+    """
+    Per-request stage timings, external call counts and cache hits.
+    
+    Stage times are wall-clock times on a monotonic clock: a stage that runs several
+    times in sequence (e.g. both solves of a two-stage optimization) reports its sum,
+    while runs that overlap in worker threads (e.g. concurrent geocoding calls) count
+    only once. Safe to update from worker threads started with contextvars.copy_context().
+    """
+    
+    def __init__(self):
+        self._started_at = time.perf_counter()
+        self._lock = threading.Lock()
+        self._active = {}  # Stage name -> [running count, start of the current busy period]
+        self.stages = OrderedDict()
+        self.external_calls = {}
+        self.cache = {}
+    
+    @contextlib.contextmanager
+    def stage(self, name):
+        with self._lock:
+            active = self._active.setdefault(name, [0, 0.0])
+            if active[0] == 0:
+                active[1] = time.perf_counter()
+                self.stages.setdefault(name, 0.0)
+            active[0] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                active[0] -= 1
+                if active[0] == 0:
+                    self.stages[name] += time.perf_counter() - active[1]
+    
+    def count_call(self, service, count=1):
+        with self._lock:
+            self.external_calls[service] = self.external_calls.get(service, 0) + count
+    
+    def count_cache(self, name, count=1):
+        with self._lock:
+            self.cache[name] = self.cache.get(name, 0) + count
+    
+    def as_dict(self):
+        with self._lock:
+            return {
+                'total_ms': round((time.perf_counter() - self._started_at) * 1000, 1),
+                'stages_ms': {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+                'external_calls': dict(self.external_calls),
+                'cache': dict(self.cache)
+            }
+    
+    def server_timing(self):
+        """Value for the Server-Timing response header."""
+        with self._lock:
+            metrics = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        metrics.append(f"total;dur={(time.perf_counter() - self._started_at) * 1000:.1f}")
+        return ', '.join(metrics)
+
+
+_current_performance = contextvars.ContextVar('performance', default=None)
+
+# Prometheus metrics (/metrics). Per worker process unless PROMETHEUS_MULTIPROC_DIR is set,
+# in which case the files in that directory are aggregated across gunicorn workers.
+PROMETHEUS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+
+@functools.lru_cache(maxsize=None)
+def _prometheus():
+    """prometheus_client, imported on first use (the first request or the warm-up)."""
+    import prometheus_client
+    return prometheus_client
+
+
+class LazyMetric:
+    """Prometheus metric that is registered on first use, so prometheus_client stays out of the import path."""
+
+    instances = []
+
+    def __init__(self, kind, *args, **kwargs):
+        self._kind = kind
+        self._args = args
+        self._kwargs = kwargs
+        self._metric = None
+        self._lock = threading.Lock()
+        LazyMetric.instances.append(self)
+
+    def metric(self):
+        if self._metric is None:
+            with self._lock:
+                if self._metric is None:
+                    self._metric = getattr(_prometheus(), self._kind)(*self._args, **self._kwargs)
+        return self._metric
+
+    def labels(self, *labelvalues):
+        return self.metric().labels(*labelvalues)
+
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+REQUEST_LATENCY = LazyMetric('Histogram',
+    'route_api_request_duration_seconds', 'HTTP request latency',
+    ['endpoint', 'method', 'engine', 'status'], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_PROGRESS = LazyMetric('Gauge',
+    'route_api_requests_in_progress', 'HTTP requests currently being served',
+    ['endpoint'], multiprocess_mode='livesum'
+)
+EXTERNAL_CALL_LATENCY = LazyMetric('Histogram',
+    'route_api_external_call_duration_seconds', 'Latency of Geocoding, Distance Matrix and Route Optimization calls',
+    ['service'], buckets=LATENCY_BUCKETS
+)
+EXTERNAL_CALL_ERRORS = LazyMetric('Counter',
+    'route_api_external_call_errors_total', 'External API calls that raised an error', ['service']
+)
+CACHE_REQUESTS = LazyMetric('Counter',
+    'route_api_cache_requests_total', 'Cache lookups by cache and result (hit/miss)', ['cache', 'result']
+)
+ROUTE_STOPS = LazyMetric('Histogram',
+    'route_api_route_stops', 'Number of addresses per optimized route',
+    ['engine'], buckets=(2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)
+)
+DURATION_ESTIMATE_ERROR = LazyMetric('Histogram',
+    'route_api_duration_estimate_error_ratio', 'Relative error of local route duration estimates ((estimate - actual) / actual)',
+    ['engine'], buckets=(-0.5, -0.25, -0.1, -0.05, 0, 0.05, 0.1, 0.25, 0.5, 1)
+)
+
+
+def performance_stage(name):
+    """Time a stage of the current request (no-op outside a tracked request)."""
+    tracker = _current_performance.get()
+    return tracker.stage(name) if tracker else contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def track_external_call(service):
+    """Count and time a call to an external API for the current request and for /metrics."""
+    tracker = _current_performance.get()
+    if tracker:
+        tracker.count_call(service)
+    started_at = time.perf_counter()
+    try:
+        with tracker.stage(f'{service}_api') if tracker else contextlib.nullcontext():
+            yield
+    except Exception:
+        EXTERNAL_CALL_ERRORS.labels(service).inc()
+        raise
+    finally:
+        EXTERNAL_CALL_LATENCY.labels(service).observe(time.perf_counter() - started_at)
+
+
+def count_cache(cache, result, count=1):
+    """Record cache hits/misses ('hit' or 'miss') for the current request and for /metrics."""
+    if count <= 0:
+        return
+    CACHE_REQUESTS.labels(cache, result).inc(count)
+    tracker = _current_performance.get()
+    if tracker:
+        tracker.count_cache(f'{cache}_{result}', count)
+
+
+def submit_with_context(executor, fn, *args):
+    """executor.submit() that keeps the caller's context (e.g. the performance tracker) in the worker."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _load_credentials():
+    """Load Google credentials from the service account file or the environment defaults."""
+    import google.auth
+    from google.oauth2 import service_account
+    
+    if SERVICE_ACCOUNT_FILE:
+        return service_account.Credentials.from_service_account_file(
+            SERVICE_ACCOUNT_FILE, scopes=['https://www.googleapis.com/auth/cloud-platform']
+        )
     # Use default credentials (for Google Cloud environments like App Engine)
-    credentials, project = default()
+    credentials, project = google.auth.default()
+    return credentials
+
+
+class RouteClientPool:
+    """
+    Thread-safe pool of Route Optimization clients, created lazily once per worker process.
+
+    Credentials are discovered once and shared by all channels; google-auth refreshes
+    the access token from the gRPC auth plugin before it expires. Channels are
+    configured with keepalive pings so idle connections stay warm between requests.
+    A custom client_factory or a local endpoint can be injected for tests.
+    """
+
+    def __init__(self, size=ROUTE_CLIENT_POOL_SIZE, endpoint=ROUTE_OPTIMIZATION_ENDPOINT, client_factory=None):
+        self.size = max(1, size)
+        self.endpoint = endpoint
+        self._client_factory = client_factory
+        self._lock = threading.Lock()
+        self._clients = []
+        self._channels = []
+        self._credentials = None
+        self._next = 0
+        self._pid = None
+
+    def _channel_options(self):
+        return [
+            ('grpc.keepalive_time_ms', GRPC_KEEPALIVE_SECONDS * 1000),
+            ('grpc.keepalive_timeout_ms', 20000),
+            ('grpc.keepalive_permit_without_calls', 1),
+            ('grpc.http2.max_pings_without_data', 0),
+        ]
+
+    def _create_client(self):
+        if self._client_factory:
+            return self._client_factory(), None
+        
+        import grpc
+        from google.maps import routeoptimization_v1 as ro
+        from google.maps.routeoptimization_v1.services.route_optimization.transports import RouteOptimizationGrpcTransport
+        
+        if self.endpoint:
+            channel = grpc.insecure_channel(self.endpoint, options=self._channel_options())
+        else:
+            if self._credentials is None:
+                self._credentials = _load_credentials()
+            channel = RouteOptimizationGrpcTransport.create_channel(
+                f"{RouteOptimizationGrpcTransport.DEFAULT_HOST}:443",
+                credentials=self._credentials,
+                options=self._channel_options()
+            )
+        transport = RouteOptimizationGrpcTransport(channel=channel)
+        return ro.RouteOptimizationClient(transport=transport), channel
+
+    def _ensure_clients(self):
+        # gRPC channels must not be shared across fork(); rebuild the pool in a new worker process
+        if self._pid != os.getpid():
+            self._clients = []
+            self._channels = []
+            self._pid = os.getpid()
+        while len(self._clients) < self.size:
+            client, channel = self._create_client()
+            self._clients.append(client)
+            self._channels.append(channel)
+            logger.info(f"Created Route Optimization client {len(self._clients)}/{self.size}")
+
+    def get(self):
+        """Return the next client from the pool (round robin)."""
+        with self._lock:
+            self._ensure_clients()
+            client = self._clients[self._next % len(self._clients)]
+            self._next += 1
+            return client
+
+    def warm_up(self, timeout=10):
+        """Create all clients and wait until their channels are connected."""
+        import grpc
+        
+        with self._lock:
+            self._ensure_clients()
+            channels = [channel for channel in self._channels if channel is not None]
+        for channel in channels:
+            try:
+                grpc.channel_ready_future(channel).result(timeout=timeout)
+            except grpc.FutureTimeoutError:
+                logger.warning(f"Route Optimization channel not ready after {timeout}s")
+
+
+route_client_pool = RouteClientPool()
+
+
+def get_route_client():
+    """Return a shared Route Optimization client for this worker process."""
+    return route_client_pool.get()
+
+
+def set_route_client_pool(pool):
+    """Replace the process-wide client pool (used by tests to inject fakes)."""
+    global route_client_pool
+    route_client_pool = pool
+
+
+_warm_up_lock = threading.Lock()
+_warm_up_state = {'pid': None, 'status': 'not_started', 'duration_ms': None, 'steps': []}
+
+
+def warm_up(timeout=WARMUP_TIMEOUT_SECONDS):
+    """
+    Load the heavy modules and connect the Route Optimization clients once per worker process.
+    
+    Only what DEFAULT_OPTIMIZATION_ENGINE can use is loaded: the Route Optimization client library
+    and channels for 'remote'/'auto', OR-Tools and NumPy for 'local'/'auto'. A remote-only
+    deployment never pays for OR-Tools. Concurrent callers wait for the first run; later calls
+    return immediately.
+    
+    Returns:
+        Dictionary with the warm-up status, duration and completed steps
+    """
+    with _warm_up_lock:
+        if _warm_up_state['pid'] == os.getpid() and _warm_up_state['status'] != 'not_started':
+            return dict(_warm_up_state)
+        _warm_up_state.update({'pid': os.getpid(), 'status': 'running', 'duration_ms': None, 'steps': []})
+        
+        started_at = time.perf_counter()
+        steps = _warm_up_state['steps']
+        try:
+            uses_remote = DEFAULT_OPTIMIZATION_ENGINE in ('remote', 'auto')
+            modules = ['prometheus_client']
+            if uses_remote:
+                modules.append('google.maps.routeoptimization_v1')
+            if DEFAULT_OPTIMIZATION_ENGINE in ('local', 'auto'):
+                modules += ['numpy', 'ortools.constraint_solver.pywrapcp']
+            for module_name in modules:
+                importlib.import_module(module_name)
+                steps.append(module_name)
+            
+            if uses_remote and (GOOGLE_CLOUD_PROJECT_ID or ROUTE_OPTIMIZATION_ENDPOINT):
+                route_client_pool.warm_up(timeout=timeout)
+                steps.append('route_optimization_channels')
+            
+            _warm_up_state['status'] = 'done'
+        except Exception as e:
+            # Not fatal: whatever is missing is loaded lazily by the first request that needs it
+            logger.warning(f"Warm-up failed after {steps}: {str(e)}")
+            _warm_up_state['status'] = 'failed'
+        
+        _warm_up_state['duration_ms'] = round((time.perf_counter() - started_at) * 1000, 1)
+        logger.info(f"Warm-up {_warm_up_state['status']} in {_warm_up_state['duration_ms']} ms: {steps}")
+        return dict(_warm_up_state)
+
+
+def start_background_warm_up():
+    """Run warm_up() in a daemon thread so start-up and early requests are not blocked."""
+    thread = threading.Thread(target=warm_up, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def warm_up_status():
+    """Warm-up state of the current worker process (for /health)."""
+    if _warm_up_state['pid'] != os.getpid():
+        return {'status': 'not_started'}
+    return {
+        'status': _warm_up_state['status'],
+        'duration_ms': _warm_up_state['duration_ms'],
+        'steps': list(_warm_up_state['steps'])
+    }
+
+
+@app.route('/_ah/warmup', methods=['GET'])
+def app_engine_warmup():
+    """App Engine warm-up request: traffic is routed to the instance after this returns."""
+    state = warm_up()
+    return jsonify({'success': state['status'] == 'done', 'warm_up': warm_up_status()}), 200
+
+
+@app.route('/_ah/start', methods=['GET'])
+def app_engine_start():
+    """Start request sent to basic/manual scaling instances; warms up without blocking it."""
+    start_background_warm_up()
+    return jsonify({'success': True}), 200
 
-# Initialize the Route Optimization client
-route_client = ro.RouteOptimizationClient(credentials=credentials)
 
 # Health check endpoint for monitoring
 @app.route('/health', methods=['GET'])
@@ -48,9 +552,72 @@ def health_check():
         'google_api_configured': bool(GOOGLE_MAPS_API_KEY),
         'route_optimization_configured': bool(GOOGLE_CLOUD_PROJECT_ID),
         'api_type': 'Route Optimization API with Geocoding',
-        'geocoding_enabled': True
+        'geocoding_enabled': True,
+        'geocode_cache': geocode_cache.stats() if geocode_cache else {'enabled': False},
+        'travel_time_cache': travel_time_cache.stats() if travel_time_cache else {'enabled': False},
+        'route_response_cache': route_response_cache.stats() if route_response_cache else {'enabled': False},
+        'travel_calibration': travel_calibration.stats() if travel_calibration else {'enabled': False},
+        'route_store': route_store.stats() if route_store else {'enabled': False},
+        'warm_up': warm_up_status()
     }), 200
 
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics in text exposition format"""
+    prometheus_client = _prometheus()
+    for lazy_metric in LazyMetric.instances:
+        lazy_metric.metric()  # Metrics not used yet are listed as well
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return Response(prometheus_client.generate_latest(registry), content_type=prometheus_client.CONTENT_TYPE_LATEST)
+
+
+def _metrics_endpoint():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def _metrics_engine():
+    """Optimization engine of an /api/optimize* request, as a bounded label value."""
+    if request.method != 'POST' or not request.path.startswith('/api/optimize') or not request.is_json:
+        return 'none'
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return 'none'
+    if request.path == '/api/optimize/batch':
+        engine = data.get('engine', 'inline')
+        return engine if engine in BATCH_ENGINES else 'invalid'
+    engine = data.get('engine', DEFAULT_OPTIMIZATION_ENGINE)
+    return engine if engine in OPTIMIZATION_ENGINES else 'invalid'
+
+
+@app.before_request
+def _start_request_metrics():
+    if request.path == '/metrics':
+        return
+    request.environ['route_api.started_at'] = time.perf_counter()
+    REQUESTS_IN_PROGRESS.labels(_metrics_endpoint()).inc()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    started_at = request.environ.get('route_api.started_at')
+    if started_at is not None:
+        REQUEST_LATENCY.labels(_metrics_endpoint(), request.method, _metrics_engine(), str(response.status_code)).observe(
+            time.perf_counter() - started_at
+        )
+    return response
+
+
+@app.teardown_request
+def _finish_request_metrics(exception=None):
+    if request.environ.pop('route_api.started_at', None) is not None:
+        REQUESTS_IN_PROGRESS.labels(_metrics_endpoint()).dec()
+
 # Главная страница с формой загрузки
 @app.route('/', methods=['GET'])
 def index():
@@ -93,6 +660,16 @@ def optimize():
     if not addresses or not isinstance(addresses, list) or len(addresses) < 2:
         flash('Invalid format. "addresses" must be a list of at least 2 addresses (start and end points).')
         return redirect(url_for('index'))
+    
+    try:
+        addresses, known_coordinates = parse_address_entries(data)
+    except ValueError as e:
+        flash(f'Invalid format. {e}')
+        return redirect(url_for('index'))
+    
+    if data.get('engine', DEFAULT_OPTIMIZATION_ENGINE) not in OPTIMIZATION_ENGINES:
+        flash(f'Invalid engine "{data.get("engine")}". Valid values: {OPTIMIZATION_ENGINES}')
+        return redirect(url_for('index'))
 
     if not GOOGLE_MAPS_API_KEY:
         flash('Google Maps API key is not set.')
@@ -105,6 +682,7 @@ def optimize():
         start_time_config = data.get('start_time', None)
         objective_config = data.get('objective', None)
         service_time_config = data.get('service_time_minutes', 3)
+        engine_config = data.get('engine', DEFAULT_OPTIMIZATION_ENGINE)
         route_name = data.get('route_name', 'Optimized Route')
         
         logger.info(f"Route optimization request: {len(addresses)} addresses, "
@@ -119,7 +697,9 @@ def optimize():
             priority_addresses_config, 
             start_time_config, 
             objective_config, 
-            service_time_config
+            service_time_config,
+            engine=engine_config,
+            known_coordinates=known_coordinates
         )
         
         if not route_info:
@@ -131,6 +711,10 @@ def optimize():
         route_info['input_method'] = 'Manual Form' if manual_data else 'JSON File'
         route_info['priority_addresses_config'] = priority_addresses_config or []
         route_info['service_time_config'] = service_time_config
+        route_info.pop('response_cache', None)
+        route_id = store_route(data, route_info)
+        if route_id:
+            route_info['route_id'] = route_id
             
         return render_template('result.html', route=route_info)
         
@@ -157,6 +741,8 @@ def api_optimize():
     
     Returns JSON with optimized route
     """
+    performance = PerformanceTracker()
+    performance_token = _current_performance.set(performance)
     try:
         # Check if request contains JSON data
         if not request.is_json:
@@ -165,99 +751,17 @@ def api_optimize():
                 'success': False
             }), 400
         
-        data = request.get_json()
-        
-        # Validate input data
-        if not data or 'addresses' not in data:
-            return jsonify({
-                'error': 'Missing "addresses" field in JSON',
-                'success': False
-            }), 400
-        
-        addresses = data['addresses']
-        
-        # Validate addresses
-        if not isinstance(addresses, list):
-            return jsonify({
-                'error': 'Addresses must be a list',
-                'success': False
-            }), 400
-        
-        if len(addresses) < 2:
-            return jsonify({
-                'error': 'At least 2 addresses are required (start and end points)',
-                'success': False
-            }), 400
-        
-        
-        # Check if Google Maps API key is set
-        if not GOOGLE_MAPS_API_KEY:
+        with performance.stage('validation'):
+            data = request.get_json()
+            validation_error = validate_optimize_payload(data)
+        if validation_error:
+            error_message, status_code = validation_error
             return jsonify({
-                'error': 'Google Maps API key is not configured',
+                'error': error_message,
                 'success': False
-            }), 500
-        
-        # Extract optional time windows configuration
-        time_windows_config = data.get('time_windows', None)
+            }), status_code
         
-        # Extract optional priority addresses configuration
-        priority_addresses_config = data.get('priority_addresses', None)
-        
-        # Validate priority addresses configuration if provided
-        if priority_addresses_config:
-            valid_priority_levels = ['critical_high', 'high', 'medium', 'low', 'critical_low']
-            valid_time_windows = ['earliest', 'early', 'middle', 'late', 'latest']
-            
-            for priority_config in priority_addresses_config:
-                priority_level = priority_config.get('priority_level', 'medium')
-                preferred_time_window = priority_config.get('preferred_time_window', 'early')
-                
-                if priority_level not in valid_priority_levels:
-                    return jsonify({
-                        'error': f'Invalid priority_level "{priority_level}". Valid values: {valid_priority_levels}',
-                        'success': False
-                    }), 400
-                
-                if preferred_time_window not in valid_time_windows:
-                    return jsonify({
-                        'error': f'Invalid preferred_time_window "{preferred_time_window}". Valid values: {valid_time_windows}',
-                        'success': False
-                    }), 400
-        
-        # Extract optional start time configuration
-        start_time_config = data.get('start_time', None)
-        
-        # Extract optional optimization objective configuration
-        objective_config = data.get('objective', None)
-        
-        # Extract optional service time configuration
-        service_time_config = data.get('service_time_minutes', 3)  # Default 3 minutes
-        
-        # Perform route optimization
-        logger.info(f"API request received - optimizing route for {len(addresses)} addresses")
-        logger.info(f"Addresses: {addresses[:3]}{'...' if len(addresses) > 3 else ''}")  # Log first 3 addresses
-        
-        if time_windows_config:
-            logger.info(f"Time windows configuration provided: {len(time_windows_config)} entries")
-        
-        if priority_addresses_config:
-            logger.info(f"Priority addresses configuration provided: {len(priority_addresses_config)} entries")
-        
-        if start_time_config:
-            logger.info(f"Custom start time provided: {start_time_config}")
-        
-        if objective_config:
-            logger.info(f"Optimization objective provided: {objective_config}")
-        
-        # Choose optimization strategy based on priority addresses
-        if priority_addresses_config:
-            # Use two-stage optimization for priority addresses
-            logger.info("Using two-stage optimization due to priority addresses")
-            route_info = two_stage_optimization(addresses, priority_addresses_config, start_time_config, objective_config, service_time_config)
-        else:
-            # Use single-stage optimization for regular requests
-            logger.info("Using single-stage optimization (no priority addresses)")
-            route_info = optimize_route_with_api(addresses, time_windows_config, priority_addresses_config, start_time_config, objective_config, service_time_config)
+        route_info = run_optimization(data)
         
         if not route_info:
             return jsonify({
@@ -267,6 +771,11 @@ def api_optimize():
         
         # Prepare enhanced response with timing details
         response_data = route_info  # Use the complete response from optimize_route_with_api
+        response_cache_status = response_data.pop('response_cache', 'BYPASS')
+        
+        route_id = store_route(data, route_info)
+        if route_id:
+            response_data['route_id'] = route_id
         
         logger.info(f"API response - optimization successful with timing details")
         if 'timing_info' in route_info:
@@ -274,7 +783,14 @@ def api_optimize():
             logger.info(f"Vehicle ends at: {route_info['timing_info']['vehicle_end_time']}")
             logger.info(f"Total time: {route_info['timing_info']['total_duration_minutes']} minutes")
         
-        return jsonify(response_data), 200
+        response_data['performance'] = performance.as_dict()
+        # Serialization ends after the performance block is built, so it is only reported in Server-Timing
+        with performance.stage('serialization'):
+            response = jsonify(response_data)
+        response.headers['X-Route-Cache'] = response_cache_status
+        response.headers['Server-Timing'] = performance.server_timing()
+        logger.info(f"API optimization timing: {response.headers['Server-Timing']}")
+        return response, 200
         
     except Exception as e:
         import traceback
@@ -285,414 +801,3400 @@ def api_optimize():
             'error': f'Internal server error: {str(e)}',
             'success': False
         }), 500
+    finally:
+        _current_performance.reset(performance_token)
 
-def create_distance_matrix(addresses):
-    """
-    Create distance matrix using Google Maps Distance Matrix API with batching support.
-    For large number of addresses, splits requests into smaller batches to avoid API limits.
+
+def validate_optimize_payload(data):
     """
-    num_addresses = len(addresses)
+    Validate a route optimization payload (the /api/optimize request schema).
     
-    # Initialize matrices
-    matrix = [[0] * num_addresses for _ in range(num_addresses)]
-    time_matrix = [[0] * num_addresses for _ in range(num_addresses)]
-    
-    # Maximum addresses per batch (10x10 = 100 elements, which is the API limit)
-    MAX_BATCH_SIZE = 10
+    Returns:
+        None if the payload is valid, otherwise a tuple (error_message, http_status_code)
+    """
+    # Validate input data
+    if not data or not isinstance(data, dict) or 'addresses' not in data:
+        return 'Missing "addresses" field in JSON', 400
     
-    if num_addresses <= MAX_BATCH_SIZE:
-        # Single request for small number of addresses
-        print(f"DEBUG: Single request for {num_addresses} addresses")
-        return _create_distance_matrix_single(addresses)
-    else:
-        # Multiple requests for large number of addresses
-        print(f"DEBUG: Batching {num_addresses} addresses into multiple requests")
-        
-        # Create batches
-        batches = []
-        for i in range(0, num_addresses, MAX_BATCH_SIZE):
-            batch = addresses[i:i + MAX_BATCH_SIZE]
-            batches.append(batch)
-        
-        print(f"DEBUG: Created {len(batches)} batches")
-        
-        # Process each batch combination
-        for i, origins_batch in enumerate(batches):
-            for j, destinations_batch in enumerate(batches):
-                print(f"DEBUG: Processing batch {i}->{j}")
-                
-                # Get distance matrix for this batch combination
-                batch_matrix, batch_time_matrix = _create_distance_matrix_batch(origins_batch, destinations_batch)
-                
-                # Insert batch results into main matrix
-                origins_start = i * MAX_BATCH_SIZE
-                origins_end = min(origins_start + len(origins_batch), num_addresses)
-                destinations_start = j * MAX_BATCH_SIZE
-                destinations_end = min(destinations_start + len(destinations_batch), num_addresses)
-                
-                for oi, origin_idx in enumerate(range(origins_start, origins_end)):
-                    for di, dest_idx in enumerate(range(destinations_start, destinations_end)):
-                        if oi < len(batch_matrix) and di < len(batch_matrix[0]):
-                            matrix[origin_idx][dest_idx] = batch_matrix[oi][di]
-                            time_matrix[origin_idx][dest_idx] = batch_time_matrix[oi][di]
-        
-        print(f"DEBUG: Completed batching for {num_addresses} addresses")
-        return matrix, time_matrix
-
-def _create_distance_matrix_single(addresses):
-    """Single Distance Matrix API request for small number of addresses"""
-    return _create_distance_matrix_batch(addresses, addresses)
-
-def _create_distance_matrix_batch(origins, destinations):
-    """Make a single Distance Matrix API request for a batch of origins and destinations"""
-    url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-    params = {
-        'origins': '|'.join(origins),
-        'destinations': '|'.join(destinations),
-        'mode': 'driving',
-        'language': 'en',
-        'avoid': 'tolls',
-        'key': GOOGLE_MAPS_API_KEY
-    }
+    addresses = data['addresses']
     
-    print(f"DEBUG: Distance Matrix API request - {len(origins)} origins, {len(destinations)} destinations")
-    response = requests.get(url, params=params)
-    print(f"DEBUG: Distance Matrix API response status: {response.status_code}")
+    # Validate addresses
+    if not isinstance(addresses, list):
+        return 'Addresses must be a list', 400
     
-    if response.status_code != 200:
-        raise Exception(f"Google API Error (Distance Matrix): Status {response.status_code}, Response: {response.text}")
+    if len(addresses) < 2:
+        return 'At least 2 addresses are required (start and end points)', 400
     
+    # Validate address objects / parallel coordinates (pre-geocoded entries)
     try:
-        result = response.json()
-    except ValueError:  # json.JSONDecodeError is a subclass of ValueError
-        raise Exception(f"Failed to decode JSON from Google API (Distance Matrix). Response: {response.text}")
+        parse_address_entries(data)
+    except ValueError as e:
+        return str(e), 400
     
-    if result['status'] != 'OK':
-        if result['status'] == 'MAX_ELEMENTS_EXCEEDED':
-            raise Exception(f"Too many addresses in batch! Origins: {len(origins)}, Destinations: {len(destinations)}, Elements: {len(origins)*len(destinations)}")
-        else:
-            raise Exception(f"Google API returned error status: {result['status']}")
+    # Check if Google Maps API key is set
+    if not GOOGLE_MAPS_API_KEY:
+        return 'Google Maps API key is not configured', 500
     
-    if 'rows' not in result:
-        raise Exception("API response does not contain 'rows' field")
+    # Validate priority addresses configuration if provided
+    priority_addresses_config = data.get('priority_addresses', None)
+    if priority_addresses_config:
+        valid_priority_levels = ['critical_high', 'high', 'medium', 'low', 'critical_low']
+        valid_time_windows = ['earliest', 'early', 'middle', 'late', 'latest']
+        
+        for priority_config in priority_addresses_config:
+            priority_level = priority_config.get('priority_level', 'medium')
+            preferred_time_window = priority_config.get('preferred_time_window', 'early')
+            
+            if priority_level not in valid_priority_levels:
+                return f'Invalid priority_level "{priority_level}". Valid values: {valid_priority_levels}', 400
+            
+            if preferred_time_window not in valid_time_windows:
+                return f'Invalid preferred_time_window "{preferred_time_window}". Valid values: {valid_time_windows}', 400
     
-    # Initialize matrices for this batch
-    batch_matrix = [[0] * len(destinations) for _ in range(len(origins))]
-    batch_time_matrix = [[0] * len(destinations) for _ in range(len(origins))]
+    # Validate optional optimization engine
+    engine_config = data.get('engine', DEFAULT_OPTIMIZATION_ENGINE)
+    if engine_config not in OPTIMIZATION_ENGINES:
+        return f'Invalid engine "{engine_config}". Valid values: {OPTIMIZATION_ENGINES}', 400
     
-    # Parse the Distance Matrix API response
-    for i, row in enumerate(result['rows']):
-        for j, element in enumerate(row['elements']):
-            if element['status'] != 'OK':
-                print(f"Warning: Route not available from {i} to {j}")
-                # Use a large value to indicate unavailable route
-                batch_matrix[i][j] = 999999
-                batch_time_matrix[i][j] = 999999
-                continue
-                
-            duration_val = element['duration']['value']  # in seconds
-            distance_val = element['distance']['value']  # in meters
-            
-            # Use duration for optimization (can be changed to distance if needed)
-            batch_matrix[i][j] = duration_val
-            batch_time_matrix[i][j] = duration_val
+    stage1_mode_config = data.get('stage1_mode', DEFAULT_STAGE1_MODE)
+    if stage1_mode_config not in STAGE1_MODES:
+        return f'Invalid stage1_mode "{stage1_mode_config}". Valid values: {STAGE1_MODES}', 400
     
-    return batch_matrix, batch_time_matrix
+    return None
 
-def solve_tsp(matrix):
-    num_locations = len(matrix)
-    manager = pywrapcp.RoutingIndexManager(num_locations, 1, 0)
-    routing = pywrapcp.RoutingModel(manager)
 
-    def distance_callback(from_index, to_index):
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return matrix[from_node][to_node]
+def _parse_coordinate(value, label):
+    """Return (lat, lng) for [lat, lng] or {"latitude", "longitude"}; raise ValueError if invalid."""
+    if isinstance(value, dict):
+        value = (value.get('latitude'), value.get('longitude'))
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError(f'{label} must be [latitude, longitude] or {{"latitude": ..., "longitude": ...}}')
+    lat, lng = value
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (lat, lng)):
+        raise ValueError(f'{label} latitude and longitude must be numbers')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(f'{label} is out of range (latitude -90..90, longitude -180..180)')
+    return float(lat), float(lng)
 
-    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
-    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+
+def parse_address_entries(data):
+    """
+    Split the addresses of a payload into address strings and pre-geocoded coordinates.
     
-    # Enhanced search parameters for better optimization
-    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-    search_parameters.first_solution_strategy = (
-        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-    )
-    # Add local search metaheuristic for better solutions
-    search_parameters.local_search_metaheuristic = (
-        routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
-    )
-    # Set time limit for optimization (30 seconds)
-    search_parameters.time_limit.seconds = 30
+    Entries of "addresses" are address strings or objects {"address", "latitude", "longitude"}
+    (without coordinates the address is geocoded; without an address "lat,lng" is used as its
+    label). A parallel "coordinates" list with [lat, lng], {"latitude", "longitude"} or null
+    per address is accepted as well. Entries with coordinates skip geocoding entirely.
     
-    solution = routing.SolveWithParameters(search_parameters)
+    Args:
+        data: /api/optimize payload
     
-    if solution:
-        index = routing.Start(0)
-        optimized_indices = []
-        route_distance = 0
+    Returns:
+        Tuple (addresses, coordinates) of the address strings and a dict {address: (lat, lng)}
+        for the pre-geocoded entries
+    
+    Raises:
+        ValueError with a client-facing message if an entry is malformed
+    """
+    entries = data['addresses']
+    coordinates_list = data.get('coordinates')
+    if coordinates_list is not None and (not isinstance(coordinates_list, list) or len(coordinates_list) != len(entries)):
+        raise ValueError('"coordinates" must be a list with one entry (or null) per address')
+    
+    addresses = []
+    coordinates = {}
+    for index, entry in enumerate(entries):
+        location = None
+        if isinstance(entry, dict):
+            if entry.get('latitude') is not None or entry.get('longitude') is not None:
+                location = _parse_coordinate(entry, f'Address {index}')
+            address = entry.get('address')
+            if address is None and location:
+                address = f"{location[0]},{location[1]}"
+        else:
+            address = entry
+        if not isinstance(address, str) or not address.strip():
+            raise ValueError(f'Address {index} must be a non-empty string or an object with "address" and/or "latitude"/"longitude"')
         
-        while not routing.IsEnd(index):
-            optimized_indices.append(manager.IndexToNode(index))
-            previous_index = index
+        if coordinates_list is not None and coordinates_list[index] is not None:
+            location = _parse_coordinate(coordinates_list[index], f'coordinates[{index}]')
+        
+        if location:
+            # Identical address strings share one location (e.g. start == end)
+            if coordinates.get(address, location) != location:
+                raise ValueError(f'Address {index} "{address}" is given with two different coordinates')
+            coordinates[address] = location
+        addresses.append(address)
+    
+    return addresses, coordinates
+
+
+def run_optimization(data, known_coordinates=None):
+    """
+    Run single- or two-stage optimization for a validated /api/optimize payload.
+    
+    Args:
+        data: Validated request payload
+        known_coordinates: Optional dict {address: (lat, lng)} of already geocoded addresses
+    
+    Returns:
+        Route result dictionary, or None if no route could be found
+    """
+    addresses, provided_coordinates = parse_address_entries(data)
+    if provided_coordinates:
+        # Coordinates sent with the route win over geocoded ones
+        known_coordinates = {**(known_coordinates or {}), **provided_coordinates}
+        logger.info(f"{len(provided_coordinates)} pre-geocoded addresses provided, geocoding skipped for them")
+    
+    # Extract optional configuration
+    time_windows_config = data.get('time_windows', None)
+    priority_addresses_config = data.get('priority_addresses', None)
+    start_time_config = data.get('start_time', None)
+    objective_config = data.get('objective', None)
+    service_time_config = data.get('service_time_minutes', 3)  # Default 3 minutes
+    engine_config = data.get('engine', DEFAULT_OPTIMIZATION_ENGINE)
+    stage1_mode_config = data.get('stage1_mode', DEFAULT_STAGE1_MODE)
+    
+    # Perform route optimization
+    logger.info(f"API request received - optimizing route for {len(addresses)} addresses")
+    logger.info(f"Addresses: {addresses[:3]}{'...' if len(addresses) > 3 else ''}")  # Log first 3 addresses
+    
+    if time_windows_config:
+        logger.info(f"Time windows configuration provided: {len(time_windows_config)} entries")
+    
+    if priority_addresses_config:
+        logger.info(f"Priority addresses configuration provided: {len(priority_addresses_config)} entries")
+    
+    if start_time_config:
+        logger.info(f"Custom start time provided: {start_time_config}")
+    
+    if objective_config:
+        logger.info(f"Optimization objective provided: {objective_config}")
+    
+    logger.info(f"Optimization engine: {engine_config}")
+    ROUTE_STOPS.labels(engine_config).observe(len(addresses))
+    
+    # Choose optimization strategy based on priority addresses
+    if priority_addresses_config:
+        # Use two-stage optimization for priority addresses
+        logger.info("Using two-stage optimization due to priority addresses")
+        return two_stage_optimization(addresses, priority_addresses_config, start_time_config, objective_config, service_time_config, engine=engine_config, known_coordinates=known_coordinates, stage1_mode=stage1_mode_config)
+    
+    # Use single-stage optimization for regular requests
+    logger.info("Using single-stage optimization (no priority addresses)")
+    return optimize_route_with_api(addresses, time_windows_config, priority_addresses_config, start_time_config, objective_config, service_time_config, engine=engine_config, known_coordinates=known_coordinates)
+
+
+@app.route('/api/optimize/jobs', methods=['POST'])
+def api_create_optimization_job():
+    """
+    Submit a route optimization as a background job.
+    Accepts the same JSON payload as /api/optimize and returns a job id immediately (202).
+    """
+    if not request.is_json:
+        return jsonify({
+            'error': 'Content-Type must be application/json',
+            'success': False
+        }), 400
+    
+    data = request.get_json()
+    validation_error = validate_optimize_payload(data)
+    if validation_error:
+        error_message, status_code = validation_error
+        return jsonify({
+            'error': error_message,
+            'success': False
+        }), status_code
+    
+    job_id = submit_optimization_job(run_and_store_optimization, data)
+    if not job_id:
+        return jsonify({
+            'error': f'Too many pending optimization jobs (limit {JOB_MAX_PENDING}), retry later',
+            'success': False
+        }), 429
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('api_get_optimization_job', job_id=job_id)
+    }), 202
+
+
+@app.route('/api/optimize/jobs/<job_id>', methods=['GET'])
+def api_get_optimization_job(job_id):
+    """Return status and, once finished, the result of an optimization job."""
+    job = job_store.get(job_id) if job_store else None
+    if not job:
+        return jsonify({
+            'error': f'Job {job_id} not found or expired',
+            'success': False
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        **job
+    }), 200
+
+
+
+@app.route('/api/routes/<route_id>', methods=['GET'])
+def api_get_route(route_id):
+    """
+    Return a stored route: the route result of /api/optimize (or of the latest stop change
+    or re-optimization) with the request payload, geocodes and request hash it was built from.
+    """
+    stored = route_store.get(route_id) if route_store else None
+    if not stored:
+        return jsonify({
+            'error': f'Route {route_id} not found or expired',
+            'success': False
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        **stored
+    }), 200
+
+
+@app.route('/api/routes/<route_id>/stops', methods=['POST'])
+def api_add_route_stop(route_id):
+    """
+    Add a stop to a stored route without optimizing it from scratch.
+    
+    Reuses the stored geocodes and visiting order (only the new stop is geocoded) and
+    inserts the stop where it adds the least cost. The updated route is returned
+    immediately; with "reoptimize": true a full re-optimization of the updated route is
+    queued as a background job that replaces the stored route when it finishes.
+    
+    Expected JSON format:
+    {
+        "address": "Address" or {"address": "Address", "latitude": 49.1, "longitude": 11.2},
+        "priority_level": "high",              (optional)
+        "preferred_time_window": "early",      (optional)
+        "reoptimize": false                    (optional)
+    }
+    """
+    return _update_route_stops(route_id, insert_route_stop)
+
+
+@app.route('/api/routes/<route_id>/stops', methods=['DELETE'])
+def api_remove_route_stop(route_id):
+    """
+    Remove a stop from a stored route; its neighbours are connected directly.
+    
+    Expected JSON format:
+    {
+        "address": "Address" or "stop_number": 3,  (stop_number as in visit_schedule)
+        "reoptimize": false                        (optional)
+    }
+    """
+    return _update_route_stops(route_id, remove_route_stop)
+
+
+def _update_route_stops(route_id, update):
+    """Apply update(stored_route, request_data) to a stored route, store and return the result."""
+    performance = PerformanceTracker()
+    performance_token = _current_performance.set(performance)
+    try:
+        if not request.is_json:
+            return jsonify({
+                'error': 'Content-Type must be application/json',
+                'success': False
+            }), 400
+        
+        stored = route_store.get(route_id) if route_store else None
+        if not stored:
+            return jsonify({
+                'error': f'Route {route_id} not found',
+                'success': False
+            }), 404
+        
+        data = request.get_json()
+        if not isinstance(data, dict):
+            data = {}
+        try:
+            with performance.stage('incremental_update'):
+                payload, route_info = update(stored, data)
+        except ValueError as e:
+            return jsonify({
+                'error': str(e),
+                'success': False
+            }), 400
+        
+        version = route_store.update(route_id, payload, route_info, expected_version=stored['version'])
+        if version is None:
+            return jsonify({
+                'error': f'Route {route_id} was changed by another request, retry',
+                'success': False
+            }), 409
+        
+        response_data = {**route_info, 'route_id': route_id, 'route_version': version}
+        if data.get('reoptimize'):
+            job_id = submit_optimization_job(reoptimize_stored_route, route_id, version, payload)
+            if job_id:
+                response_data['reoptimization_job'] = {
+                    'job_id': job_id,
+                    'status': 'queued',
+                    'status_url': url_for('api_get_optimization_job', job_id=job_id)
+                }
+            else:
+                logger.warning(f"Re-optimization of route {route_id} not queued, too many pending jobs")
+        
+        response_data['performance'] = performance.as_dict()
+        response = jsonify(response_data)
+        response.headers['Server-Timing'] = performance.server_timing()
+        return response, 200
+    
+    except Exception as e:
+        import traceback
+        logger.error(f"Route stop update failed: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        
+        return jsonify({
+            'error': f'Internal server error: {str(e)}',
+            'success': False
+        }), 500
+    finally:
+        _current_performance.reset(performance_token)
+
+
+def _stored_route_model(stored, addresses, new_coordinates=None):
+    """
+    RouteModel of a stored route with a changed address list.
+    Coordinates come from the stored geocodes (plus new_coordinates), so nothing is geocoded.
+    """
+    payload, result = stored['payload'], stored['result']
+    known_coordinates = {address: tuple(location) for address, location in stored['geocodes'].items()}
+    known_coordinates.update(new_coordinates or {})
+    # Keep the planned start time; without one prepare_route_model would default to 23:00 today
+    start_time_config = payload.get('start_time') or result['timing_info']['vehicle_start_time']
+    return prepare_route_model(
+        addresses, start_time_config, payload.get('objective'), payload.get('service_time_minutes', 3), known_coordinates
+    )
+
+
+def _pregeocoded_payload(payload, route_model):
+    """Copy of a route payload whose addresses are the route model's, as pre-geocoded address objects."""
+    updated = {key: value for key, value in payload.items() if key != 'coordinates'}
+    updated['addresses'] = [
+        {'address': address, 'latitude': lat, 'longitude': lng}
+        for address, (lat, lng) in zip(route_model.addresses, route_model.coordinates)
+    ]
+    return updated
+
+
+def insert_route_stop(stored, data):
+    """
+    Insert a stop into a stored route at the position with the lowest added cost (best
+    insertion), keeping the order of all other stops.
+    
+    Args:
+        stored: Stored route (RouteStore.get)
+        data: Request JSON with "address" and optional "priority_level"/"preferred_time_window"
+    
+    Returns:
+        Tuple (payload, route_info) of the updated route payload and result
+    
+    Raises:
+        ValueError with a client-facing message if the stop is invalid or cannot be geocoded
+    """
+    import numpy as np
+    
+    if 'address' not in data:
+        raise ValueError('Missing "address" field in JSON')
+    (address,), new_coordinates = parse_address_entries({'addresses': [data['address']]})
+    
+    result = stored['result']
+    addresses = list(result['original_addresses'])
+    if address in addresses:
+        raise ValueError(f'"{address}" is already part of this route')
+    
+    if address not in new_coordinates:
+        try:
+            new_coordinates[address] = geocode_addresses([address])[0]
+        except Exception as e:
+            raise ValueError(str(e))
+    
+    # The new stop becomes the last customer; the end point moves one index back
+    new_index = len(addresses) - 1
+    route_model = _stored_route_model(stored, addresses[:-1] + [address, addresses[-1]], new_coordinates)
+    route_indices = [new_index + 1 if index == new_index else index for index in result['route_indices']]
+    
+    travel_matrix, _ = _local_travel_matrices(
+        route_model.coordinates, source='haversine', departure_hour=route_model.start_time.astimezone(pytz.UTC).hour
+    )
+    costs = travel_matrix.cost_matrix(route_model.cost_per_hour, route_model.cost_per_kilometer)
+    previous, following = np.array(route_indices[:-1]), np.array(route_indices[1:])
+    added_costs = costs[previous, new_index] + costs[new_index, following] - costs[previous, following]
+    position = int(np.argmin(added_costs)) + 1
+    before, after = route_indices[position - 1], route_indices[position]
+    added_travel_seconds = int(travel_matrix.durations[before, new_index]) + int(travel_matrix.durations[new_index, after]) - int(travel_matrix.durations[before, after])
+    route_indices.insert(position, new_index)
+    logger.info(f"Inserted stop {address} at position {position} of {len(route_indices)}")
+    
+    payload = _pregeocoded_payload(stored['payload'], route_model)
+    if data.get('priority_level') or data.get('preferred_time_window'):
+        payload['priority_addresses'] = list(payload.get('priority_addresses') or []) + [{
+            'address': address,
+            'priority_level': data.get('priority_level', 'medium'),
+            'preferred_time_window': data.get('preferred_time_window', 'early')
+        }]
+    validation_error = validate_optimize_payload(payload)
+    if validation_error:
+        raise ValueError(validation_error[0])
+    
+    route_info = _build_local_route_result(route_model, route_indices, travel_matrix)
+    route_info['message'] = 'Stop inserted into the stored route by local best insertion; other stops keep their order'
+    route_info['algorithm'] = 'Best insertion (local)'
+    route_info['incremental_update'] = {
+        'operation': 'insert',
+        'address': address,
+        'stop_number': position + 1,
+        'added_travel_minutes': round(added_travel_seconds / 60, 1)
+    }
+    return payload, route_info
+
+
+def remove_route_stop(stored, data):
+    """
+    Remove a stop from a stored route and connect its neighbours (removal repair).
+    
+    Args:
+        stored: Stored route (RouteStore.get)
+        data: Request JSON with "address" or "stop_number" (position in visit_schedule)
+    
+    Returns:
+        Tuple (payload, route_info) of the updated route payload and result
+    
+    Raises:
+        ValueError with a client-facing message if the stop is not a customer stop of the route
+    """
+    result = stored['result']
+    addresses = list(result['original_addresses'])
+    route_indices = list(result['route_indices'])
+    
+    if data.get('stop_number') is not None:
+        stop_number = data['stop_number']
+        if not isinstance(stop_number, int) or not 1 < stop_number < len(route_indices):
+            raise ValueError(f'"stop_number" must be a customer stop between 2 and {len(route_indices) - 1}')
+        removed_index = route_indices[stop_number - 1]
+    elif data.get('address') is not None:
+        matches = [index for index in range(1, len(addresses) - 1) if addresses[index] == data['address']]
+        if not matches:
+            raise ValueError(f'"{data["address"]}" is not a customer stop of this route')
+        removed_index = matches[0]
+    else:
+        raise ValueError('Missing "address" or "stop_number" field in JSON')
+    address = addresses[removed_index]
+    
+    route_model = _stored_route_model(stored, addresses[:removed_index] + addresses[removed_index + 1:])
+    position = route_indices.index(removed_index)
+    route_indices = [index - 1 if index > removed_index else index for index in route_indices if index != removed_index]
+    
+    travel_matrix, _ = _local_travel_matrices(
+        route_model.coordinates, source='haversine', departure_hour=route_model.start_time.astimezone(pytz.UTC).hour
+    )
+    logger.info(f"Removed stop {address} at position {position} of {len(route_indices) + 1}")
+    
+    # Drop the stop's priority and time window, shift time windows of later addresses
+    payload = _pregeocoded_payload(stored['payload'], route_model)
+    if payload.get('priority_addresses') and address not in route_model.addresses:
+        payload['priority_addresses'] = [config for config in payload['priority_addresses'] if config.get('address') != address]
+    if isinstance(payload.get('time_windows'), dict) and payload['time_windows'].get('windows'):
+        windows = []
+        for window in payload['time_windows']['windows']:
+            index = window.get('address_index')
+            if index == removed_index:
+                continue
+            windows.append({**window, 'address_index': index - 1} if isinstance(index, int) and index > removed_index else window)
+        payload['time_windows'] = {**payload['time_windows'], 'windows': windows}
+    
+    route_info = _build_local_route_result(route_model, route_indices, travel_matrix)
+    route_info['message'] = 'Stop removed from the stored route; other stops keep their order'
+    route_info['algorithm'] = 'Removal repair (local)'
+    route_info['incremental_update'] = {
+        'operation': 'remove',
+        'address': address,
+        'stop_number': position + 1
+    }
+    return payload, route_info
+
+
+def reoptimize_stored_route(route_id, version, payload):
+    """
+    Fully re-optimize a stored route (background job after an incremental update).
+    The result replaces the stored route unless the route was changed again in the meantime.
+    """
+    result = run_optimization(payload)
+    if not result:
+        return None
+    result.pop('response_cache', None)
+    new_version = route_store.update(route_id, payload, result, expected_version=version)
+    if new_version is None:
+        logger.info(f"Route {route_id} changed during re-optimization, result not stored")
+    result['route_id'] = route_id
+    result['route_version'] = new_version
+    return result
+
+
+@app.route('/api/routes/<route_id>/replan', methods=['POST'])
+def api_replan_route(route_id):
+    """
+    Re-optimize the remaining stops of a stored route from the vehicle's current position.
+    
+    Only the stops that are not completed yet are optimized, starting at the current
+    location and time, so the optimization request shrinks as the day progresses. Time
+    windows of the remaining stops (explicit and priority windows of the stored plan) are
+    kept at their planned times. The stored route is not changed, so completed stop indices
+    stay valid for the whole day.
+    
+    Expected JSON format:
+    {
+        "latitude": 49.30,
+        "longitude": 11.45,
+        "current_time": "2024-12-21T10:30:00Z",  (optional, default now)
+        "completed_stops": [2, 5]                 (indices into the route's original_addresses)
+    }
+    """
+    performance = PerformanceTracker()
+    performance_token = _current_performance.set(performance)
+    try:
+        if not request.is_json:
+            return jsonify({
+                'error': 'Content-Type must be application/json',
+                'success': False
+            }), 400
+        
+        stored = route_store.get(route_id) if route_store else None
+        if not stored:
+            return jsonify({
+                'error': f'Route {route_id} not found or expired',
+                'success': False
+            }), 404
+        
+        data = request.get_json()
+        try:
+            with performance.stage('validation'):
+                payload, route_address_indices = build_replan_payload(stored, data if isinstance(data, dict) else {})
+        except ValueError as e:
+            return jsonify({
+                'error': str(e),
+                'success': False
+            }), 400
+        
+        route_info = run_optimization(payload)
+        if not route_info:
+            return jsonify({
+                'error': 'Could not find optimal route',
+                'success': False
+            }), 500
+        
+        response_cache_status = route_info.pop('response_cache', 'BYPASS')
+        route_info['route_id'] = route_id
+        route_info['replan'] = {
+            'current_position': payload['addresses'][0],
+            'current_time': payload['start_time'],
+            'completed_stops': sorted(set(data.get('completed_stops') or [])),
+            'remaining_stops': len(payload['addresses']) - 2,
+            # Index of each stop of this plan in the stored route's original_addresses (null = current position)
+            'route_address_indices': [route_address_indices[index] for index in route_info['route_indices']]
+        }
+        route_info['performance'] = performance.as_dict()
+        response = jsonify(route_info)
+        response.headers['X-Route-Cache'] = response_cache_status
+        response.headers['Server-Timing'] = performance.server_timing()
+        return response, 200
+    
+    except Exception as e:
+        import traceback
+        logger.error(f"Route replan failed: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        
+        return jsonify({
+            'error': f'Internal server error: {str(e)}',
+            'success': False
+        }), 500
+    finally:
+        _current_performance.reset(performance_token)
+
+
+def build_replan_payload(stored, data):
+    """
+    Build the /api/optimize payload for the remaining stops of a stored route.
+    
+    The current position becomes the start point (labelled "lat,lng") and the current time
+    the start time; completed stops are left out. Priority windows of the stored plan are
+    converted to time windows at their planned times, and explicit time windows are
+    re-indexed, so the remaining stops keep their windows. Hard windows that have already
+    closed become a soft end at the current time with a late penalty. All addresses are
+    pre-geocoded.
+    
+    Args:
+        stored: Stored route (RouteStore.get)
+        data: Request JSON with latitude, longitude, optional current_time and completed_stops
+    
+    Returns:
+        Tuple (payload, route_address_indices) of the reduced payload and, per address of it,
+        the index in the stored route's original_addresses (None for the current position)
+    
+    Raises:
+        ValueError with a client-facing message if the request is invalid
+    """
+    from dateutil.parser import parse
+    
+    def parse_utc(value):
+        value = parse(value)
+        return value.replace(tzinfo=pytz.UTC) if value.tzinfo is None else value.astimezone(pytz.UTC)
+    
+    payload, result = stored['payload'], stored['result']
+    addresses = list(result['original_addresses'])
+    end_index = len(addresses) - 1
+    
+    current_position = _parse_coordinate((data.get('latitude'), data.get('longitude')), 'Current position')
+    try:
+        current_time = parse_utc(data['current_time']) if data.get('current_time') else datetime.now(pytz.UTC)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('"current_time" must be an ISO timestamp like "2024-12-21T10:30:00Z"')
+    
+    completed_stops = data.get('completed_stops') or []
+    if not isinstance(completed_stops, list) or not all(
+            isinstance(index, int) and not isinstance(index, bool) and 0 < index < end_index for index in completed_stops):
+        raise ValueError(f'"completed_stops" must be a list of customer stop indices between 1 and {end_index - 1}')
+    
+    completed = set(completed_stops)
+    remaining = [index for index in range(1, end_index) if index not in completed]
+    route_address_indices = [None] + remaining + [end_index]
+    reduced_index = {index: position for position, index in enumerate(route_address_indices) if index is not None}
+    
+    # Windows as planned: explicit windows plus the priority windows of the stored plan
+    time_windows_config = payload.get('time_windows') or {}
+    windows = list(time_windows_config.get('windows') or []) if time_windows_config.get('enabled') else []
+    if payload.get('priority_addresses'):
+        plan_start = parse_utc(result['timing_info']['vehicle_start_time'])
+        plan_end = parse_utc(result['timing_info']['vehicle_end_time'])
+        if result.get('stage1_duration'):
+            # Two-stage plans placed priority windows relative to the stage 1 duration
+            plan_end = plan_start + timedelta(minutes=result['stage1_duration'])
+        priority_windows = create_priority_time_windows(addresses, payload['priority_addresses'], plan_start, plan_end)
+        windows.extend(priority_windows['windows'] if priority_windows else [])
+    remaining_windows = []
+    for window in windows:
+        if window.get('address_index') not in reduced_index or not 0 < window['address_index'] < end_index:
+            continue
+        window = {**window, 'address_index': reduced_index[window['address_index']]}
+        # Window times already passed are moved to the current time (the new route start)
+        now = current_time.replace(microsecond=0).isoformat().replace('+00:00', 'Z')
+        for key in ('soft_start_time', 'hard_start_time', 'soft_end_time'):
+            if window.get(key) and parse_utc(window[key]) < current_time:
+                window[key] = now
+        if window.get('hard_end_time') and parse_utc(window['hard_end_time']) < current_time:
+            # A closed hard window cannot be met any more: the stop is served as soon as possible
+            # with a late penalty instead of making the route infeasible
+            logger.info(f"Hard window of {addresses[route_address_indices[window['address_index']]]} closed, relaxed to a soft end")
+            del window['hard_end_time']
+            if not window.get('soft_end_time'):
+                window['soft_end_time'] = now
+                window['cost_per_hour_after'] = window.get('cost_per_hour_after') or REPLAN_CLOSED_WINDOW_COST_PER_HOUR
+        remaining_windows.append(window)
+    
+    geocodes = stored['geocodes']
+    replan_payload = {
+        key: value for key, value in payload.items()
+        if key not in ('addresses', 'coordinates', 'start_time', 'time_windows', 'priority_addresses', 'stage1_mode')
+    }
+    replan_payload['addresses'] = [{'latitude': current_position[0], 'longitude': current_position[1]}] + [
+        {'address': addresses[index], 'latitude': geocodes[addresses[index]][0], 'longitude': geocodes[addresses[index]][1]}
+        for index in route_address_indices[1:]
+    ]
+    replan_payload['start_time'] = current_time.replace(microsecond=0).isoformat().replace('+00:00', 'Z')
+    if remaining_windows:
+        replan_payload['time_windows'] = {'enabled': True, 'windows': remaining_windows}
+    
+    validation_error = validate_optimize_payload(replan_payload)
+    if validation_error:
+        raise ValueError(validation_error[0])
+    logger.info(f"Replanning {len(remaining)} of {end_index - 1} stops from {current_position} at {replan_payload['start_time']}")
+    return replan_payload, route_address_indices
+
+
+@app.route('/api/optimize/batch', methods=['POST'])
+def api_optimize_batch():
+    """
+    Optimize many independent routes in one call.
+    
+    Expected JSON format (each entry uses the /api/optimize payload schema):
+    {
+        "routes": [
+            {"addresses": ["Address 1", "Address 2", "Address 3"]},
+            {"addresses": ["Address 4", "Address 5"], "objective": "minimize_distance"}
+        ]
+    }
+    
+    Returns JSON with one result (or error) per route, in request order
+    """
+    try:
+        if not request.is_json:
+            return jsonify({
+                'error': 'Content-Type must be application/json',
+                'success': False
+            }), 400
+        
+        data = request.get_json()
+        routes = data.get('routes') if isinstance(data, dict) else data
+        
+        if not isinstance(routes, list) or not routes:
+            return jsonify({
+                'error': 'Missing "routes" list in JSON',
+                'success': False
+            }), 400
+        
+        if len(routes) > BATCH_MAX_ROUTES:
+            return jsonify({
+                'error': f'Too many routes in batch ({len(routes)}), maximum is {BATCH_MAX_ROUTES}',
+                'success': False
+            }), 400
+        
+        if not GOOGLE_MAPS_API_KEY:
+            return jsonify({
+                'error': 'Google Maps API key is not configured',
+                'success': False
+            }), 500
+        
+        batch_engine = data.get('engine', 'inline') if isinstance(data, dict) else 'inline'
+        if batch_engine not in BATCH_ENGINES:
+            return jsonify({
+                'error': f'Invalid batch engine "{batch_engine}". Valid values: {BATCH_ENGINES}',
+                'success': False
+            }), 400
+        
+        if batch_engine == 'batch_operation':
+            # One BatchOptimizeTours operation, polled on the batch operation executor
+            if not ROUTE_BATCH_STORAGE_URI or not GOOGLE_CLOUD_PROJECT_ID:
+                return jsonify({
+                    'error': 'Batch operations require ROUTE_BATCH_STORAGE_URI and GOOGLE_CLOUD_PROJECT_ID',
+                    'success': False
+                }), 500
+            
+            job_id = submit_optimization_job(run_batch_operation_optimization, routes, executor=batch_operation_executor)
+            if not job_id:
+                return jsonify({
+                    'error': f'Too many pending optimization jobs (limit {JOB_MAX_PENDING}), retry later',
+                    'success': False
+                }), 429
+            
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': url_for('api_get_optimization_job', job_id=job_id)
+            }), 202
+        
+        performance = PerformanceTracker()
+        performance_token = _current_performance.set(performance)
+        try:
+            batch_result = run_batch_optimization(routes)
+        finally:
+            _current_performance.reset(performance_token)
+        batch_result['performance'] = performance.as_dict()
+        response = jsonify(batch_result)
+        response.headers['Server-Timing'] = performance.server_timing()
+        return response, 200
+        
+    except Exception as e:
+        import traceback
+        logger.error(f"Batch optimization failed: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        
+        return jsonify({
+            'error': f'Internal server error: {str(e)}',
+            'success': False
+        }), 500
+
+
+def run_batch_optimization(routes):
+    """
+    Optimize a list of route payloads concurrently.
+    
+    The union of all addresses is geocoded once up front, then the routes are
+    solved on a pool of at most BATCH_MAX_PARALLEL workers, so a batch takes
+    roughly as long as its slowest route rather than the sum of all routes.
+    
+    Args:
+        routes: List of /api/optimize payloads
+    
+    Returns:
+        Dictionary with per-route results and batch summary
+    """
+    results, runnable_routes, known_coordinates = _prepare_batch_routes(routes)
+    
+    if runnable_routes:
+        workers = max(1, min(BATCH_MAX_PARALLEL, len(runnable_routes)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-route') as executor:
+            futures = {
+                submit_with_context(executor, run_optimization, routes[index], known_coordinates): index
+                for index in runnable_routes
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    route_info = future.result()
+                except Exception as e:
+                    logger.error(f"Batch route {index} failed: {str(e)}")
+                    results[index] = {'index': index, 'success': False, 'error': str(e)}
+                    continue
+                
+                if not route_info:
+                    results[index] = {'index': index, 'success': False, 'error': 'Could not find optimal route'}
+                else:
+                    route_info.pop('response_cache', None)
+                    results[index] = {'index': index, **route_info}
+    
+    return _batch_summary(results, known_coordinates)
+
+
+def _prepare_batch_routes(routes):
+    """
+    Validate batch route payloads and geocode the union of their addresses.
+    
+    Returns:
+        Tuple (results, runnable_routes, known_coordinates): results holds an error entry
+        for every rejected route (None otherwise), runnable_routes the indices left to solve
+    """
+    results = [None] * len(routes)
+    valid_routes = []
+    for index, route_data in enumerate(routes):
+        validation_error = validate_optimize_payload(route_data)
+        if validation_error:
+            results[index] = {'index': index, 'success': False, 'error': validation_error[0]}
+        else:
+            valid_routes.append(index)
+    
+    # Pre-geocoded entries are resolved per route by run_optimization / prepare_route_model
+    addresses_to_geocode = {}
+    for index in valid_routes:
+        addresses, provided_coordinates = parse_address_entries(routes[index])
+        addresses_to_geocode[index] = [address for address in addresses if address not in provided_coordinates]
+    
+    all_addresses = [address for index in valid_routes for address in addresses_to_geocode[index]]
+    known_coordinates, failed_addresses = geocode_address_set(all_addresses)
+    logger.info(f"Batch of {len(routes)} routes: geocoded {len(known_coordinates)} unique addresses "
+                f"({len(all_addresses)} total, {len(failed_addresses)} failed)")
+    
+    runnable_routes = []
+    for index in valid_routes:
+        failed = [address for address in addresses_to_geocode[index] if address in failed_addresses]
+        if failed:
+            results[index] = {'index': index, 'success': False, 'error': f'Failed to geocode address: {failed[0]}'}
+        else:
+            runnable_routes.append(index)
+    
+    return results, runnable_routes, known_coordinates
+
+
+def _batch_summary(results, known_coordinates):
+    succeeded = sum(1 for result in results if result.get('success'))
+    return {
+        'success': succeeded > 0,
+        'routes_count': len(results),
+        'succeeded_count': succeeded,
+        'failed_count': len(results) - succeeded,
+        'unique_addresses_geocoded': len(known_coordinates),
+        'results': results
+    }
+
+
+def run_batch_operation_optimization(routes, client=None, storage=None):
+    """
+    Optimize a list of route payloads with one BatchOptimizeTours long-running operation.
+    
+    Each route model is written as an OptimizeToursRequest JSON file to batch storage,
+    the operation is submitted and polled every ROUTE_BATCH_POLL_SECONDS, and the
+    responses are read back and mapped through build_remote_route_result(). Meant to
+    run on batch_operation_executor: polling never blocks a request thread or the
+    workers of regular background jobs.
+    
+    Priority addresses are applied in a single stage against the default route end
+    time, since a batch operation cannot feed stage 1 durations into stage 2.
+    
+    Args:
+        routes: List of /api/optimize payloads
+        client: Optional RouteOptimizationClient (defaults to the shared pool)
+        storage: Optional BatchStorage (defaults to ROUTE_BATCH_STORAGE_URI)
+    
+    Returns:
+        Dictionary with per-route results and batch summary (same schema as run_batch_optimization)
+    """
+    from google.maps import routeoptimization_v1 as ro
+    
+    results, runnable_routes, known_coordinates = _prepare_batch_routes(routes)
+    
+    route_models = {}
+    requests_by_index = {}
+    for index in runnable_routes:
+        route_data = routes[index]
+        try:
+            addresses, provided_coordinates = parse_address_entries(route_data)
+            route_model = prepare_route_model(
+                addresses,
+                route_data.get('start_time'),
+                route_data.get('objective'),
+                route_data.get('service_time_minutes', 3),
+                {**known_coordinates, **provided_coordinates}
+            )
+            time_windows_config = _apply_priority_time_windows(
+                route_model, route_data.get('time_windows'), route_data.get('priority_addresses')
+            )
+            route_models[index] = route_model
+            requests_by_index[index] = build_optimize_tours_request(route_model, time_windows_config)
+        except Exception as e:
+            logger.error(f"Batch route {index} could not be prepared: {str(e)}")
+            results[index] = {'index': index, 'success': False, 'error': str(e)}
+    
+    if not requests_by_index:
+        return _batch_summary(results, known_coordinates)
+    
+    if storage is None:
+        storage = BatchStorage(ROUTE_BATCH_STORAGE_URI)
+    if client is None:
+        client = get_route_client()
+    
+    batch_id = uuid.uuid4().hex
+    model_configs = []
+    for index, optimize_request in requests_by_index.items():
+        input_name = f"{batch_id}/input/route-{index}.json"
+        storage.write(input_name, ro.OptimizeToursRequest.to_json(optimize_request))
+        model_configs.append(ro.BatchOptimizeToursRequest.AsyncModelConfig(
+            display_name=f"route-{index}",
+            input_config=ro.InputConfig(
+                gcs_source=ro.GcsSource(uri=storage.uri(input_name)),
+                data_format=ro.DataFormat.JSON
+            ),
+            output_config=ro.OutputConfig(
+                gcs_destination=ro.GcsDestination(uri=storage.uri(f"{batch_id}/output/route-{index}.json")),
+                data_format=ro.DataFormat.JSON
+            )
+        ))
+    
+    with track_external_call('batch_optimize_tours'):
+        operation = client.batch_optimize_tours(request=ro.BatchOptimizeToursRequest(
+            parent=f"projects/{GOOGLE_CLOUD_PROJECT_ID}",
+            model_configs=model_configs
+        ))
+    operation_name = operation.operation.name
+    logger.info(f"Submitted BatchOptimizeTours operation {operation_name} with {len(model_configs)} route models")
+    
+    deadline = time.time() + ROUTE_BATCH_TIMEOUT_SECONDS
+    while not operation.done():
+        if time.time() > deadline:
+            raise Exception(f"Batch operation {operation_name} did not finish within {ROUTE_BATCH_TIMEOUT_SECONDS}s")
+        time.sleep(ROUTE_BATCH_POLL_SECONDS)
+    operation.result()  # Raises if the operation failed as a whole
+    logger.info(f"Batch operation {operation_name} finished")
+    
+    for index, route_model in route_models.items():
+        try:
+            response = ro.OptimizeToursResponse.from_json(
+                storage.read(f"{batch_id}/output/route-{index}.json"), ignore_unknown_fields=True
+            )
+            if not response.routes:
+                results[index] = {'index': index, 'success': False, 'error': 'Could not find optimal route'}
+                continue
+            record_observed_legs(route_model, response)
+            route_info = build_remote_route_result(route_model, response)
+            route_info.pop('response_cache', None)
+            route_info['engine'] = 'batch_operation'
+            results[index] = {'index': index, **route_info}
+        except Exception as e:
+            logger.error(f"Batch route {index} result could not be read: {str(e)}")
+            results[index] = {'index': index, 'success': False, 'error': str(e)}
+    
+    return _batch_summary(results, known_coordinates)
+
+
+class TravelMatrix:
+    """
+    Square travel matrix backed by contiguous int32 arrays.
+
+    durations are in seconds and distances in meters. Cells without a route hold
+    the UNREACHABLE sentinel instead of a made-up large value.
+    """
+
+    UNREACHABLE = 2 ** 31 - 1  # np.iinfo(np.int32).max
+
+    def __init__(self, durations, distances):
+        import numpy as np
+        
+        self.durations = np.ascontiguousarray(durations, dtype=np.int32)
+        self.distances = np.ascontiguousarray(distances, dtype=np.int32)
+        if self.durations.shape != self.distances.shape or self.durations.ndim != 2 or self.durations.shape[0] != self.durations.shape[1]:
+            raise ValueError(f"TravelMatrix requires two square matrices of equal size, got {self.durations.shape} and {self.distances.shape}")
+
+    @classmethod
+    def empty(cls, size):
+        """Zero-filled matrix for size locations."""
+        import numpy as np
+        
+        return cls(np.zeros((size, size), dtype=np.int32), np.zeros((size, size), dtype=np.int32))
+
+    @property
+    def size(self):
+        return self.durations.shape[0]
+
+    def reachable(self):
+        """Boolean mask of cells that have a route."""
+        return (self.durations != self.UNREACHABLE) & (self.distances != self.UNREACHABLE)
+
+    def cost_matrix(self, cost_per_hour, cost_per_kilometer, unreachable_cost=None):
+        """
+        Integer arc costs in cost units per hour: cost_per_hour * seconds + cost_per_kilometer * meters * 3.6.
+        Unreachable cells get unreachable_cost (default: larger than any possible route).
+        """
+        import numpy as np
+        
+        costs = np.rint(
+            cost_per_hour * self.durations.astype(np.float64)
+            + cost_per_kilometer * self.distances.astype(np.float64) * 3.6
+        ).astype(np.int64)
+        reachable = self.reachable()
+        if not reachable.all():
+            if unreachable_cost is None:
+                unreachable_cost = int(costs[reachable].sum()) + 1 if reachable.any() else 1
+            costs[~reachable] = unreachable_cost
+        return costs
+
+
+def create_distance_matrix(addresses, coordinates=None, departure_time=None, mode='driving', avoid='tolls', stats=None):
+    """
+    Create distance matrix using Google Maps Distance Matrix API with batching support.
+    For large number of addresses, splits requests into smaller batches to avoid API limits.
+    Batches are fetched concurrently (bounded pool, shared HTTP session, client-side rate limits).
+    Addresses may also be "lat,lng" strings.
+    
+    When coordinates are given, cells already in the pairwise travel time cache are
+    reused and only the missing cells are requested.
+    
+    Args:
+        addresses: List of address strings (or "lat,lng" strings)
+        coordinates: Optional list of (lat, lng) tuples matching addresses; enables the pairwise cache
+        departure_time: Optional departure datetime (passed to the API and used as cache time bucket)
+        mode: Travel mode
+        avoid: Features to avoid (e.g. 'tolls')
+        stats: Optional dict that receives cell and request counters
+    
+    Returns:
+        TravelMatrix with distances in meters and durations in seconds
+    """
+    import numpy as np
+    
+    num_addresses = len(addresses)
+    
+    # Preallocate matrices; every batch writes into its own block
+    travel_matrix = TravelMatrix.empty(num_addresses)
+    matrix = travel_matrix.distances
+    time_matrix = travel_matrix.durations
+    
+    # Cells that still need to be requested (the diagonal is always zero)
+    missing = np.ones((num_addresses, num_addresses), dtype=bool)
+    np.fill_diagonal(missing, False)
+    
+    use_cache = travel_time_cache is not None and coordinates is not None
+    time_bucket = _travel_time_bucket(departure_time)
+    if use_cache:
+        try:
+            cached_cells = travel_time_cache.lookup(coordinates, mode, avoid, time_bucket)
+            count_cache('travel_time_cells', 'hit', len(cached_cells))
+            for (origin_index, destination_index), (meters, seconds) in cached_cells.items():
+                matrix[origin_index, destination_index] = meters
+                time_matrix[origin_index, destination_index] = seconds
+                missing[origin_index, destination_index] = False
+        except Exception as e:
+            logger.warning(f"Travel time cache lookup failed: {str(e)}")
+    
+    tiles = _plan_distance_matrix_tiles(missing)
+    requested_cells = int(missing.sum())
+    if use_cache:
+        count_cache('travel_time_cells', 'miss', requested_cells)
+    logger.debug(f"Distance matrix {num_addresses}x{num_addresses}: {requested_cells} cells missing, {len(tiles)} requests planned")
+    
+    # Counts HTTP requests actually sent (including OVER_QUERY_LIMIT retries)
+    issued_requests = [0]
+    issued_lock = threading.Lock()
+    
+    def count_request():
+        with issued_lock:
+            issued_requests[0] += 1
+    
+    def fetch_tile(tile):
+        origin_indices, destination_indices = tile
+        return _create_distance_matrix_batch(
+            [addresses[i] for i in origin_indices],
+            [addresses[j] for j in destination_indices],
+            departure_time=departure_time, mode=mode, avoid=avoid, on_request=count_request
+        )
+    
+    new_cells = {}
+    
+    def store_tile(tile, batch_matrix, batch_time_matrix):
+        origin_indices, destination_indices = tile
+        block = np.ix_(origin_indices, destination_indices)
+        matrix[block] = batch_matrix
+        time_matrix[block] = batch_time_matrix
+        for oi, origin_index in enumerate(origin_indices):
+            for di, destination_index in enumerate(destination_indices):
+                if batch_time_matrix[oi, di] != TravelMatrix.UNREACHABLE:
+                    new_cells[(origin_index, destination_index)] = (int(batch_matrix[oi, di]), int(batch_time_matrix[oi, di]))
+    
+    if len(tiles) <= 1 or DISTANCE_MATRIX_MAX_WORKERS <= 1:
+        for tile in tiles:
+            store_tile(tile, *fetch_tile(tile))
+    else:
+        workers = min(DISTANCE_MATRIX_MAX_WORKERS, len(tiles))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='distance-matrix')
+        try:
+            futures = {submit_with_context(executor, fetch_tile, tile): tile for tile in tiles}
+            for future in as_completed(futures):
+                store_tile(futures[future], *future.result())
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    if use_cache and new_cells:
+        try:
+            travel_time_cache.store(coordinates, new_cells, mode, avoid, time_bucket)
+        except Exception as e:
+            logger.warning(f"Failed to store travel times in cache: {str(e)}")
+    
+    if stats is not None:
+        stats.update({
+            'cells': num_addresses * num_addresses,
+            'cached_cells': num_addresses * num_addresses - num_addresses - requested_cells,
+            'requested_cells': requested_cells,
+            'requested_elements': sum(len(rows) * len(cols) for rows, cols in tiles),
+            'planned_requests': len(tiles),
+            'issued_requests': issued_requests[0]
+        })
+    
+    logger.debug(f"Completed distance matrix for {num_addresses} addresses "
+                 f"({len(tiles)} requests planned, {issued_requests[0]} issued)")
+    return travel_matrix
+
+
+def _plan_distance_matrix_tiles(missing):
+    """
+    Cover the missing cells of a matrix with as few Distance Matrix requests as possible.
+    
+    Rows are grouped by their pattern of missing columns, groups are merged greedily
+    while that saves requests, and every group is cut into the request shape
+    (origins x destinations within the API limits) that needs the fewest requests.
+    A single new stop in a cached matrix therefore becomes 1x25 / 25x1 strips;
+    cached cells are only re-requested where that saves requests. The plan never needs
+    more requests than one bounding block over all rows and columns with gaps (e.g. a
+    cold matrix, where the excluded diagonal gives every row its own pattern).
+    
+    Returns:
+        List of (origin_indices, destination_indices) tuples
+    """
+    import numpy as np
+    
+    rows_with_gaps = np.flatnonzero(missing.any(axis=1))
+    if len(rows_with_gaps) == 0:
+        return []
+    
+    # Group rows that miss exactly the same columns
+    patterns = {}
+    for row in rows_with_gaps.tolist():
+        cols = tuple(np.flatnonzero(missing[row]).tolist())
+        patterns.setdefault(cols, []).append(row)
+    groups = [(rows, set(cols)) for cols, rows in patterns.items()]
+    
+    # One bounding block over all rows/columns with gaps is the fallback plan
+    bounding_block = [(rows_with_gaps.tolist(), set(np.flatnonzero(missing.any(axis=0)).tolist()))]
+    
+    # Too many distinct patterns to merge pairwise: every pattern is requested on its own
+    if len(groups) <= DISTANCE_MATRIX_MAX_PATTERN_GROUPS:
+        # Greedily merge the pair of groups that saves the most requests
+        while len(groups) > 1:
+            best = None
+            for a in range(len(groups)):
+                for b in range(a + 1, len(groups)):
+                    rows_a, cols_a = groups[a]
+                    rows_b, cols_b = groups[b]
+                    separate = _tile_count(len(rows_a), len(cols_a)) + _tile_count(len(rows_b), len(cols_b))
+                    merged = _tile_count(len(rows_a) + len(rows_b), len(cols_a | cols_b))
+                    saving = separate - merged
+                    if saving > 0 and (best is None or saving > best[0]):
+                        best = (saving, a, b)
+            if best is None:
+                break
+            _, a, b = best
+            merged_group = (groups[a][0] + groups[b][0], groups[a][1] | groups[b][1])
+            groups = [group for index, group in enumerate(groups) if index not in (a, b)] + [merged_group]
+    
+    # Keep the cheaper plan: fewer requests first, then fewer elements (cached cells re-requested)
+    def plan_cost(plan):
+        return (
+            sum(_tile_count(len(rows), len(cols)) for rows, cols in plan),
+            sum(len(rows) * len(cols) for rows, cols in plan)
+        )
+    
+    if plan_cost(bounding_block) < plan_cost(groups):
+        groups = bounding_block
+    
+    tiles = []
+    for rows, cols in groups:
+        rows = sorted(rows)
+        cols = sorted(cols)
+        origins_per_request, destinations_per_request = _best_tile_shape(len(rows), len(cols))
+        for i in range(0, len(rows), origins_per_request):
+            for j in range(0, len(cols), destinations_per_request):
+                tiles.append((rows[i:i + origins_per_request], cols[j:j + destinations_per_request]))
+    return tiles
+
+
+def _best_tile_shape(num_rows, num_cols):
+    """Return the (origins, destinations) request shape that covers a block with the fewest requests."""
+    best = None
+    for origins in range(1, min(DISTANCE_MATRIX_MAX_ORIGINS, num_rows) + 1):
+        destinations = min(DISTANCE_MATRIX_MAX_DESTINATIONS, num_cols, DISTANCE_MATRIX_MAX_ELEMENTS // origins)
+        if destinations < 1:
+            break
+        count = -(-num_rows // origins) * -(-num_cols // destinations)
+        if best is None or count < best[0]:
+            best = (count, origins, destinations)
+    return best[1], best[2]
+
+
+def _tile_count(num_rows, num_cols):
+    """Number of requests needed to cover a num_rows x num_cols block."""
+    origins, destinations = _best_tile_shape(num_rows, num_cols)
+    return -(-num_rows // origins) * -(-num_cols // destinations)
+
+
+def _travel_time_bucket(departure_time):
+    """Time-of-day bucket used to key cached travel times ('any' without a departure time)."""
+    if departure_time is None:
+        return 'any'
+    return f"h{departure_time.astimezone(pytz.UTC).hour:02d}"
+
+def _create_distance_matrix_batch(origins, destinations, departure_time=None, mode='driving', avoid='tolls', on_request=None):
+    """
+    Make a single Distance Matrix API request for a batch of origins and destinations.
+    Requests are rate limited client-side and retried with backoff on OVER_QUERY_LIMIT.
+    on_request is called for every HTTP request sent.
+    """
+    import numpy as np
+    
+    url = f"{GOOGLE_MAPS_BASE_URL}/maps/api/distancematrix/json"
+    params = {
+        'origins': '|'.join(origins),
+        'destinations': '|'.join(destinations),
+        'mode': mode,
+        'language': 'en',
+        'avoid': avoid,
+        'key': GOOGLE_MAPS_API_KEY
+    }
+    if departure_time is not None:
+        params['departure_time'] = int(departure_time.timestamp())
+    
+    for attempt in range(DISTANCE_MATRIX_MAX_RETRIES + 1):
+        distance_matrix_request_limiter.acquire(1)
+        distance_matrix_element_limiter.acquire(len(origins) * len(destinations))
+        
+        logger.debug(f"Distance Matrix API request - {len(origins)} origins, {len(destinations)} destinations")
+        if on_request:
+            on_request()
+        with track_external_call('distance_matrix'):
+            response = http_session.get(url, params=params)
+        logger.debug(f"Distance Matrix API response status: {response.status_code}")
+        
+        if response.status_code != 200:
+            raise Exception(f"Google API Error (Distance Matrix): Status {response.status_code}, Response: {response.text}")
+        
+        try:
+            result = response.json()
+        except ValueError:  # json.JSONDecodeError is a subclass of ValueError
+            raise Exception(f"Failed to decode JSON from Google API (Distance Matrix). Response: {response.text}")
+        
+        if result['status'] == 'OVER_QUERY_LIMIT' and attempt < DISTANCE_MATRIX_MAX_RETRIES:
+            backoff = 0.5 * (2 ** attempt)
+            logger.warning(f"Distance Matrix API OVER_QUERY_LIMIT, retrying in {backoff}s (attempt {attempt + 1})")
+            time.sleep(backoff)
+            continue
+        break
+    
+    if result['status'] != 'OK':
+        if result['status'] == 'MAX_ELEMENTS_EXCEEDED':
+            raise Exception(f"Too many addresses in batch! Origins: {len(origins)}, Destinations: {len(destinations)}, Elements: {len(origins)*len(destinations)}")
+        else:
+            raise Exception(f"Google API returned error status: {result['status']}")
+    
+    if 'rows' not in result:
+        raise Exception("API response does not contain 'rows' field")
+    
+    # Initialize matrices for this batch
+    batch_matrix = np.zeros((len(origins), len(destinations)), dtype=np.int32)
+    batch_time_matrix = np.zeros((len(origins), len(destinations)), dtype=np.int32)
+    
+    # Parse the Distance Matrix API response
+    for i, row in enumerate(result['rows']):
+        for j, element in enumerate(row['elements']):
+            if element['status'] != 'OK':
+                print(f"Warning: Route not available from {i} to {j}")
+                batch_matrix[i][j] = TravelMatrix.UNREACHABLE
+                batch_time_matrix[i][j] = TravelMatrix.UNREACHABLE
+                continue
+                
+            duration_val = element['duration']['value']  # in seconds
+            distance_val = element['distance']['value']  # in meters
+            
+            batch_matrix[i][j] = distance_val
+            batch_time_matrix[i][j] = duration_val
+    
+    return batch_matrix, batch_time_matrix
+
+def build_haversine_matrix(coordinates, circuity_factor=None, speed_profile=None, speed_factor=None):
+    """
+    Estimate road distances and travel times between coordinates without any API calls.
+    
+    Great-circle (haversine) distance is multiplied by a road circuity factor and
+    converted to time with a distance-banded speed profile. Fully vectorized with NumPy.
+    
+    Args:
+        coordinates: Sequence of (lat, lng) tuples
+        circuity_factor: Road distance / straight-line distance ratio (default LOCAL_ROAD_CIRCUITY_FACTOR),
+                         or one ratio per origin coordinate
+        speed_profile: Key of SPEED_PROFILES_KMH (default LOCAL_SPEED_PROFILE)
+        speed_factor: Optional multiplier of the profile travel times, or one per origin coordinate
+    
+    Returns:
+        TravelMatrix with distances in meters and durations in seconds
+    """
+    import numpy as np
+    
+    if circuity_factor is None:
+        circuity_factor = LOCAL_ROAD_CIRCUITY_FACTOR
+    circuity_factor = np.asarray(circuity_factor, dtype=np.float64)
+    if circuity_factor.ndim == 1:
+        circuity_factor = circuity_factor[:, None]  # Per origin (row)
+    bands = SPEED_PROFILES_KMH[speed_profile or LOCAL_SPEED_PROFILE]
+    
+    points = np.radians(np.asarray(coordinates, dtype=np.float64).reshape(-1, 2))
+    lat = points[:, 0]
+    lng = points[:, 1]
+    dlat = lat[None, :] - lat[:, None]
+    dlng = lng[None, :] - lng[:, None]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    road_meters = 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))) * circuity_factor
+    
+    seconds = np.zeros_like(road_meters)
+    lower_meters = 0.0
+    for upper_km, speed_kmh in bands:
+        upper_meters = upper_km * 1000
+        band_meters = np.clip(road_meters - lower_meters, 0.0, upper_meters - lower_meters)
+        seconds += band_meters / (speed_kmh / 3.6)
+        lower_meters = upper_meters
+    
+    if speed_factor is not None:
+        speed_factor = np.asarray(speed_factor, dtype=np.float64)
+        seconds *= speed_factor[:, None] if speed_factor.ndim == 1 else speed_factor
+    
+    return TravelMatrix(np.rint(seconds), np.rint(road_meters))
+
+
+def solve_tsp(matrix, start_index=0, end_index=None, time_matrix=None, service_times=None, soft_time_windows=None, time_limit_seconds=30, guided_local_search=True):
+    """
+    Solve a single-vehicle routing problem over a cost matrix with OR-Tools.
+    
+    Args:
+        matrix: Square arc cost matrix (array or list of lists), or a TravelMatrix
+                (durations are then used as arc costs and travel times)
+        start_index: Node where the route starts
+        end_index: Optional node where the route ends. If not provided, the route
+                   returns to start_index (closed tour).
+        time_matrix: Optional travel time matrix in seconds (array or TravelMatrix) for the
+                     time dimension (defaults to matrix)
+        service_times: Optional list of service seconds per node
+        soft_time_windows: Optional list of soft windows in seconds from route start:
+                           [{'node': 1, 'start': 0, 'end': 3600, 'cost_before': 1, 'cost_after': 100}]
+        time_limit_seconds: Solver time limit
+        guided_local_search: Improve the first solution with guided local search until the time
+                             limit (default). If False, the solver stops at the first local optimum.
+    
+    Returns:
+        Tuple (optimized_indices, route_cost). For closed tours the last index is the start node again.
+    """
+    import numpy as np
+    from ortools.constraint_solver import routing_enums_pb2, pywrapcp
+    
+    if isinstance(matrix, TravelMatrix):
+        if time_matrix is None:
+            time_matrix = matrix
+        matrix = matrix.cost_matrix(cost_per_hour=1, cost_per_kilometer=0)
+    if isinstance(time_matrix, TravelMatrix):
+        time_matrix = time_matrix.durations
+    
+    cost_values = np.asarray(matrix, dtype=np.int64)
+    num_locations = cost_values.shape[0]
+    if end_index is None:
+        manager = pywrapcp.RoutingIndexManager(num_locations, 1, start_index)
+    else:
+        manager = pywrapcp.RoutingIndexManager(num_locations, 1, [start_index], [end_index])
+    routing = pywrapcp.RoutingModel(manager)
+
+    # Matrix-based transit callbacks are evaluated inside OR-Tools without calling back into Python
+    transit_callback_index = routing.RegisterTransitMatrix(cost_values.tolist())
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+    
+    if service_times is not None or soft_time_windows:
+        # No waiting (slack 0); horizon is generous because windows are soft
+        horizon = 7 * 24 * 3600
+        travel_times = np.asarray(time_matrix if time_matrix is not None else cost_values, dtype=np.int64)
+        service = np.asarray(service_times if service_times is not None else np.zeros(num_locations), dtype=np.int64)
+        # Service time is spent at the origin of each arc; unreachable arcs are capped at the horizon
+        transit_times = np.minimum(travel_times + service[:, None], horizon + 1)
+        
+        time_callback_index = routing.RegisterTransitMatrix(transit_times.tolist())
+        routing.AddDimension(time_callback_index, 0, horizon, True, 'Time')
+        time_dimension = routing.GetDimensionOrDie('Time')
+        
+        for window in soft_time_windows or []:
+            index = manager.NodeToIndex(window['node'])
+            if index < 0:
+                continue
+            if window.get('cost_after'):
+                time_dimension.SetCumulVarSoftUpperBound(index, int(window['end']), int(window['cost_after']))
+            if window.get('cost_before') and window['start'] > 0:
+                time_dimension.SetCumulVarSoftLowerBound(index, int(window['start']), int(window['cost_before']))
+    
+    # Enhanced search parameters for better optimization
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = (
+        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+    )
+    # Add local search metaheuristic for better solutions
+    if guided_local_search:
+        search_parameters.local_search_metaheuristic = (
+            routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+        )
+    # Set time limit for optimization (fractions of a second allowed)
+    search_parameters.time_limit.FromMilliseconds(int(time_limit_seconds * 1000))
+    
+    solution = routing.SolveWithParameters(search_parameters)
+    
+    if solution:
+        index = routing.Start(0)
+        optimized_indices = []
+        route_distance = 0
+        
+        while not routing.IsEnd(index):
+            optimized_indices.append(manager.IndexToNode(index))
+            previous_index = index
             index = solution.Value(routing.NextVar(index))
             route_distance += routing.GetArcCostForVehicle(previous_index, index, 0)
         
-        # Add the last node (should be the depot/start point for TSP)
-        optimized_indices.append(manager.IndexToNode(index))
+        # Add the last node (the depot for closed tours, end_index for open routes)
+        optimized_indices.append(manager.IndexToNode(index))
+        
+        print(f"DEBUG: TSP solution found with total distance: {route_distance}")
+        print(f"DEBUG: Optimized route indices: {optimized_indices}")
+        
+        return optimized_indices, route_distance
+    else:
+        print("ERROR: No solution found for TSP")
+        return None, 0
+
+def get_optimized_route_details(optimized_addresses):
+    # Use the classic Directions API instead of Routes API v2 for better compatibility
+    url = f"{GOOGLE_MAPS_BASE_URL}/maps/api/directions/json"
+    
+    if len(optimized_addresses) < 2:
+        raise Exception("Need at least 2 addresses for route calculation")
+    
+    origin = optimized_addresses[0]
+    destination = optimized_addresses[-1]
+    intermediates = optimized_addresses[1:-1]
+    
+    params = {
+        'origin': origin,
+        'destination': destination,
+        'mode': 'driving',
+        'language': 'en',
+        'avoid': 'tolls',
+        'key': GOOGLE_MAPS_API_KEY
+    }
+    
+    # Add waypoints if there are intermediate addresses
+    if intermediates:
+        waypoints = '|'.join(intermediates)
+        params['waypoints'] = f'optimize:true|{waypoints}'
+    
+    print("DEBUG: Directions API request URL:", url)
+    print("DEBUG: Directions API request params:", params)
+    
+    response = requests.get(url, params=params)
+    print("DEBUG: Directions API response status:", response.status_code)
+    print("DEBUG: Directions API response text:", response.text[:500] + "..." if len(response.text) > 500 else response.text)
+
+    if response.status_code != 200:
+        raise Exception(f"Google API Error (Directions): Status {response.status_code}, Response: {response.text}")
+
+    try:
+        result = response.json()
+    except ValueError:  # json.JSONDecodeError is a subclass of ValueError
+        raise Exception(f"Failed to decode JSON from Google API (Directions). Response: {response.text}")
+
+    if result['status'] != 'OK':
+        raise Exception(f"Google Directions API returned error status: {result['status']}")
+
+    if 'routes' not in result or not result['routes']:
+        raise Exception("No routes found in the response")
+        
+    route = result['routes'][0]  # Get the first (and usually only) route
+    
+    total_distance = 0
+    total_duration = 0
+    
+    for leg in route['legs']:
+        total_distance += leg['distance']['value']  # in meters
+        total_duration += leg['duration']['value']  # in seconds
+            
+    return {
+        'total_distance_meters': total_distance,
+        'total_duration_seconds': total_duration,
+        'total_distance_km': round(total_distance / 1000, 2),
+        'total_duration_minutes': round(total_duration / 60, 2),
+        'total_duration_hours': round(total_duration / 3600, 2),
+        'route_details': route
+    }
+
+def _connect_sqlite(path):
+    """
+    Open a SQLite connection that can be shared between request threads.
+    WAL mode lets both gunicorn workers read while one of them writes.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+def normalize_address(address):
+    """Normalize an address string for use as a cache key (case and whitespace insensitive)."""
+    return re.sub(r'\s+', ' ', address.strip()).casefold()
+
+
+class GeocodeCache:
+    """
+    Persistent on-disk geocoding cache keyed on the normalized address string.
+
+    Entries expire after ttl_seconds; when the table grows beyond max_entries the
+    least recently used entries are evicted. Hit/miss counters are kept per process.
+    """
+
+    def __init__(self, path, ttl_seconds, max_entries):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = _connect_sqlite(path)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS geocodes ('
+            ' address_key TEXT PRIMARY KEY,'
+            ' latitude REAL NOT NULL,'
+            ' longitude REAL NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' last_used_at REAL NOT NULL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS geocodes_last_used ON geocodes (last_used_at)')
+
+    def get(self, address):
+        """Return cached (lat, lng) for an address or None if missing or expired."""
+        key = normalize_address(address)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT latitude, longitude, created_at FROM geocodes WHERE address_key = ?', (key,)
+            ).fetchone()
+            if row is None or now - row[2] > self.ttl_seconds:
+                if row is not None:
+                    self._connection.execute('DELETE FROM geocodes WHERE address_key = ?', (key,))
+                self.misses += 1
+                return None
+            self._connection.execute('UPDATE geocodes SET last_used_at = ? WHERE address_key = ?', (now, key))
+            self.hits += 1
+            return row[0], row[1]
+
+    def set(self, address, lat, lng):
+        """Store coordinates for an address and evict old entries if the cache is full."""
+        key = normalize_address(address)
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO geocodes (address_key, latitude, longitude, created_at, last_used_at) '
+                'VALUES (?, ?, ?, ?, ?)', (key, lat, lng, now, now)
+            )
+            count = self._connection.execute('SELECT COUNT(*) FROM geocodes').fetchone()[0]
+            if count > self.max_entries:
+                overflow = count - self.max_entries
+                self._connection.execute(
+                    'DELETE FROM geocodes WHERE address_key IN ('
+                    ' SELECT address_key FROM geocodes ORDER BY last_used_at ASC LIMIT ?)', (overflow,)
+                )
+                self.evictions += overflow
+
+    def stats(self):
+        """Return cache counters for monitoring."""
+        with self._lock:
+            size = self._connection.execute('SELECT COUNT(*) FROM geocodes').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'entries': size,
+            'max_entries': self.max_entries,
+            'ttl_days': round(self.ttl_seconds / 86400, 2),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+def _create_geocode_cache():
+    if not GEOCODE_CACHE_PATH:
+        logger.info("Geocoding cache disabled (GEOCODE_CACHE_PATH is empty)")
+        return None
+    try:
+        return GeocodeCache(GEOCODE_CACHE_PATH, GEOCODE_CACHE_TTL_DAYS * 86400, GEOCODE_CACHE_MAX_ENTRIES)
+    except Exception as e:
+        logger.error(f"Failed to open geocoding cache at {GEOCODE_CACHE_PATH}: {str(e)}")
+        return None
+
+
+geocode_cache = _create_geocode_cache()
+
+
+class TravelTimeCache:
+    """
+    Persistent pairwise travel time cache for Distance Matrix results.
+
+    Keyed on (origin coordinate, destination coordinate, mode, avoid flags, time-of-day bucket);
+    coordinates are rounded to 5 decimals (~1 m). Entries expire after ttl_seconds and the
+    oldest entries are evicted beyond max_entries.
+    """
+
+    def __init__(self, path, ttl_seconds, max_entries):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = _connect_sqlite(path)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS travel_times ('
+            ' origin TEXT NOT NULL,'
+            ' destination TEXT NOT NULL,'
+            ' mode TEXT NOT NULL,'
+            ' avoid TEXT NOT NULL,'
+            ' time_bucket TEXT NOT NULL,'
+            ' distance_meters INTEGER NOT NULL,'
+            ' duration_seconds INTEGER NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' PRIMARY KEY (origin, destination, mode, avoid, time_bucket))'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS travel_times_created ON travel_times (created_at)')
+
+    @staticmethod
+    def _point_key(lat, lng):
+        return f"{lat:.5f},{lng:.5f}"
+
+    def lookup(self, coordinates, mode, avoid, time_bucket):
+        """
+        Return cached cells for all pairs of the given coordinates.
+        
+        Returns:
+            Dict {(origin_index, destination_index): (distance_meters, duration_seconds)}
+        """
+        keys = [self._point_key(lat, lng) for lat, lng in coordinates]
+        positions = {}
+        for index, key in enumerate(keys):
+            positions.setdefault(key, []).append(index)
+        unique_keys = list(positions)
+        min_created_at = time.time() - self.ttl_seconds
+        
+        cells = {}
+        with self._lock:
+            # Chunk the IN list to stay below SQLite's bound parameter limit
+            for start in range(0, len(unique_keys), 400):
+                chunk = unique_keys[start:start + 400]
+                placeholders = ','.join('?' * len(chunk))
+                for destination_start in range(0, len(unique_keys), 400):
+                    destination_chunk = unique_keys[destination_start:destination_start + 400]
+                    destination_placeholders = ','.join('?' * len(destination_chunk))
+                    rows = self._connection.execute(
+                        f'SELECT origin, destination, distance_meters, duration_seconds FROM travel_times '
+                        f'WHERE origin IN ({placeholders}) AND destination IN ({destination_placeholders}) '
+                        f'AND mode = ? AND avoid = ? AND time_bucket = ? AND created_at >= ?',
+                        (*chunk, *destination_chunk, mode, avoid, time_bucket, min_created_at)
+                    ).fetchall()
+                    for origin, destination, meters, seconds in rows:
+                        for origin_index in positions[origin]:
+                            for destination_index in positions[destination]:
+                                cells[(origin_index, destination_index)] = (meters, seconds)
+            
+            requested = len(keys) * len(keys) - len(keys)
+            found = sum(1 for (i, j) in cells if i != j)
+            self.hits += found
+            self.misses += requested - found
+        return cells
+
+    def store(self, coordinates, cells, mode, avoid, time_bucket):
+        """Store {(origin_index, destination_index): (distance_meters, duration_seconds)} cells."""
+        keys = [self._point_key(lat, lng) for lat, lng in coordinates]
+        now = time.time()
+        rows = [
+            (keys[i], keys[j], mode, avoid, time_bucket, meters, seconds, now)
+            for (i, j), (meters, seconds) in cells.items()
+        ]
+        with self._lock:
+            self._connection.execute('BEGIN')
+            try:
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO travel_times '
+                    '(origin, destination, mode, avoid, time_bucket, distance_meters, duration_seconds, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+                )
+                self._connection.execute('COMMIT')
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+            count = self._connection.execute('SELECT COUNT(*) FROM travel_times').fetchone()[0]
+            if count > self.max_entries:
+                self._connection.execute(
+                    'DELETE FROM travel_times WHERE rowid IN ('
+                    ' SELECT rowid FROM travel_times ORDER BY created_at ASC LIMIT ?)', (count - self.max_entries,)
+                )
+
+    def stats(self):
+        """Return cache counters for monitoring."""
+        with self._lock:
+            size = self._connection.execute('SELECT COUNT(*) FROM travel_times').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'entries': size,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+def _create_travel_time_cache():
+    if not TRAVEL_TIME_CACHE_PATH:
+        logger.info("Travel time cache disabled (TRAVEL_TIME_CACHE_PATH is empty)")
+        return None
+    try:
+        return TravelTimeCache(TRAVEL_TIME_CACHE_PATH, TRAVEL_TIME_CACHE_TTL_DAYS * 86400, TRAVEL_TIME_CACHE_MAX_ENTRIES)
+    except Exception as e:
+        logger.error(f"Failed to open travel time cache at {TRAVEL_TIME_CACHE_PATH}: {str(e)}")
+        return None
+
+
+travel_time_cache = _create_travel_time_cache()
+
+
+def _haversine_meters(origin, destination):
+    """Great-circle distance in meters between two (lat, lng) points."""
+    import math
+    
+    lat1, lng1, lat2, lng2 = map(math.radians, (origin[0], origin[1], destination[0], destination[1]))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _speed_profile_seconds(road_meters, speed_profile=None):
+    """Travel seconds for a road distance under a distance-banded speed profile (see SPEED_PROFILES_KMH)."""
+    seconds = 0.0
+    lower_meters = 0.0
+    for upper_km, speed_kmh in SPEED_PROFILES_KMH[speed_profile or LOCAL_SPEED_PROFILE]:
+        upper_meters = upper_km * 1000
+        seconds += min(max(road_meters - lower_meters, 0.0), upper_meters - lower_meters) / (speed_kmh / 3.6)
+        lower_meters = upper_meters
+    return seconds
+
+
+class TravelCalibrationStore:
+    """
+    Persistent store of road legs observed in Route Optimization responses and the
+    calibration factors derived from them.
+
+    Every leg (origin, destination, UTC hour, road distance, travel time) is kept in a
+    compact integer table (coordinates in 1e-5 degrees), bounded by max_legs, and added to
+    running totals per (region, hour). A region is the grid cell of region_degrees that
+    contains the leg origin. Per region the store fits:
+      circuity     = observed road meters / straight-line meters
+      speed factor = observed travel seconds / seconds predicted by the speed profile
+    Factors fall back from (region, hour) to the region, then to all regions, once at
+    least min_legs legs were observed, and otherwise to the uncalibrated defaults.
+    """
+
+    def __init__(self, path, max_legs, region_degrees, min_legs):
+        self.path = path
+        self.max_legs = max_legs
+        self.region_degrees = region_degrees
+        self.min_legs = min_legs
+        self._lock = threading.Lock()
+        self._connection = _connect_sqlite(path)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS calibration_legs ('
+            ' origin_lat INTEGER NOT NULL,'
+            ' origin_lng INTEGER NOT NULL,'
+            ' destination_lat INTEGER NOT NULL,'
+            ' destination_lng INTEGER NOT NULL,'
+            ' hour INTEGER NOT NULL,'
+            ' distance_meters INTEGER NOT NULL,'
+            ' duration_seconds INTEGER NOT NULL,'
+            ' created_at REAL NOT NULL)'
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS calibration_totals ('
+            ' region TEXT NOT NULL,'
+            ' hour INTEGER NOT NULL,'
+            ' legs INTEGER NOT NULL,'
+            ' straight_meters REAL NOT NULL,'
+            ' road_meters REAL NOT NULL,'
+            ' observed_seconds REAL NOT NULL,'
+            ' profile_seconds REAL NOT NULL,'
+            ' PRIMARY KEY (region, hour))'
+        )
+
+    def region(self, lat, lng):
+        """Grid cell key of a point."""
+        return f"{int(lat // self.region_degrees)}:{int(lng // self.region_degrees)}"
+
+    def record(self, legs):
+        """
+        Store observed legs and update the calibration totals.
+        
+        Args:
+            legs: Iterable of (origin, destination, hour, distance_meters, duration_seconds) with
+                  origin/destination as (lat, lng) and hour the UTC hour the leg started
+        
+        Returns:
+            Number of legs stored (very short and zero-duration legs are skipped)
+        """
+        now = time.time()
+        rows = []
+        totals = {}
+        for origin, destination, hour, distance_meters, duration_seconds in legs:
+            straight_meters = _haversine_meters(origin, destination)
+            # Very short legs (same street, same building) say little about road shape or speed
+            if straight_meters < 200 or distance_meters <= 0 or duration_seconds <= 0:
+                continue
+            rows.append((
+                round(origin[0] * 1e5), round(origin[1] * 1e5), round(destination[0] * 1e5), round(destination[1] * 1e5),
+                hour, int(distance_meters), int(duration_seconds), now
+            ))
+            total = totals.setdefault((self.region(*origin), hour), [0, 0.0, 0.0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += straight_meters
+            total[2] += distance_meters
+            total[3] += duration_seconds
+            total[4] += _speed_profile_seconds(distance_meters)
+        if not rows:
+            return 0
+        
+        with self._lock:
+            self._connection.execute('BEGIN')
+            try:
+                self._connection.executemany(
+                    'INSERT INTO calibration_legs (origin_lat, origin_lng, destination_lat, destination_lng, '
+                    'hour, distance_meters, duration_seconds, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+                )
+                self._connection.executemany(
+                    'INSERT INTO calibration_totals (region, hour, legs, straight_meters, road_meters, observed_seconds, profile_seconds) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (region, hour) DO UPDATE SET '
+                    'legs = legs + excluded.legs, straight_meters = straight_meters + excluded.straight_meters, '
+                    'road_meters = road_meters + excluded.road_meters, observed_seconds = observed_seconds + excluded.observed_seconds, '
+                    'profile_seconds = profile_seconds + excluded.profile_seconds',
+                    [(region, hour, *total) for (region, hour), total in totals.items()]
+                )
+                self._connection.execute('COMMIT')
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+            # Legs are only appended, so rowids grow with age: keep the newest max_legs rowids
+            # (an index lookup instead of counting the whole table on every solve)
+            last_rowid = self._connection.execute('SELECT MAX(rowid) FROM calibration_legs').fetchone()[0]
+            if last_rowid > self.max_legs:
+                self._connection.execute('DELETE FROM calibration_legs WHERE rowid <= ?', (last_rowid - self.max_legs,))
+        return len(rows)
+
+    def version(self):
+        """Number of legs behind the calibration totals; changes whenever the factors may change."""
+        with self._lock:
+            return self._connection.execute('SELECT COALESCE(SUM(legs), 0) FROM calibration_totals').fetchone()[0]
+
+    def _fit(self, total):
+        """(circuity, speed_factor) from summed totals, clamped to plausible values."""
+        legs, straight_meters, road_meters, observed_seconds, profile_seconds = total
+        circuity = min(max(road_meters / straight_meters, 1.0), 3.0)
+        speed_factor = min(max(observed_seconds / profile_seconds, 0.3), 3.0)
+        return circuity, speed_factor
+
+    def factors(self, coordinates, hour=None):
+        """
+        Calibration factors for the legs starting at each coordinate.
+        
+        Args:
+            coordinates: Sequence of (lat, lng) tuples
+            hour: Optional UTC departure hour (uses the hour-specific totals when available)
+        
+        Returns:
+            Tuple (circuity_factors, speed_factors, calibrated) of per-coordinate lists and the
+            number of coordinates that got calibrated (not default) factors
+        """
+        regions = [self.region(lat, lng) for lat, lng in coordinates]
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT region, hour, legs, straight_meters, road_meters, observed_seconds, profile_seconds FROM calibration_totals'
+            ).fetchall()
+        
+        by_region_hour = {}
+        by_region = {}
+        overall = [0, 0.0, 0.0, 0.0, 0.0]
+        for region, row_hour, *total in rows:
+            by_region_hour[(region, row_hour)] = total
+            region_total = by_region.setdefault(region, [0, 0.0, 0.0, 0.0, 0.0])
+            for i, value in enumerate(total):
+                region_total[i] += value
+                overall[i] += value
+        
+        default = (LOCAL_ROAD_CIRCUITY_FACTOR, 1.0)
+        overall_factors = self._fit(overall) if overall[0] >= self.min_legs else None
+        circuity_factors = []
+        speed_factors = []
+        calibrated = 0
+        for region in regions:
+            factors = None
+            for total in (by_region_hour.get((region, hour)), by_region.get(region)):
+                if total and total[0] >= self.min_legs:
+                    factors = self._fit(total)
+                    break
+            factors = factors or overall_factors
+            if factors:
+                calibrated += 1
+            circuity_factors.append((factors or default)[0])
+            speed_factors.append((factors or default)[1])
+        return circuity_factors, speed_factors, calibrated
+
+    def stats(self):
+        """Return store counters and the overall fitted factors for monitoring."""
+        with self._lock:
+            legs = self._connection.execute('SELECT COUNT(*) FROM calibration_legs').fetchone()[0]
+            regions, total_legs, straight, road, observed, profile = self._connection.execute(
+                'SELECT COUNT(DISTINCT region), SUM(legs), SUM(straight_meters), SUM(road_meters), '
+                'SUM(observed_seconds), SUM(profile_seconds) FROM calibration_totals'
+            ).fetchone()
+        stats = {
+            'legs': legs,
+            'max_legs': self.max_legs,
+            'observed_legs': total_legs or 0,
+            'regions': regions
+        }
+        if total_legs:
+            circuity, speed_factor = self._fit((total_legs, straight, road, observed, profile))
+            stats['circuity_factor'] = round(circuity, 3)
+            stats['speed_factor'] = round(speed_factor, 3)
+        return stats
+
+
+def _create_travel_calibration():
+    if not CALIBRATION_STORE_PATH:
+        logger.info("Travel time calibration disabled (CALIBRATION_STORE_PATH is empty)")
+        return None
+    try:
+        return TravelCalibrationStore(CALIBRATION_STORE_PATH, CALIBRATION_MAX_LEGS, CALIBRATION_REGION_DEGREES, CALIBRATION_MIN_LEGS)
+    except Exception as e:
+        logger.error(f"Failed to open travel time calibration store at {CALIBRATION_STORE_PATH}: {str(e)}")
+        return None
+
+
+travel_calibration = _create_travel_calibration()
+
+
+def record_observed_legs(route_model, response):
+    """
+    Store the legs of an OptimizeToursResponse in the calibration store.
+    Never raises: calibration must not fail an optimization.
+    """
+    if not travel_calibration or not response.routes:
+        return
+    try:
+        route = response.routes[0]
+        coordinates = route_model.coordinates
+        points = [coordinates[0]] + [coordinates[visit.shipment_index + 1] for visit in route.visits] + [coordinates[-1]]
+        legs = []
+        # Iterate, don't slice: slices of proto-plus repeated fields are raw protobuf messages
+        for i, transition in zip(range(len(points) - 1), route.transitions):
+            start_time = transition.start_time or route_model.start_time
+            legs.append((
+                points[i], points[i + 1], start_time.astimezone(pytz.UTC).hour,
+                transition.travel_distance_meters, transition.travel_duration.total_seconds()
+            ))
+        stored = travel_calibration.record(legs)
+        logger.info(f"Calibration: stored {stored} of {len(legs)} observed legs")
+    except Exception as e:
+        logger.warning(f"Failed to record observed legs for calibration: {str(e)}")
+
+
+class ResponseCache:
+    """Thread-safe in-memory LRU cache with a per-entry TTL."""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value or None if missing or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[0] > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            'entries': size,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+route_response_cache = ResponseCache(ROUTE_RESPONSE_CACHE_MAX_ENTRIES, ROUTE_RESPONSE_CACHE_TTL_SECONDS) if ROUTE_RESPONSE_CACHE_MAX_ENTRIES > 0 else None
+
+
+class BatchStorage:
+    """
+    Input and output files of BatchOptimizeTours operations.
+    
+    gs://bucket/prefix URIs are stored in Cloud Storage (clean up old batches with a
+    bucket lifecycle rule). Any other value is treated as a local directory that is
+    shared with a fake Route Optimization server, for tests.
+    """
+    
+    def __init__(self, base_uri):
+        self.base_uri = base_uri.rstrip('/')
+        self._bucket = None
+        self._prefix = ''
+        if self.base_uri.startswith('gs://'):
+            from google.cloud import storage
+            bucket_name, _, self._prefix = self.base_uri[len('gs://'):].partition('/')
+            self._bucket = storage.Client(project=GOOGLE_CLOUD_PROJECT_ID).bucket(bucket_name)
+    
+    def uri(self, name):
+        return f"{self.base_uri}/{name}"
+    
+    def _blob_name(self, name):
+        return f"{self._prefix}/{name}" if self._prefix else name
+    
+    def write(self, name, data):
+        if self._bucket is not None:
+            self._bucket.blob(self._blob_name(name)).upload_from_string(data, content_type='application/json')
+            return
+        path = os.path.join(self.base_uri, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(data)
+    
+    def read(self, name):
+        if self._bucket is not None:
+            return self._bucket.blob(self._blob_name(name)).download_as_text()
+        with open(os.path.join(self.base_uri, name), 'r', encoding='utf-8') as f:
+            return f.read()
+
+
+class JobStore:
+    """
+    SQLite-backed status and result store for background optimization jobs.
+    Finished jobs (and jobs stuck in a dead worker) expire after ttl_seconds.
+    """
+
+    def __init__(self, path, ttl_seconds):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._connection = _connect_sqlite(path)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' job_id TEXT PRIMARY KEY,'
+            ' status TEXT NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' updated_at REAL NOT NULL,'
+            ' result TEXT,'
+            ' error TEXT)'
+        )
+
+    def create(self, job_id):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                'INSERT INTO jobs (job_id, status, created_at, updated_at) VALUES (?, ?, ?, ?)',
+                (job_id, 'queued', now, now)
+            )
+            self._connection.execute('DELETE FROM jobs WHERE updated_at < ?', (now - self.ttl_seconds,))
+
+    def update(self, job_id, status, result=None, error=None):
+        # Serialize with Flask's JSON provider so stored results match the synchronous API output
+        with self._lock:
+            self._connection.execute(
+                'UPDATE jobs SET status = ?, updated_at = ?, result = ?, error = ? WHERE job_id = ?',
+                (status, time.time(), app.json.dumps(result) if result is not None else None, error, job_id)
+            )
+
+    def get(self, job_id):
+        """Return the job as a dictionary, or None if unknown or expired."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT status, created_at, updated_at, result, error FROM jobs WHERE job_id = ? AND updated_at >= ?',
+                (job_id, time.time() - self.ttl_seconds)
+            ).fetchone()
+        if row is None:
+            return None
+        status, created_at, updated_at, result, error = row
+        
+        def format_timestamp(value):
+            return datetime.fromtimestamp(value, pytz.UTC).replace(microsecond=0).isoformat().replace('+00:00', 'Z')
+        
+        job = {
+            'job_id': job_id,
+            'status': status,
+            'created_at': format_timestamp(created_at),
+            'updated_at': format_timestamp(updated_at)
+        }
+        if result is not None:
+            job['result'] = json.loads(result)
+        if error is not None:
+            job['error'] = error
+        return job
+
+
+def _create_job_store():
+    try:
+        return JobStore(JOB_STORE_PATH or ':memory:', JOB_RESULT_TTL_SECONDS)
+    except Exception as e:
+        logger.error(f"Failed to open job store at {JOB_STORE_PATH}: {str(e)}")
+        return None
+
+
+job_store = _create_job_store()
+
+
+class RouteStore:
+    """
+    SQLite-backed store of optimized routes: request payload, geocodes and route result per
+    route id, with a hash of the request payload.
+    
+    Payload, geocodes and result are stored as zlib-compressed JSON (a 100-stop route takes
+    about 10 KB instead of 85 KB). Every update increments the route version, so
+    background re-optimizations can detect that the route was changed in the meantime.
+    Routes not updated for ttl_days are deleted.
+    """
+
+    def __init__(self, path, ttl_days):
+        self.path = path
+        self.ttl_days = ttl_days
+        self._lock = threading.Lock()
+        self._connection = _connect_sqlite(path)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS routes ('
+            ' route_id TEXT PRIMARY KEY,'
+            ' version INTEGER NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' updated_at REAL NOT NULL,'
+            ' payload BLOB NOT NULL,'
+            ' geocodes BLOB NOT NULL,'
+            ' result BLOB NOT NULL,'
+            ' request_hash TEXT NOT NULL,'
+            ' json_bytes INTEGER NOT NULL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS routes_updated_at ON routes (updated_at)')
+
+    @staticmethod
+    def request_hash(payload):
+        """SHA-256 of the canonical JSON of a request payload."""
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _encode(payload, result):
+        """Compressed (payload, geocodes, result) columns and their total JSON size."""
+        geocodes = {
+            address: [location['latitude'], location['longitude']]
+            for address, location in result.get('address_coordinates', {}).items()
+        }
+        documents = [app.json.dumps(value).encode('utf-8') for value in (payload, geocodes, result)]
+        return [zlib.compress(document, 9) for document in documents], sum(len(document) for document in documents)
+
+    @staticmethod
+    def _decode(value):
+        return json.loads(zlib.decompress(value))
+
+    def create(self, payload, result):
+        """Store a new route and return its id."""
+        route_id = uuid.uuid4().hex
+        now = time.time()
+        (payload_blob, geocodes_blob, result_blob), json_bytes = self._encode(payload, result)
+        with self._lock:
+            self._connection.execute(
+                'INSERT INTO routes (route_id, version, created_at, updated_at, payload, result, geocodes, request_hash, json_bytes) '
+                'VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?)',
+                (route_id, now, now, payload_blob, result_blob, geocodes_blob, self.request_hash(payload), json_bytes)
+            )
+            self._connection.execute('DELETE FROM routes WHERE updated_at < ?', (now - self.ttl_days * 86400,))
+        return route_id
+
+    def update(self, route_id, payload, result, expected_version=None):
+        """
+        Replace the payload and result of a route.
+        
+        Args:
+            expected_version: Only update if the route still has this version
+        
+        Returns:
+            The new version, or None if the route is unknown or was changed since expected_version
+        """
+        (payload_blob, geocodes_blob, result_blob), json_bytes = self._encode(payload, result)
+        with self._lock:
+            row = self._connection.execute('SELECT version FROM routes WHERE route_id = ?', (route_id,)).fetchone()
+            if row is None or (expected_version is not None and row[0] != expected_version):
+                return None
+            self._connection.execute(
+                'UPDATE routes SET version = ?, updated_at = ?, payload = ?, result = ?, geocodes = ?, request_hash = ?, json_bytes = ? '
+                'WHERE route_id = ?',
+                (row[0] + 1, time.time(), payload_blob, result_blob, geocodes_blob, self.request_hash(payload), json_bytes, route_id)
+            )
+        return row[0] + 1
+
+    def get(self, route_id):
+        """
+        Return the route as a dictionary (route_id, version, created_at, updated_at,
+        request_hash, payload, geocodes, result), or None if unknown or expired.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT version, created_at, updated_at, request_hash, payload, geocodes, result FROM routes '
+                'WHERE route_id = ? AND updated_at >= ?',
+                (route_id, time.time() - self.ttl_days * 86400)
+            ).fetchone()
+        if row is None:
+            return None
+        version, created_at, updated_at, request_hash, payload, geocodes, result = row
+        
+        def format_timestamp(value):
+            return datetime.fromtimestamp(value, pytz.UTC).replace(microsecond=0).isoformat().replace('+00:00', 'Z')
+        
+        return {
+            'route_id': route_id,
+            'version': version,
+            'created_at': format_timestamp(created_at),
+            'updated_at': format_timestamp(updated_at),
+            'request_hash': request_hash,
+            'payload': self._decode(payload),
+            'geocodes': self._decode(geocodes),
+            'result': self._decode(result)
+        }
+
+    def stats(self):
+        with self._lock:
+            routes, stored_bytes, json_bytes = self._connection.execute(
+                'SELECT COUNT(*), SUM(LENGTH(payload) + LENGTH(geocodes) + LENGTH(result)), SUM(json_bytes) FROM routes'
+            ).fetchone()
+        return {
+            'routes': routes,
+            'ttl_days': self.ttl_days,
+            'stored_bytes': stored_bytes or 0,
+            'json_bytes': json_bytes or 0
+        }
+
+
+def store_route(payload, result):
+    """
+    Save an optimization result in the route store.
+    
+    Returns:
+        Route id, or None if the route store is disabled or the route could not be stored
+    """
+    if not route_store:
+        return None
+    try:
+        with performance_stage('route_store'):
+            return route_store.create(payload, result)
+    except Exception as e:
+        logger.warning(f"Failed to store optimized route: {str(e)}")
+        return None
+
+
+def run_and_store_optimization(data):
+    """run_optimization() for background jobs; the result is saved in the route store."""
+    result = run_optimization(data)
+    if result:
+        result.pop('response_cache', None)
+        route_id = store_route(data, result)
+        if route_id:
+            result['route_id'] = route_id
+    return result
+
+
+def _create_route_store():
+    if not ROUTE_STORE_PATH:
+        logger.info("Route store disabled (ROUTE_STORE_PATH is empty)")
+        return None
+    try:
+        return RouteStore(ROUTE_STORE_PATH, ROUTE_STORE_TTL_DAYS)
+    except Exception as e:
+        logger.error(f"Failed to open route store at {ROUTE_STORE_PATH}: {str(e)}")
+        return None
+
+
+route_store = _create_route_store()
+
+# Bounded background executors; worker threads start on first submit (after gunicorn forks).
+# Long-polling batch operations get their own pool so they cannot starve regular jobs.
+job_executor = ThreadPoolExecutor(max_workers=JOB_MAX_WORKERS, thread_name_prefix='optimization-job')
+batch_operation_executor = ThreadPoolExecutor(max_workers=ROUTE_BATCH_MAX_WORKERS, thread_name_prefix='batch-operation')
+_pending_jobs = 0
+_pending_jobs_lock = threading.Lock()
+
+
+def submit_optimization_job(func, *args, executor=None):
+    """
+    Run func(*args) on the background job executor (or the given executor).
+    
+    Returns:
+        Job id, or None if JOB_MAX_PENDING jobs are already queued or running in this worker
+    """
+    global _pending_jobs
+    if job_store is None:
+        raise Exception("Job store is not available")
+    
+    with _pending_jobs_lock:
+        if _pending_jobs >= JOB_MAX_PENDING:
+            return None
+        _pending_jobs += 1
+    
+    job_id = uuid.uuid4().hex
+    try:
+        job_store.create(job_id)
+        (executor or job_executor).submit(_run_optimization_job, job_id, func, args)
+    except Exception:
+        with _pending_jobs_lock:
+            _pending_jobs -= 1
+        raise
+    
+    logger.info(f"Queued optimization job {job_id}")
+    return job_id
+
+
+def _run_optimization_job(job_id, func, args):
+    global _pending_jobs
+    performance = PerformanceTracker()
+    performance_token = _current_performance.set(performance)
+    try:
+        job_store.update(job_id, 'running')
+        logger.info(f"Running optimization job {job_id}")
+        result = func(*args)
+        if result:
+            result.pop('response_cache', None)
+            result['performance'] = performance.as_dict()
+            job_store.update(job_id, 'succeeded', result=result)
+        else:
+            job_store.update(job_id, 'failed', error='Could not find optimal route')
+        logger.info(f"Optimization job {job_id} finished")
+    except Exception as e:
+        logger.error(f"Optimization job {job_id} failed: {str(e)}")
+        job_store.update(job_id, 'failed', error=str(e))
+    finally:
+        _current_performance.reset(performance_token)
+        with _pending_jobs_lock:
+            _pending_jobs -= 1
+
+
+def optimize_tours_request_key(request):
+    """
+    Canonical hash of an OptimizeToursRequest.
+    The request has no map fields, so its binary serialization is deterministic.
+    """
+    from google.maps import routeoptimization_v1 as ro
+    
+    return hashlib.sha256(ro.OptimizeToursRequest.serialize(request)).hexdigest()
+
+
+def geocode_address(address):
+    """
+    Convert address to coordinates using Google Geocoding API.
+    Results are served from the persistent geocoding cache when available.
+    """
+    if geocode_cache:
+        try:
+            cached = geocode_cache.get(address)
+        except Exception as e:
+            logger.warning(f"Geocoding cache lookup failed for {address}: {str(e)}")
+            cached = None
+        if cached:
+            logger.info(f"Geocoding cache hit: {address} -> {cached[0]}, {cached[1]}")
+            count_cache('geocode', 'hit')
+            return cached
+        count_cache('geocode', 'miss')
+
+    try:
+        url = f"{GOOGLE_MAPS_BASE_URL}/maps/api/geocode/json"
+        params = {
+            'address': address,
+            'key': GOOGLE_MAPS_API_KEY
+        }
+        
+        logger.info(f"Geocoding address: {address}")
+        with track_external_call('geocoding'):
+            response = http_session.get(url, params=params)
+        
+        if response.status_code == 200:
+            data = response.json()
+            if data['status'] == 'OK' and data['results']:
+                location = data['results'][0]['geometry']['location']
+                logger.info(f"Geocoded successfully: {address} -> {location['lat']}, {location['lng']}")
+                if geocode_cache:
+                    try:
+                        geocode_cache.set(address, location['lat'], location['lng'])
+                    except Exception as e:
+                        logger.warning(f"Failed to store geocode for {address}: {str(e)}")
+                return location['lat'], location['lng']
+            else:
+                logger.error(f"Geocoding API returned status: {data.get('status', 'UNKNOWN')} for address: {address}")
+        else:
+            logger.error(f"Geocoding API request failed with status {response.status_code} for address: {address}")
+        
+        return None, None
+        
+    except Exception as e:
+        logger.error(f"Geocoding error for {address}: {str(e)}")
+        return None, None
+
+
+def geocode_addresses(addresses, known_coordinates=None):
+    """
+    Geocode a list of addresses concurrently with a bounded worker pool.
+    Identical address strings are only looked up once per call.
+    
+    Args:
+        addresses: List of address strings
+        known_coordinates: Optional dict {address: (lat, lng)} of already geocoded addresses
+    
+    Returns:
+        List of (lat, lng) tuples in the same order as the input addresses
+    
+    Raises:
+        Exception if any address cannot be geocoded (remaining lookups are cancelled)
+    """
+    results = dict(known_coordinates or {})
+    unique_addresses = [address for address in dict.fromkeys(addresses) if address not in results]
+    
+    if len(unique_addresses) <= 1 or GEOCODING_MAX_WORKERS <= 1:
+        for address in unique_addresses:
+            lat, lng = geocode_address(address)
+            if lat is None or lng is None:
+                raise Exception(f"Failed to geocode address: {address}")
+            results[address] = (lat, lng)
+    else:
+        workers = min(GEOCODING_MAX_WORKERS, len(unique_addresses))
+        logger.info(f"Geocoding {len(unique_addresses)} unique addresses ({len(addresses)} total) with {workers} workers")
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='geocode')
+        try:
+            futures = {submit_with_context(executor, geocode_address, address): address for address in unique_addresses}
+            for future in as_completed(futures):
+                address = futures[future]
+                lat, lng = future.result()
+                if lat is None or lng is None:
+                    raise Exception(f"Failed to geocode address: {address}")
+                results[address] = (lat, lng)
+        finally:
+            # Fail fast: don't wait for (or start) lookups that are still queued
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    return [results[address] for address in addresses]
+
+
+def geocode_address_set(addresses):
+    """
+    Geocode the distinct addresses of a list without failing fast.
+    Used by batch optimization, where one bad address must only fail its own route.
+    
+    Args:
+        addresses: List of address strings (duplicates are looked up once)
+    
+    Returns:
+        Tuple (coordinates, failed) of a dict {address: (lat, lng)} and a set of addresses that could not be geocoded
+    """
+    unique_addresses = list(dict.fromkeys(addresses))
+    coordinates = {}
+    failed = set()
+    if not unique_addresses:
+        return coordinates, failed
+    
+    workers = max(1, min(GEOCODING_MAX_WORKERS, len(unique_addresses)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='geocode') as executor:
+        futures = {submit_with_context(executor, geocode_address, address): address for address in unique_addresses}
+        for future in as_completed(futures):
+            address = futures[future]
+            lat, lng = future.result()
+            if lat is None or lng is None:
+                failed.add(address)
+            else:
+                coordinates[address] = (lat, lng)
+    
+    return coordinates, failed
+
+
+def _create_time_window(window_config):
+    """
+    Create a time window configuration for Google Route Optimization API.
+    Supports both hard and soft time windows.
+    
+    Args:
+        window_config: Dictionary containing time window configuration:
+            - soft_start_time: ISO string for soft start time
+            - soft_end_time: ISO string for soft end time  
+            - hard_start_time: ISO string for hard start time
+            - hard_end_time: ISO string for hard end time
+            - cost_per_hour_before: Cost per hour for arriving before soft start
+            - cost_per_hour_after: Cost per hour for arriving after soft end
+    
+    Returns:
+        Dictionary containing time window configuration for API request
+    """
+    time_window = {}
+    
+    # Hard time windows (strict constraints)
+    if window_config.get('hard_start_time'):
+        time_window['start_time'] = window_config['hard_start_time']
+    if window_config.get('hard_end_time'):
+        time_window['end_time'] = window_config['hard_end_time']
+    
+    # Soft time windows (flexible constraints with costs) - Python API uses snake_case
+    if window_config.get('soft_start_time'):
+        time_window['soft_start_time'] = window_config['soft_start_time']
+        if window_config.get('cost_per_hour_before'):
+            time_window['cost_per_hour_before_soft_start_time'] = window_config['cost_per_hour_before']
+    
+    if window_config.get('soft_end_time'):
+        time_window['soft_end_time'] = window_config['soft_end_time']
+        if window_config.get('cost_per_hour_after'):
+            time_window['cost_per_hour_after_soft_end_time'] = window_config['cost_per_hour_after']
+    
+    return time_window
+
+
+def create_priority_time_windows(addresses, priority_addresses_config, base_start_time, route_end_time=None):
+    """
+    Create time windows configuration for priority addresses using percentage-based windows.
+    
+    Args:
+        addresses: List of all addresses
+        priority_addresses_config: List of priority address configurations
+        base_start_time: Base start time for route (datetime object)
+        route_end_time: Optional end time for route (datetime object). If not provided, defaults to 8 hours from start.
+    
+    Returns:
+        Dictionary containing time windows configuration for priority addresses
+    """
+    if not priority_addresses_config:
+        return None
+    
+    time_windows = []
+    
+    for priority_config in priority_addresses_config:
+        priority_address = priority_config.get('address')
+        priority_level = priority_config.get('priority_level', 'medium')
+        preferred_time_window = priority_config.get('preferred_time_window', 'early')
+        
+        # Find the index of the priority address in the addresses list
+        address_index = None
+        for i, addr in enumerate(addresses):
+            if addr == priority_address:
+                address_index = i
+                break
         
-        print(f"DEBUG: TSP solution found with total distance: {route_distance}")
-        print(f"DEBUG: Optimized route indices: {optimized_indices}")
+        if address_index is None:
+            logger.warning(f"Priority address not found in addresses list: {priority_address}")
+            continue
         
-        return optimized_indices, route_distance
-    else:
-        print("ERROR: No solution found for TSP")
-        return None, 0
+        # Skip if it's start or end point (they are already fixed)
+        if address_index == 0 or address_index == len(addresses) - 1:
+            logger.warning(f"Cannot prioritize start or end point: {priority_address}")
+            continue
+        
+        # Calculate total route duration - use provided end_time or default to 8 hours
+        if route_end_time:
+            total_route_duration = route_end_time - base_start_time
+        else:
+            # Fallback: standard 8-hour working day
+            total_route_duration = timedelta(hours=8)
+        
+        # Create time window based on percentage of total route duration
+        if preferred_time_window == 'earliest':
+            # critical_high: First 25% of route duration
+            soft_start_time = base_start_time
+            soft_end_time = base_start_time + (total_route_duration * 0.25)
+        elif preferred_time_window == 'early':
+            # high: First 50% of route duration
+            soft_start_time = base_start_time
+            soft_end_time = base_start_time + (total_route_duration * 0.50)
+        elif preferred_time_window == 'middle':
+            # medium: Middle 50% of route duration (25%-75%)
+            soft_start_time = base_start_time + (total_route_duration * 0.25)
+            soft_end_time = base_start_time + (total_route_duration * 0.75)
+        elif preferred_time_window == 'late':
+            # low: Second 50% of route duration (50%-100%)
+            soft_start_time = base_start_time + (total_route_duration * 0.50)
+            soft_end_time = base_start_time + total_route_duration
+        else:  # latest
+            # critical_low: Last 25% of route duration (75%-100%)
+            soft_start_time = base_start_time + (total_route_duration * 0.75)
+            soft_end_time = base_start_time + total_route_duration
+        
+        # Set costs based on priority level according to priority mapping (balanced penalties)
+        if priority_level == 'critical_high':
+            cost_per_hour_before = 0.05  # Very low cost for early arrival
+            cost_per_hour_after = 500.0  # High penalty for late arrival (reduced from 1000)
+        elif priority_level == 'high':
+            cost_per_hour_before = 0.1   # Ultra low cost for early arrival
+            cost_per_hour_after = 50.0   # Moderate penalty for late arrival (reduced from 500)
+        elif priority_level == 'medium':
+            cost_per_hour_before = 1.0   # Low cost for early arrival 
+            cost_per_hour_after = 100.0  # Medium penalty for late arrival (unchanged)
+        elif priority_level == 'low':
+            cost_per_hour_before = 2.0   # Medium cost for early arrival
+            cost_per_hour_after = 25.0   # Low penalty for late arrival (reduced from 200)
+        else:  # critical_low
+            cost_per_hour_before = 5.0   # Higher cost for early arrival
+            cost_per_hour_after = 10.0   # Minimal penalty for late arrival (reduced from 100)
+        
+        time_window_config = {
+            'address_index': address_index,
+            'soft_start_time': soft_start_time.replace(microsecond=0).isoformat().replace('+00:00', 'Z'),
+            'soft_end_time': soft_end_time.replace(microsecond=0).isoformat().replace('+00:00', 'Z'),
+            'cost_per_hour_before': cost_per_hour_before,
+            'cost_per_hour_after': cost_per_hour_after
+        }
+        
+        time_windows.append(time_window_config)
+        # Calculate percentage info for logging
+        window_start_pct = ((soft_start_time - base_start_time) / total_route_duration * 100) if total_route_duration.total_seconds() > 0 else 0
+        window_end_pct = ((soft_end_time - base_start_time) / total_route_duration * 100) if total_route_duration.total_seconds() > 0 else 100
+        
+        logger.info(f"Created priority time window for {priority_address} (index {address_index}): {preferred_time_window} priority with level {priority_level}")
+        logger.info(f"  Window: {soft_start_time.strftime('%H:%M')}-{soft_end_time.strftime('%H:%M')} ({window_start_pct:.0f}%-{window_end_pct:.0f}% of route)")
+    
+    return {
+        'enabled': True,
+        'windows': time_windows
+    }
 
-def get_optimized_route_details(optimized_addresses):
-    # Use the classic Directions API instead of Routes API v2 for better compatibility
-    url = 'https://maps.googleapis.com/maps/api/directions/json'
+
+@dataclass(frozen=True)
+class RouteModel:
+    """
+    Prepared, immutable input for the Route Optimization API.
+    Holds everything that does not depend on time windows (geocodes, timing,
+    cost parameters, vehicle and base shipments) so it can be solved several times.
+    """
+    addresses: tuple
+    coordinates: tuple
+    start_time: datetime
+    end_time: datetime
+    optimization_objective: str
+    cost_per_kilometer: float
+    cost_per_hour: float
+    service_time_minutes: float
+    custom_start_time_used: bool
+    vehicle: dict
+    shipments: tuple
+
+    @property
+    def start_time_str(self):
+        return self.start_time.replace(microsecond=0).isoformat().replace('+00:00', 'Z')
+
+    @property
+    def end_time_str(self):
+        return self.end_time.replace(microsecond=0).isoformat().replace('+00:00', 'Z')
+
+    def coordinates_dict(self):
+        """Return a fresh address -> coordinates mapping for API responses."""
+        return {
+            address: {'latitude': lat, 'longitude': lng}
+            for address, (lat, lng) in zip(self.addresses, self.coordinates)
+        }
+
+
+def prepare_route_model(addresses, start_time_config=None, objective_config=None, service_time_minutes=3, known_coordinates=None):
+    """
+    Geocode addresses and build the reusable parts of an optimization request.
     
-    if len(optimized_addresses) < 2:
-        raise Exception("Need at least 2 addresses for route calculation")
+    Args:
+        addresses: List of addresses (first = start point, last = end point)
+        start_time_config: Optional custom start time in ISO format.
+                          If not provided, defaults to 23:00 today.
+        objective_config: Optional optimization objective ('minimize_time', 'minimize_distance', 'minimize_cost').
+        service_time_minutes: Service time per stop in minutes
+        known_coordinates: Optional dict {address: (lat, lng)} that skips geocoding for those addresses
     
-    origin = optimized_addresses[0]
-    destination = optimized_addresses[-1]
-    intermediates = optimized_addresses[1:-1]
+    Returns:
+        RouteModel instance
     
-    params = {
-        'origin': origin,
-        'destination': destination,
-        'mode': 'driving',
-        'language': 'en',
-        'avoid': 'tolls',
-        'key': GOOGLE_MAPS_API_KEY
-    }
+    Raises:
+        Exception on invalid start time / objective or geocoding failure
+    """
+    # Calculate start and end times
+    if start_time_config:
+        # Parse custom start time
+        try:
+            from dateutil.parser import parse
+            start_time = parse(start_time_config)
+            # Ensure timezone is UTC
+            if start_time.tzinfo is None:
+                start_time = start_time.replace(tzinfo=pytz.UTC)
+            else:
+                start_time = start_time.astimezone(pytz.UTC)
+            logger.info(f"Using custom start time: {start_time}")
+        except Exception as e:
+            logger.error(f"Invalid start_time format '{start_time_config}': {e}")
+            raise Exception(f"Invalid start_time format. Expected ISO format like '2024-12-21T08:00:00Z'")
+    else:
+        # Default behavior: start at 23:00 today
+        today = datetime.now(pytz.UTC)
+        start_time = today.replace(hour=23, minute=0, second=0, microsecond=0)
+        
+        # If current time is past 23:00, use tomorrow 23:00
+        if today.hour >= 23:
+            start_time = start_time + timedelta(days=1)
+        
+    # Set end time to 24 hours later
+    end_time = start_time + timedelta(hours=24)
     
-    # Add waypoints if there are intermediate addresses
-    if intermediates:
-        waypoints = '|'.join(intermediates)
-        params['waypoints'] = f'optimize:true|{waypoints}'
+    # Configure optimization objective
+    if objective_config:
+        if objective_config not in ['minimize_time', 'minimize_distance', 'minimize_cost']:
+            raise Exception(f"Invalid objective '{objective_config}'. Must be 'minimize_time', 'minimize_distance', or 'minimize_cost'")
+        optimization_objective = objective_config
+    else:
+        optimization_objective = 'minimize_time'  # Default
     
-    print("DEBUG: Directions API request URL:", url)
-    print("DEBUG: Directions API request params:", params)
+    logger.info(f"Optimization objective: {optimization_objective}")
     
-    response = requests.get(url, params=params)
-    print("DEBUG: Directions API response status:", response.status_code)
-    print("DEBUG: Directions API response text:", response.text[:500] + "..." if len(response.text) > 500 else response.text)
+    # Set cost parameters based on objective
+    if optimization_objective == 'minimize_distance':
+        cost_per_kilometer = 10.0  # High cost for distance
+        cost_per_hour = 0.1       # Low cost for time
+    elif optimization_objective == 'minimize_cost':
+        cost_per_kilometer = 5.0   # Medium cost for distance
+        cost_per_hour = 2.0       # Medium cost for time
+    else:  # minimize_time (default)
+        cost_per_kilometer = 1.0   # Low cost for distance
+        cost_per_hour = 10.0      # High cost for time
+    
+    logger.info(f"Cost parameters: {cost_per_kilometer}/km, {cost_per_hour}/hour")
+    
+    # Geocode all addresses to get coordinates
+    logger.info("Geocoding addresses to coordinates...")
+    with performance_stage('geocoding'):
+        coordinates = geocode_addresses(addresses, known_coordinates)
+    
+    # Get start and end coordinates
+    start_lat, start_lng = coordinates[0]  # First address is start point
+    end_lat, end_lng = coordinates[-1]     # Last address is end point
+    
+    # Create shipments for each address (except the first and last which are start/end points)
+    # Each shipment represents a visit to the location (pickup only) with configurable service time
+    shipments = []
+    for lat, lng in coordinates[1:-1]:  # Customer addresses only
+        shipments.append({
+            "arrival_location": {
+                "latitude": lat,
+                "longitude": lng
+            },
+            "duration": f"{service_time_minutes * 60}s"  # Configurable service time per stop
+        })
+    
+    # Create vehicle with separate start and end locations
+    vehicle = {
+        "start_location": {
+            "latitude": start_lat,
+            "longitude": start_lng
+        },
+        "end_location": {
+            "latitude": end_lat,
+            "longitude": end_lng
+        },
+        "cost_per_kilometer": cost_per_kilometer
+    }
+    
+    return RouteModel(
+        addresses=tuple(addresses),
+        coordinates=tuple(coordinates),
+        start_time=start_time,
+        end_time=end_time,
+        optimization_objective=optimization_objective,
+        cost_per_kilometer=cost_per_kilometer,
+        cost_per_hour=cost_per_hour,
+        service_time_minutes=service_time_minutes,
+        custom_start_time_used=bool(start_time_config),
+        vehicle=vehicle,
+        shipments=tuple(shipments)
+    )
 
-    if response.status_code != 200:
-        raise Exception(f"Google API Error (Directions): Status {response.status_code}, Response: {response.text}")
 
-    try:
-        result = response.json()
-    except ValueError:  # json.JSONDecodeError is a subclass of ValueError
-        raise Exception(f"Failed to decode JSON from Google API (Directions). Response: {response.text}")
+def build_optimize_tours_request(route_model, time_windows_config=None):
+    """
+    Build the OptimizeToursRequest for a prepared route model.
+    Time windows are applied to copies of the base shipments; the model itself is not modified.
+    """
+    from google.maps import routeoptimization_v1 as ro
+    
+    shipments = []
+    for i, base_pickup in enumerate(route_model.shipments, 1):  # i is the original address index
+        pickup_request = dict(base_pickup)
+        
+        # Add time windows if configured
+        if time_windows_config and time_windows_config.get('enabled', False):
+            time_windows = time_windows_config.get('windows', [])
+            # Find time window for this address
+            # i is 1-based customer index, original address index is i (since customers start from index 1)
+            original_address_index = i  # Customer index in original addresses array
+            for window in time_windows:
+                window_address_index = window.get('address_index')
+                if window_address_index == original_address_index:
+                    pickup_request["time_windows"] = [_create_time_window(window)]
+                    logger.info(f"Applied time window to customer address {original_address_index} (customer #{i}): {window}")
+                    break
+        
+        shipment = {
+            "pickups": [pickup_request]
+            # No deliveries - just visit the location
+        }
+        shipments.append(shipment)
+    
+    # Create the optimization request with calculated times (Python API uses snake_case)
+    return ro.OptimizeToursRequest(
+        parent=f"projects/{GOOGLE_CLOUD_PROJECT_ID}",
+        model={
+            "shipments": shipments,
+            "vehicles": [dict(route_model.vehicle)],
+            "global_start_time": route_model.start_time_str,
+            "global_end_time": route_model.end_time_str
+        }
+    )
 
-    if result['status'] != 'OK':
-        raise Exception(f"Google Directions API returned error status: {result['status']}")
 
-    if 'routes' not in result or not result['routes']:
-        raise Exception("No routes found in the response")
-        
-    route = result['routes'][0]  # Get the first (and usually only) route
+def _apply_priority_time_windows(route_model, time_windows_config, priority_addresses_config, calculated_end_time=None):
+    """
+    Merge percentage-based priority windows into the time windows configuration.
     
-    total_distance = 0
-    total_duration = 0
+    Returns:
+        Time windows configuration (possibly None) to use for the request
+    """
+    if not priority_addresses_config:
+        return time_windows_config
     
-    for leg in route['legs']:
-        total_distance += leg['distance']['value']  # in meters
-        total_duration += leg['duration']['value']  # in seconds
-            
-    return {
-        'total_distance_meters': total_distance,
-        'total_duration_seconds': total_duration,
-        'total_distance_km': round(total_distance / 1000, 2),
-        'total_duration_minutes': round(total_duration / 60, 2),
-        'total_duration_hours': round(total_duration / 3600, 2),
-        'route_details': route
-    }
+    # Use calculated_end_time if provided (from two-stage optimization), otherwise use default end_time
+    route_end_time = calculated_end_time if calculated_end_time else route_model.end_time
+    logger.info(f"Using route end time for priority windows: {route_end_time}")
+    priority_time_windows = create_priority_time_windows(list(route_model.addresses), priority_addresses_config, route_model.start_time, route_end_time)
+    if priority_time_windows:
+        if time_windows_config:
+            # Merge with existing time windows
+            if 'windows' in time_windows_config:
+                time_windows_config['windows'].extend(priority_time_windows['windows'])
+            else:
+                time_windows_config['windows'] = priority_time_windows['windows']
+            time_windows_config['enabled'] = True
+        else:
+            # Use priority time windows as the main time windows config
+            time_windows_config = priority_time_windows
+        
+        logger.info(f"Applied priority time windows for {len(priority_addresses_config)} addresses")
+    
+    return time_windows_config
 
-def geocode_address(address):
+
+def solve_route_model(route_model, time_windows_config=None, priority_addresses_config=None, calculated_end_time=None, client=None, engine='remote'):
     """
-    Convert address to coordinates using Google Geocoding API.
+    Solve a prepared route model with the selected optimization engine.
+    
+    Args:
+        route_model: RouteModel from prepare_route_model()
+        time_windows_config: Optional configuration for time windows (see optimize_route_with_api)
+        priority_addresses_config: Optional configuration for priority addresses
+        calculated_end_time: Optional pre-calculated end time for two-stage optimization.
+                           If provided, used for percentage-based time window calculations.
+        client: Optional RouteOptimizationClient (defaults to the shared pool)
+        engine: 'remote' (Google Route Optimization API), 'local' (in-process OR-Tools) or
+                'auto' (remote with a short deadline, falling back to local on timeout or error)
+    
+    Returns:
+        Dictionary with the optimized route, or None if optimization failed
     """
+    time_windows_config = _apply_priority_time_windows(route_model, time_windows_config, priority_addresses_config, calculated_end_time)
+    
+    if engine == 'local':
+        return _solve_route_model_local(route_model, time_windows_config)
+    
+    if engine == 'auto':
+        result = _solve_route_model_remote(route_model, time_windows_config, client, timeout=AUTO_ENGINE_REMOTE_TIMEOUT_SECONDS)
+        if result:
+            return result
+        logger.warning("Remote optimization failed or timed out, falling back to local OR-Tools engine")
+        result = _solve_route_model_local(route_model, time_windows_config)
+        if result:
+            result['engine_fallback'] = True
+        return result
+    
+    return _solve_route_model_remote(route_model, time_windows_config, client)
+
+
+def _solve_route_model_remote(route_model, time_windows_config=None, client=None, timeout=None):
+    """Solve a prepared route model with the Google Route Optimization API."""
     try:
-        import urllib.parse
+        addresses = list(route_model.addresses)
+        logger.info(f"Route planning: Start at {route_model.start_time_str}, End by {route_model.end_time_str}")
         
-        url = "https://maps.googleapis.com/maps/api/geocode/json"
-        params = {
-            'address': address,
-            'key': GOOGLE_MAPS_API_KEY
-        }
+        with performance_stage('model_building'):
+            request = build_optimize_tours_request(route_model, time_windows_config)
         
-        logger.info(f"Geocoding address: {address}")
-        response = requests.get(url, params=params)
+        if client is None:
+            client = get_route_client()
         
-        if response.status_code == 200:
-            data = response.json()
-            if data['status'] == 'OK' and data['results']:
-                location = data['results'][0]['geometry']['location']
-                logger.info(f"Geocoded successfully: {address} -> {location['lat']}, {location['lng']}")
-                return location['lat'], location['lng']
-            else:
-                logger.error(f"Geocoding API returned status: {data.get('status', 'UNKNOWN')} for address: {address}")
+        # Identical request models (same stops, times, objective, windows) reuse a recent response
+        cache_key = optimize_tours_request_key(request)
+        response = route_response_cache.get(cache_key) if route_response_cache else None
+        if response is not None:
+            cache_status = 'HIT'
+            logger.info(f"Route Optimization response cache hit ({cache_key[:12]})")
         else:
-            logger.error(f"Geocoding API request failed with status {response.status_code} for address: {address}")
+            cache_status = 'MISS' if route_response_cache else 'BYPASS'
+            logger.info(f"Sending request to Route Optimization API for {len(addresses)} addresses")
+            with track_external_call('optimize_tours'):
+                response = client.optimize_tours(request=request, timeout=timeout or ROUTE_OPTIMIZATION_TIMEOUT_SECONDS)
+        if cache_status != 'BYPASS':
+            count_cache('route_response', cache_status.lower())
         
-        return None, None
+        if not response.routes:
+            logger.error("No routes found in optimization response")
+            return None
+        
+        if route_response_cache and cache_status == 'MISS':
+            route_response_cache.set(cache_key, response)
+        if cache_status != 'HIT':
+            record_observed_legs(route_model, response)
+        
+        with performance_stage('response_building'):
+            return build_remote_route_result(route_model, response, cache_status)
         
     except Exception as e:
-        logger.error(f"Geocoding error for {address}: {str(e)}")
-        return None, None
+        logger.error(f"Route Optimization API failed: {str(e)}")
+        import traceback
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return None
 
 
-def _create_time_window(window_config):
+def build_remote_route_result(route_model, response, cache_status='BYPASS'):
     """
-    Create a time window configuration for Google Route Optimization API.
-    Supports both hard and soft time windows.
+    Convert an OptimizeToursResponse for a route model into the API response schema
+    (optimized addresses, visit_schedule, timing and transition details).
+    
+    Args:
+        route_model: RouteModel the request was built from
+        response: ro.OptimizeToursResponse
+        cache_status: Response cache status reported to the client ('HIT', 'MISS' or 'BYPASS')
+    
+    Returns:
+        Dictionary with the optimized route
+    """
+    addresses = list(route_model.addresses)
+    service_time_minutes = route_model.service_time_minutes
+    optimization_objective = route_model.optimization_objective
+    cost_per_kilometer = route_model.cost_per_kilometer
+    cost_per_hour = route_model.cost_per_hour
+    start_time_str = route_model.start_time_str
+    end_time_str = route_model.end_time_str
+    coordinates_dict = route_model.coordinates_dict()  # Store coordinates for API response
+    
+    # Parse the response with detailed timing information
+    route = response.routes[0]
+    visits = route.visits
+    transitions = route.transitions if hasattr(route, 'transitions') else []
+    
+    # Build the optimized address list and timing details
+    optimized_addresses = [addresses[0]]  # Start with start point
+    route_indices = [0]  # Start with start point index
+    visit_schedule = []  # Detailed schedule with times
+    
+    # Add start point time
+    vehicle_start_time = route.vehicle_start_time if hasattr(route, 'vehicle_start_time') else start_time_str
+    visit_schedule.append({
+        'stop_number': 1,
+        'address': addresses[0],
+        'latitude': coordinates_dict[addresses[0]]['latitude'],
+        'longitude': coordinates_dict[addresses[0]]['longitude'],
+        'arrival_time': vehicle_start_time,
+        'service_duration_minutes': 0,
+        'wait_duration_minutes': 0,
+        'is_depot': addresses[0] == addresses[-1],  # True if start == end
+        'stop_type': 'Start'
+    })
+    
+    logger.info(f"Processing {len(visits)} visits from Route Optimization API")
+    
+    # Process each visit
+    for i, visit in enumerate(visits):
+        shipment_index = visit.shipment_index
+        address_index = shipment_index + 1  # +1 because customers start from index 1
+        
+        if address_index < len(addresses) - 1:  # Safety check (exclude end point)
+            optimized_addresses.append(addresses[address_index])
+            route_indices.append(address_index)
+            
+            # Extract timing information
+            arrival_time = visit.start_time if hasattr(visit, 'start_time') else None
+            visit_duration = service_time_minutes  # Configurable service time
+            
+            # Get transition info if available
+            wait_duration = 0
+            if i < len(transitions):
+                transition = transitions[i]
+                if hasattr(transition, 'wait_duration'):
+                    wait_duration = transition.wait_duration.seconds / 60 if transition.wait_duration.seconds else 0
+            
+            visit_schedule.append({
+                'stop_number': len(visit_schedule) + 1,
+                'address': addresses[address_index],
+                'latitude': coordinates_dict[addresses[address_index]]['latitude'],
+                'longitude': coordinates_dict[addresses[address_index]]['longitude'],
+                'arrival_time': arrival_time.isoformat().replace('+00:00', 'Z') if arrival_time else None,
+                'service_duration_minutes': visit_duration,
+                'wait_duration_minutes': round(wait_duration, 1),
+                'is_depot': False,
+                'stop_type': 'Customer Visit'
+            })
     
-    Args:
-        window_config: Dictionary containing time window configuration:
-            - soft_start_time: ISO string for soft start time
-            - soft_end_time: ISO string for soft end time  
-            - hard_start_time: ISO string for hard start time
-            - hard_end_time: ISO string for hard end time
-            - cost_per_hour_before: Cost per hour for arriving before soft start
-            - cost_per_hour_after: Cost per hour for arriving after soft end
+    # Add end point
+    end_point_index = len(addresses) - 1
+    optimized_addresses.append(addresses[end_point_index])
+    route_indices.append(end_point_index)
     
-    Returns:
-        Dictionary containing time window configuration for API request
-    """
-    time_window = {}
+    # Add final end point arrival
+    vehicle_end_time = route.vehicle_end_time if hasattr(route, 'vehicle_end_time') else end_time_str
+    visit_schedule.append({
+        'stop_number': len(visit_schedule) + 1,
+        'address': addresses[end_point_index],
+        'latitude': coordinates_dict[addresses[end_point_index]]['latitude'],
+        'longitude': coordinates_dict[addresses[end_point_index]]['longitude'],
+        'arrival_time': vehicle_end_time.isoformat().replace('+00:00', 'Z') if hasattr(vehicle_end_time, 'isoformat') else vehicle_end_time,
+        'service_duration_minutes': 0,
+        'wait_duration_minutes': 0,
+        'is_depot': addresses[0] == addresses[end_point_index],  # True if start == end
+        'stop_type': 'End Point'
+    })
     
-    # Hard time windows (strict constraints)
-    if window_config.get('hard_start_time'):
-        time_window['start_time'] = window_config['hard_start_time']
-    if window_config.get('hard_end_time'):
-        time_window['end_time'] = window_config['hard_end_time']
+    # Calculate metrics
+    total_duration = 0
+    total_distance = 0
+    if hasattr(route, 'metrics'):
+        total_duration = int(route.metrics.total_duration.total_seconds()) if hasattr(route.metrics, 'total_duration') else 0
+        total_distance = route.metrics.travel_distance_meters if hasattr(route.metrics, 'travel_distance_meters') else 0
     
-    # Soft time windows (flexible constraints with costs) - Python API uses snake_case
-    if window_config.get('soft_start_time'):
-        time_window['soft_start_time'] = window_config['soft_start_time']
-        if window_config.get('cost_per_hour_before'):
-            time_window['cost_per_hour_before_soft_start_time'] = window_config['cost_per_hour_before']
+    # Extract detailed transition information
+    transition_details = []
+    for i, transition in enumerate(transitions):
+        if hasattr(transition, 'travel_duration'):
+            transition_details.append({
+                'segment': i + 1,
+                'travel_duration_minutes': round(transition.travel_duration.seconds / 60, 1) if transition.travel_duration.seconds else 0,
+                'travel_distance_meters': transition.travel_distance_meters if hasattr(transition, 'travel_distance_meters') else 0,
+                'wait_duration_minutes': round(transition.wait_duration.seconds / 60, 1) if hasattr(transition, 'wait_duration') and transition.wait_duration.seconds else 0,
+                'start_time': transition.start_time.isoformat().replace('+00:00', 'Z') if hasattr(transition, 'start_time') and transition.start_time else None
+            })
     
-    if window_config.get('soft_end_time'):
-        time_window['soft_end_time'] = window_config['soft_end_time']
-        if window_config.get('cost_per_hour_after'):
-            time_window['cost_per_hour_after_soft_end_time'] = window_config['cost_per_hour_after']
+    logger.info(f"Route Optimization API completed successfully")
+    logger.info(f"Optimized route indices: {route_indices}")
+    logger.info(f"Total duration: {total_duration} seconds ({round(total_duration/60, 2)} minutes)")
+    logger.info(f"Vehicle starts at: {vehicle_start_time}")
+    logger.info(f"Vehicle ends at: {vehicle_end_time}")
     
-    return time_window
+    return {
+        'success': True,
+        'message': f'Route optimization completed successfully using Google Route Optimization API with objective: {optimization_objective}',
+        'algorithm': 'Google Route Optimization API',
+        'engine': 'remote',
+        'response_cache': cache_status,
+        'optimization_objective': optimization_objective,
+        'original_addresses': addresses,
+        'optimized_addresses': optimized_addresses,
+        'route_indices': route_indices,
+        'address_coordinates': coordinates_dict,
+        'timing_info': {
+            'vehicle_start_time': vehicle_start_time.isoformat().replace('+00:00', 'Z') if hasattr(vehicle_start_time, 'isoformat') else vehicle_start_time,
+            'vehicle_end_time': vehicle_end_time.isoformat().replace('+00:00', 'Z') if hasattr(vehicle_end_time, 'isoformat') else vehicle_end_time,
+            'total_duration_seconds': total_duration,
+            'total_duration_minutes': round(total_duration / 60, 1),
+            'total_duration_hours': round(total_duration / 3600, 2),
+            'service_time_per_stop_minutes': service_time_minutes,
+            'custom_start_time_used': route_model.custom_start_time_used
+        },
+        'visit_schedule': visit_schedule,
+        'transition_details': transition_details,
+        'optimization_info': {
+            'addresses_count': len(addresses),
+            'total_distance_meters': total_distance,
+            'total_distance_km': round(total_distance / 1000, 2) if total_distance else 0,
+            'total_time_seconds': total_duration,
+            'total_time_minutes': round(total_duration / 60, 1),
+            'total_time_hours': round(total_duration / 3600, 2),
+            'cost_per_kilometer': cost_per_kilometer,
+            'cost_per_hour': cost_per_hour
+        }
+    }
 
 
-def create_priority_time_windows(addresses, priority_addresses_config, base_start_time, route_end_time=None):
+def _local_travel_matrices(coordinates, source=None, departure_hour=None):
     """
-    Create time windows configuration for priority addresses using percentage-based windows.
+    TravelMatrix between coordinates for the local engine.
+    Cached per coordinate tuple and calibration version, so both stages of
+    two_stage_optimization share one build and newly observed legs take effect.
     
     Args:
-        addresses: List of all addresses
-        priority_addresses_config: List of priority address configurations
-        base_start_time: Base start time for route (datetime object)
-        route_end_time: Optional end time for route (datetime object). If not provided, defaults to 8 hours from start.
+        coordinates: Tuple of (lat, lng) tuples
+        source: 'haversine' (default, no API calls) or 'distance_matrix' (Distance Matrix API)
+        departure_hour: Optional UTC hour the route starts, for hour-specific calibration
     
     Returns:
-        Dictionary containing time windows configuration for priority addresses
+        Tuple (travel_matrix, calibrated) where calibrated tells whether observed legs from
+        TravelCalibrationStore adjusted the matrix
     """
-    if not priority_addresses_config:
-        return None
-    
-    time_windows = []
+    source = source or LOCAL_MATRIX_SOURCE
+    calibration_version = None
+    if travel_calibration and source != 'distance_matrix':
+        try:
+            calibration_version = travel_calibration.version()
+        except Exception as e:
+            logger.warning(f"Travel time calibration unavailable, using default factors: {str(e)}")
+    return _cached_local_travel_matrices(coordinates, source, departure_hour, calibration_version)
+
+
+@functools.lru_cache(maxsize=16)
+def _cached_local_travel_matrices(coordinates, source, departure_hour, calibration_version):
+    """Build the matrix of _local_travel_matrices (calibration_version None: uncalibrated)."""
+    if source == 'distance_matrix':
+        locations = [f"{lat},{lng}" for lat, lng in coordinates]
+        return create_distance_matrix(locations, coordinates=coordinates), False
+    if calibration_version:
+        try:
+            circuity_factors, speed_factors, calibrated = travel_calibration.factors(coordinates, departure_hour)
+            if calibrated:
+                return build_haversine_matrix(coordinates, circuity_factors, speed_factor=speed_factors), True
+        except Exception as e:
+            logger.warning(f"Travel time calibration unavailable, using default factors: {str(e)}")
+    return build_haversine_matrix(coordinates), False
+
+
+def _solve_route_model_local(route_model, time_windows_config=None):
+    """
+    Solve a prepared route model in-process with OR-Tools.
     
-    for priority_config in priority_addresses_config:
-        priority_address = priority_config.get('address')
-        priority_level = priority_config.get('priority_level', 'medium')
-        preferred_time_window = priority_config.get('preferred_time_window', 'early')
+    Mirrors the Route Optimization API cost model (cost_per_hour, cost_per_kilometer and
+    soft time window penalties) and returns the same response schema as the remote engine.
+    """
+    try:
+        addresses = list(route_model.addresses)
+        num_addresses = len(addresses)
+        service_time_minutes = route_model.service_time_minutes
+        service_seconds = int(service_time_minutes * 60)
         
-        # Find the index of the priority address in the addresses list
-        address_index = None
-        for i, addr in enumerate(addresses):
-            if addr == priority_address:
-                address_index = i
-                break
+        logger.info(f"Solving route locally with OR-Tools for {num_addresses} addresses")
+        with performance_stage('local_matrix'):
+            travel_matrix, _ = _local_travel_matrices(route_model.coordinates, departure_hour=route_model.start_time.astimezone(pytz.UTC).hour)
         
-        if address_index is None:
-            logger.warning(f"Priority address not found in addresses list: {priority_address}")
-            continue
+        # Arc cost in "cost units per hour" so that window penalties (cost per hour) stay integral
+        cost_matrix = travel_matrix.cost_matrix(route_model.cost_per_hour, route_model.cost_per_kilometer)
         
-        # Skip if it's start or end point (they are already fixed)
-        if address_index == 0 or address_index == len(addresses) - 1:
-            logger.warning(f"Cannot prioritize start or end point: {priority_address}")
-            continue
+        # Service time applies to customer stops only
+        service_times = [0] + [service_seconds] * (num_addresses - 2) + [0]
         
-        # Calculate total route duration - use provided end_time or default to 8 hours
-        if route_end_time:
-            total_route_duration = route_end_time - base_start_time
-        else:
-            # Fallback: standard 8-hour working day
-            total_route_duration = timedelta(hours=8)
+        soft_time_windows = []
+        if time_windows_config and time_windows_config.get('enabled', False):
+            from dateutil.parser import parse
+            for window in time_windows_config.get('windows', []):
+                node = window.get('address_index')
+                if node is None or node <= 0 or node >= num_addresses - 1:
+                    continue
+                window_start = window.get('soft_start_time') or window.get('hard_start_time')
+                window_end = window.get('soft_end_time') or window.get('hard_end_time')
+                soft_time_windows.append({
+                    'node': node,
+                    'start': (parse(window_start) - route_model.start_time).total_seconds() if window_start else 0,
+                    'end': (parse(window_end) - route_model.start_time).total_seconds() if window_end else 7 * 24 * 3600,
+                    # Hard windows are approximated by a steep penalty
+                    'cost_before': round(window.get('cost_per_hour_before') or (0 if window.get('soft_start_time') else 10000)),
+                    'cost_after': round(window.get('cost_per_hour_after') or (0 if window.get('soft_end_time') else 10000))
+                })
         
-        # Create time window based on percentage of total route duration
-        if preferred_time_window == 'earliest':
-            # critical_high: First 25% of route duration
-            soft_start_time = base_start_time
-            soft_end_time = base_start_time + (total_route_duration * 0.25)
-        elif preferred_time_window == 'early':
-            # high: First 50% of route duration
-            soft_start_time = base_start_time
-            soft_end_time = base_start_time + (total_route_duration * 0.50)
-        elif preferred_time_window == 'middle':
-            # medium: Middle 50% of route duration (25%-75%)
-            soft_start_time = base_start_time + (total_route_duration * 0.25)
-            soft_end_time = base_start_time + (total_route_duration * 0.75)
-        elif preferred_time_window == 'late':
-            # low: Second 50% of route duration (50%-100%)
-            soft_start_time = base_start_time + (total_route_duration * 0.50)
-            soft_end_time = base_start_time + total_route_duration
-        else:  # latest
-            # critical_low: Last 25% of route duration (75%-100%)
-            soft_start_time = base_start_time + (total_route_duration * 0.75)
-            soft_end_time = base_start_time + total_route_duration
+        with performance_stage('local_solve'):
+            route_indices, route_cost = solve_tsp(
+                cost_matrix,
+                start_index=0,
+                end_index=num_addresses - 1,
+                time_matrix=travel_matrix,
+                service_times=service_times,
+                soft_time_windows=soft_time_windows,
+                time_limit_seconds=min(LOCAL_SOLVER_TIME_LIMIT_SECONDS, LOCAL_SOLVER_SECONDS_PER_ADDRESS * num_addresses),
+                guided_local_search=num_addresses > LOCAL_SOLVER_GLS_MIN_ADDRESSES
+            )
+        if route_indices is None:
+            logger.error("Local OR-Tools engine found no solution")
+            return None
         
-        # Set costs based on priority level according to priority mapping (balanced penalties)
-        if priority_level == 'critical_high':
-            cost_per_hour_before = 0.05  # Very low cost for early arrival
-            cost_per_hour_after = 500.0  # High penalty for late arrival (reduced from 1000)
-        elif priority_level == 'high':
-            cost_per_hour_before = 0.1   # Ultra low cost for early arrival
-            cost_per_hour_after = 50.0   # Moderate penalty for late arrival (reduced from 500)
-        elif priority_level == 'medium':
-            cost_per_hour_before = 1.0   # Low cost for early arrival 
-            cost_per_hour_after = 100.0  # Medium penalty for late arrival (unchanged)
-        elif priority_level == 'low':
-            cost_per_hour_before = 2.0   # Medium cost for early arrival
-            cost_per_hour_after = 25.0   # Low penalty for late arrival (reduced from 200)
-        else:  # critical_low
-            cost_per_hour_before = 5.0   # Higher cost for early arrival
-            cost_per_hour_after = 10.0   # Minimal penalty for late arrival (reduced from 100)
+        with performance_stage('response_building'):
+            return _build_local_route_result(route_model, route_indices, travel_matrix)
+    
+    except Exception as e:
+        logger.error(f"Local route optimization failed: {str(e)}")
+        import traceback
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return None
+
+
+def _build_local_route_result(route_model, route_indices, travel_matrix):
+    """Build the standard route response for a locally computed visiting order."""
+    addresses = list(route_model.addresses)
+    coordinates_dict = route_model.coordinates_dict()
+    service_time_minutes = route_model.service_time_minutes
+    service_seconds = int(service_time_minutes * 60)
+    end_point_index = len(addresses) - 1
+    
+    def format_time(value):
+        return value.replace(microsecond=0).isoformat().replace('+00:00', 'Z')
+    
+    visit_schedule = []
+    transition_details = []
+    current_time = route_model.start_time
+    total_distance = 0
+    
+    for position, address_index in enumerate(route_indices):
+        if position > 0:
+            previous_index = route_indices[position - 1]
+            travel_seconds = int(travel_matrix.durations[previous_index, address_index])
+            travel_meters = int(travel_matrix.distances[previous_index, address_index])
+            transition_details.append({
+                'segment': position,
+                'travel_duration_minutes': round(travel_seconds / 60, 1),
+                'travel_distance_meters': travel_meters,
+                'wait_duration_minutes': 0,
+                'start_time': format_time(current_time)
+            })
+            current_time = current_time + timedelta(seconds=travel_seconds)
+            total_distance += travel_meters
         
-        time_window_config = {
-            'address_index': address_index,
-            'soft_start_time': soft_start_time.replace(microsecond=0).isoformat().replace('+00:00', 'Z'),
-            'soft_end_time': soft_end_time.replace(microsecond=0).isoformat().replace('+00:00', 'Z'),
-            'cost_per_hour_before': cost_per_hour_before,
-            'cost_per_hour_after': cost_per_hour_after
-        }
+        if position == 0:
+            stop_type = 'Start'
+        elif address_index == end_point_index:
+            stop_type = 'End Point'
+        else:
+            stop_type = 'Customer Visit'
+        is_customer = stop_type == 'Customer Visit'
         
-        time_windows.append(time_window_config)
-        # Calculate percentage info for logging
-        window_start_pct = ((soft_start_time - base_start_time) / total_route_duration * 100) if total_route_duration.total_seconds() > 0 else 0
-        window_end_pct = ((soft_end_time - base_start_time) / total_route_duration * 100) if total_route_duration.total_seconds() > 0 else 100
+        visit_schedule.append({
+            'stop_number': position + 1,
+            'address': addresses[address_index],
+            'latitude': coordinates_dict[addresses[address_index]]['latitude'],
+            'longitude': coordinates_dict[addresses[address_index]]['longitude'],
+            'arrival_time': format_time(current_time),
+            'service_duration_minutes': service_time_minutes if is_customer else 0,
+            'wait_duration_minutes': 0,
+            'is_depot': False if is_customer else addresses[0] == addresses[end_point_index],
+            'stop_type': stop_type
+        })
         
-        logger.info(f"Created priority time window for {priority_address} (index {address_index}): {preferred_time_window} priority with level {priority_level}")
-        logger.info(f"  Window: {soft_start_time.strftime('%H:%M')}-{soft_end_time.strftime('%H:%M')} ({window_start_pct:.0f}%-{window_end_pct:.0f}% of route)")
+        if is_customer:
+            current_time = current_time + timedelta(seconds=service_seconds)
+    
+    total_duration = int((current_time - route_model.start_time).total_seconds())
+    optimization_objective = route_model.optimization_objective
+    
+    logger.info(f"Local OR-Tools engine completed successfully")
+    logger.info(f"Optimized route indices: {route_indices}")
+    logger.info(f"Total duration: {total_duration} seconds ({round(total_duration/60, 2)} minutes)")
     
     return {
-        'enabled': True,
-        'windows': time_windows
+        'success': True,
+        'message': f'Route optimization completed successfully using local OR-Tools engine with objective: {optimization_objective}',
+        'algorithm': 'OR-Tools (local)',
+        'engine': 'local',
+        'optimization_objective': optimization_objective,
+        'original_addresses': addresses,
+        'optimized_addresses': [addresses[i] for i in route_indices],
+        'route_indices': route_indices,
+        'address_coordinates': coordinates_dict,
+        'timing_info': {
+            'vehicle_start_time': route_model.start_time_str,
+            'vehicle_end_time': format_time(current_time),
+            'total_duration_seconds': total_duration,
+            'total_duration_minutes': round(total_duration / 60, 1),
+            'total_duration_hours': round(total_duration / 3600, 2),
+            'service_time_per_stop_minutes': service_time_minutes,
+            'custom_start_time_used': route_model.custom_start_time_used
+        },
+        'visit_schedule': visit_schedule,
+        'transition_details': transition_details,
+        'optimization_info': {
+            'addresses_count': len(addresses),
+            'total_distance_meters': total_distance,
+            'total_distance_km': round(total_distance / 1000, 2) if total_distance else 0,
+            'total_time_seconds': total_duration,
+            'total_time_minutes': round(total_duration / 60, 1),
+            'total_time_hours': round(total_duration / 3600, 2),
+            'cost_per_kilometer': route_model.cost_per_kilometer,
+            'cost_per_hour': route_model.cost_per_hour
+        }
     }
 
 
-def optimize_route_with_api(addresses, time_windows_config=None, priority_addresses_config=None, start_time_config=None, objective_config=None, service_time_minutes=3, calculated_end_time=None):
+def optimize_route_with_api(addresses, time_windows_config=None, priority_addresses_config=None, start_time_config=None, objective_config=None, service_time_minutes=3, calculated_end_time=None, engine='remote', known_coordinates=None):
     """
     Use Google Route Optimization API to find the optimal route.
     Enhanced with configurable timing and optimization objectives.
@@ -728,370 +4230,170 @@ def optimize_route_with_api(addresses, time_windows_config=None, priority_addres
                          If not provided, defaults to 'minimize_time'.
         calculated_end_time: Optional pre-calculated end time for two-stage optimization.
                            If provided, used for percentage-based time window calculations.
+        engine: Optimization engine ('remote', 'local' or 'auto'), see solve_route_model()
+        known_coordinates: Optional dict {address: (lat, lng)} of already geocoded addresses
     """
-    if not GOOGLE_CLOUD_PROJECT_ID:
+    if engine != 'local' and not GOOGLE_CLOUD_PROJECT_ID:
         raise Exception("Google Cloud Project ID is not configured")
     
     try:
-        # Calculate start and end times
-        if start_time_config:
-            # Parse custom start time
-            try:
-                from dateutil.parser import parse
-                start_time = parse(start_time_config)
-                # Ensure timezone is UTC
-                if start_time.tzinfo is None:
-                    start_time = start_time.replace(tzinfo=pytz.UTC)
-                else:
-                    start_time = start_time.astimezone(pytz.UTC)
-                logger.info(f"Using custom start time: {start_time}")
-            except Exception as e:
-                logger.error(f"Invalid start_time format '{start_time_config}': {e}")
-                raise Exception(f"Invalid start_time format. Expected ISO format like '2024-12-21T08:00:00Z'")
-        else:
-            # Default behavior: start at 23:00 today
-            today = datetime.now(pytz.UTC)
-            start_time = today.replace(hour=23, minute=0, second=0, microsecond=0)
-            
-            # If current time is past 23:00, use tomorrow 23:00
-            if today.hour >= 23:
-                start_time = start_time + timedelta(days=1)
-            
-        # Set end time to 24 hours later
-        end_time = start_time + timedelta(hours=24)
-        
-        # Configure optimization objective
-        if objective_config:
-            if objective_config not in ['minimize_time', 'minimize_distance', 'minimize_cost']:
-                raise Exception(f"Invalid objective '{objective_config}'. Must be 'minimize_time', 'minimize_distance', or 'minimize_cost'")
-            optimization_objective = objective_config
-        else:
-            optimization_objective = 'minimize_time'  # Default
-        
-        logger.info(f"Optimization objective: {optimization_objective}")
-        
-        # Set cost parameters based on objective
-        if optimization_objective == 'minimize_distance':
-            cost_per_kilometer = 10.0  # High cost for distance
-            cost_per_hour = 0.1       # Low cost for time
-        elif optimization_objective == 'minimize_cost':
-            cost_per_kilometer = 5.0   # Medium cost for distance
-            cost_per_hour = 2.0       # Medium cost for time
-        else:  # minimize_time (default)
-            cost_per_kilometer = 1.0   # Low cost for distance
-            cost_per_hour = 10.0      # High cost for time
-        
-        start_time_str = start_time.replace(microsecond=0).isoformat().replace('+00:00', 'Z')
-        end_time_str = end_time.replace(microsecond=0).isoformat().replace('+00:00', 'Z')
-        
-        logger.info(f"Route planning: Start at {start_time_str}, End by {end_time_str}")
-        logger.info(f"Cost parameters: {cost_per_kilometer}/km, {cost_per_hour}/hour")
-        
-        # Handle priority addresses by creating time windows
-        if priority_addresses_config:
-            # Use calculated_end_time if provided (from two-stage optimization), otherwise use default end_time
-            route_end_time = calculated_end_time if calculated_end_time else end_time
-            logger.info(f"Using route end time for priority windows: {route_end_time}")
-            priority_time_windows = create_priority_time_windows(addresses, priority_addresses_config, start_time, route_end_time)
-            if priority_time_windows:
-                if time_windows_config:
-                    # Merge with existing time windows
-                    if 'windows' in time_windows_config:
-                        time_windows_config['windows'].extend(priority_time_windows['windows'])
-                    else:
-                        time_windows_config['windows'] = priority_time_windows['windows']
-                    time_windows_config['enabled'] = True
-                else:
-                    # Use priority time windows as the main time windows config
-                    time_windows_config = priority_time_windows
-                
-                logger.info(f"Applied priority time windows for {len(priority_addresses_config)} addresses")
-        
-        # First, geocode all addresses to get coordinates
-        logger.info("Geocoding addresses to coordinates...")
-        coordinates = []
-        coordinates_dict = {}  # Store coordinates for API response
-        for address in addresses:
-            lat, lng = geocode_address(address)
-            if lat is None or lng is None:
-                raise Exception(f"Failed to geocode address: {address}")
-            coordinates.append((lat, lng))
-            coordinates_dict[address] = {'latitude': lat, 'longitude': lng}
-        
-        # Get start and end coordinates
-        start_lat, start_lng = coordinates[0]  # First address is start point
-        end_lat, end_lng = coordinates[-1]     # Last address is end point
-        
-        # Create shipments for each address (except the first and last which are start/end points)
-        # Each shipment represents a visit to the location (pickup only) with 3 minutes service time
-        shipments = []
-        customer_coordinates = coordinates[1:-1]  # Skip start and end points
-        for i, (lat, lng) in enumerate(customer_coordinates, 1):  # Customer addresses only
-            pickup_request = {
-                "arrival_location": {
-                    "latitude": lat,
-                    "longitude": lng
-                },
-                "duration": f"{service_time_minutes * 60}s"  # Configurable service time per stop
-            }
-            
-            # Add time windows if configured
-            if time_windows_config and time_windows_config.get('enabled', False):
-                time_windows = time_windows_config.get('windows', [])
-                # Find time window for this address
-                # i is 1-based customer index, original address index is i (since customers start from index 1)
-                original_address_index = i  # Customer index in original addresses array
-                for window in time_windows:
-                    window_address_index = window.get('address_index')
-                    if window_address_index == original_address_index:
-                        pickup_request["time_windows"] = [_create_time_window(window)]
-                        logger.info(f"Applied time window to customer address {original_address_index} (customer #{i}): {window}")
-                        break
-            
-            shipment = {
-                "pickups": [pickup_request]
-                # No deliveries - just visit the location
-            }
-            shipments.append(shipment)
-        
-        # Create vehicle with separate start and end locations
-        vehicle = {
-            "start_location": {
-                "latitude": start_lat,
-                "longitude": start_lng
-            },
-            "end_location": {
-                "latitude": end_lat,
-                "longitude": end_lng
-            },
-            "cost_per_kilometer": cost_per_kilometer
-        }
-        
-        # Create the optimization request with calculated times (Python API uses snake_case)
-        request = ro.OptimizeToursRequest(
-            parent=f"projects/{GOOGLE_CLOUD_PROJECT_ID}",
-            model={
-                "shipments": shipments,
-                "vehicles": [vehicle],
-                "global_start_time": start_time_str,
-                "global_end_time": end_time_str
-            }
-        )
-        
-        # Initialize Route Optimization client
-        credentials, project = default()
-        route_client = ro.RouteOptimizationClient(credentials=credentials)
-        
-        logger.info(f"Sending request to Route Optimization API for {len(addresses)} addresses")
-        response = route_client.optimize_tours(request=request)
-        
-        if not response.routes:
-            logger.error("No routes found in optimization response")
-            return None
-            
-        # Parse the response with detailed timing information
-        route = response.routes[0]
-        visits = route.visits
-        transitions = route.transitions if hasattr(route, 'transitions') else []
-        
-        # Build the optimized address list and timing details
-        optimized_addresses = [addresses[0]]  # Start with start point
-        route_indices = [0]  # Start with start point index
-        visit_schedule = []  # Detailed schedule with times
-        
-        # Add start point time
-        vehicle_start_time = route.vehicle_start_time if hasattr(route, 'vehicle_start_time') else start_time_str
-        visit_schedule.append({
-            'stop_number': 1,
-            'address': addresses[0],
-            'latitude': coordinates_dict[addresses[0]]['latitude'],
-            'longitude': coordinates_dict[addresses[0]]['longitude'],
-            'arrival_time': vehicle_start_time,
-            'service_duration_minutes': 0,
-            'wait_duration_minutes': 0,
-            'is_depot': addresses[0] == addresses[-1],  # True if start == end
-            'stop_type': 'Start'
-        })
-        
-        logger.info(f"Processing {len(visits)} visits from Route Optimization API")
-        
-        # Process each visit
-        for i, visit in enumerate(visits):
-            shipment_index = visit.shipment_index
-            address_index = shipment_index + 1  # +1 because customers start from index 1
-            
-            if address_index < len(addresses) - 1:  # Safety check (exclude end point)
-                optimized_addresses.append(addresses[address_index])
-                route_indices.append(address_index)
-                
-                # Extract timing information
-                arrival_time = visit.start_time if hasattr(visit, 'start_time') else None
-                visit_duration = service_time_minutes  # Configurable service time
-                
-                # Get transition info if available
-                wait_duration = 0
-                if i < len(transitions):
-                    transition = transitions[i]
-                    if hasattr(transition, 'wait_duration'):
-                        wait_duration = transition.wait_duration.seconds / 60 if transition.wait_duration.seconds else 0
-                
-                visit_schedule.append({
-                    'stop_number': len(visit_schedule) + 1,
-                    'address': addresses[address_index],
-                    'latitude': coordinates_dict[addresses[address_index]]['latitude'],
-                    'longitude': coordinates_dict[addresses[address_index]]['longitude'],
-                    'arrival_time': arrival_time.isoformat().replace('+00:00', 'Z') if arrival_time else None,
-                    'service_duration_minutes': visit_duration,
-                    'wait_duration_minutes': round(wait_duration, 1),
-                    'is_depot': False,
-                    'stop_type': 'Customer Visit'
-                })
-        
-        # Add end point
-        end_point_index = len(addresses) - 1
-        optimized_addresses.append(addresses[end_point_index])
-        route_indices.append(end_point_index)
-        
-        # Add final end point arrival
-        vehicle_end_time = route.vehicle_end_time if hasattr(route, 'vehicle_end_time') else end_time_str
-        visit_schedule.append({
-            'stop_number': len(visit_schedule) + 1,
-            'address': addresses[end_point_index],
-            'latitude': coordinates_dict[addresses[end_point_index]]['latitude'],
-            'longitude': coordinates_dict[addresses[end_point_index]]['longitude'],
-            'arrival_time': vehicle_end_time.isoformat().replace('+00:00', 'Z') if hasattr(vehicle_end_time, 'isoformat') else vehicle_end_time,
-            'service_duration_minutes': 0,
-            'wait_duration_minutes': 0,
-            'is_depot': addresses[0] == addresses[end_point_index],  # True if start == end
-            'stop_type': 'End Point'
-        })
-        
-        # Calculate metrics
-        total_duration = 0
-        total_distance = 0
-        if hasattr(route, 'metrics'):
-            total_duration = route.metrics.total_duration.seconds if hasattr(route.metrics, 'total_duration') else 0
-            total_distance = route.metrics.travel_distance_meters if hasattr(route.metrics, 'travel_distance_meters') else 0
-        
-        # Extract detailed transition information
-        transition_details = []
-        for i, transition in enumerate(transitions):
-            if hasattr(transition, 'travel_duration'):
-                transition_details.append({
-                    'segment': i + 1,
-                    'travel_duration_minutes': round(transition.travel_duration.seconds / 60, 1) if transition.travel_duration.seconds else 0,
-                    'travel_distance_meters': transition.travel_distance_meters if hasattr(transition, 'travel_distance_meters') else 0,
-                    'wait_duration_minutes': round(transition.wait_duration.seconds / 60, 1) if hasattr(transition, 'wait_duration') and transition.wait_duration.seconds else 0,
-                    'start_time': transition.start_time.isoformat().replace('+00:00', 'Z') if hasattr(transition, 'start_time') and transition.start_time else None
-                })
-        
-        logger.info(f"Route Optimization API completed successfully")
-        logger.info(f"Optimized route indices: {route_indices}")
-        logger.info(f"Total duration: {total_duration} seconds ({round(total_duration/60, 2)} minutes)")
-        logger.info(f"Vehicle starts at: {vehicle_start_time}")
-        logger.info(f"Vehicle ends at: {vehicle_end_time}")
-        
-        return {
-            'success': True,
-            'message': f'Route optimization completed successfully using Google Route Optimization API with objective: {optimization_objective}',
-            'algorithm': 'Google Route Optimization API',
-            'optimization_objective': optimization_objective,
-            'original_addresses': addresses,
-            'optimized_addresses': optimized_addresses,
-            'route_indices': route_indices,
-            'address_coordinates': coordinates_dict,
-            'timing_info': {
-                'vehicle_start_time': vehicle_start_time.isoformat().replace('+00:00', 'Z') if hasattr(vehicle_start_time, 'isoformat') else vehicle_start_time,
-                'vehicle_end_time': vehicle_end_time.isoformat().replace('+00:00', 'Z') if hasattr(vehicle_end_time, 'isoformat') else vehicle_end_time,
-                'total_duration_seconds': total_duration,
-                'total_duration_minutes': round(total_duration / 60, 1),
-                'total_duration_hours': round(total_duration / 3600, 2),
-                'service_time_per_stop_minutes': service_time_minutes,
-                'custom_start_time_used': bool(start_time_config)
-            },
-            'visit_schedule': visit_schedule,
-            'transition_details': transition_details,
-            'optimization_info': {
-                'addresses_count': len(addresses),
-                'total_distance_meters': total_distance,
-                'total_distance_km': round(total_distance / 1000, 2) if total_distance else 0,
-                'total_time_seconds': total_duration,
-                'total_time_minutes': round(total_duration / 60, 1),
-                'total_time_hours': round(total_duration / 3600, 2),
-                'cost_per_kilometer': cost_per_kilometer,
-                'cost_per_hour': cost_per_hour
-            }
-        }
-        
+        with performance_stage('prepare'):
+            route_model = prepare_route_model(addresses, start_time_config, objective_config, service_time_minutes, known_coordinates)
     except Exception as e:
         logger.error(f"Route Optimization API failed: {str(e)}")
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
         return None
+    
+    with performance_stage('solve'):
+        return solve_route_model(route_model, time_windows_config, priority_addresses_config, calculated_end_time, engine=engine)
+
+
+def estimate_route_duration(route_model):
+    """
+    Estimate the duration of the route without priorities, without calling any API.
+    
+    Builds the haversine travel matrix, finds a good visiting order with OR-Tools (first
+    solution plus plain local search, no metaheuristic) using the route model's cost
+    parameters, and adds the service time of every customer stop.
+    
+    Args:
+        route_model: Prepared RouteModel
+    
+    Returns:
+        Dictionary with end_time (datetime), duration_seconds, travel_seconds, service_seconds
+        and calibrated (whether observed legs from TravelCalibrationStore adjusted the matrix)
+    
+    Raises:
+        Exception if no route could be estimated
+    """
+    num_addresses = len(route_model.addresses)
+    departure_hour = route_model.start_time.astimezone(pytz.UTC).hour
+    travel_matrix, calibrated = _local_travel_matrices(route_model.coordinates, source='haversine', departure_hour=departure_hour)
+    cost_matrix = travel_matrix.cost_matrix(route_model.cost_per_hour, route_model.cost_per_kilometer)
+    route_indices, _ = solve_tsp(
+        cost_matrix,
+        start_index=0,
+        end_index=num_addresses - 1,
+        time_limit_seconds=STAGE1_ESTIMATE_TIME_LIMIT_SECONDS,
+        guided_local_search=False
+    )
+    if route_indices is None:
+        raise Exception("No local route duration estimate found")
+    
+    travel_seconds = sum(int(travel_matrix.durations[a, b]) for a, b in zip(route_indices, route_indices[1:]))
+    service_seconds = int(route_model.service_time_minutes * 60) * max(0, num_addresses - 2)
+    duration_seconds = travel_seconds + service_seconds
+    return {
+        'end_time': route_model.start_time + timedelta(seconds=duration_seconds),
+        'duration_seconds': duration_seconds,
+        'travel_seconds': travel_seconds,
+        'service_seconds': service_seconds,
+        'calibrated': calibrated
+    }
 
 
-def two_stage_optimization(addresses, priority_addresses_config, start_time_config=None, objective_config=None, service_time_minutes=3):
+def two_stage_optimization(addresses, priority_addresses_config, start_time_config=None, objective_config=None, service_time_minutes=3, engine='remote', known_coordinates=None, stage1_mode='solve'):
     """
     Two-stage optimization for priority addresses:
     1. First stage: Basic optimization without priorities to get actual route duration
     2. Second stage: Re-optimization with priorities using the calculated end time for percentage-based windows
     
+    Geocoding, shipment construction and client setup happen once; both stages
+    solve the same prepared RouteModel. With stage1_mode='estimate' the first stage is
+    replaced by estimate_route_duration(), so the engine is only called once; the
+    estimate is compared with the stage 2 duration in the response (stage1_estimate).
+    
     Args:
         addresses: List of addresses to optimize
         priority_addresses_config: List of priority address configurations
         start_time_config: Optional custom start time
         objective_config: Optional optimization objective
         service_time_minutes: Service time per stop in minutes
+        engine: Optimization engine ('remote', 'local' or 'auto'), see solve_route_model()
+        known_coordinates: Optional dict {address: (lat, lng)} of already geocoded addresses
+        stage1_mode: 'solve' (optimize without priorities) or 'estimate' (local duration estimate)
     
     Returns:
         Result from second stage optimization with priority addresses properly positioned
     """
     logger.info("Starting two-stage optimization for priority addresses")
     
+    if engine != 'local' and not GOOGLE_CLOUD_PROJECT_ID:
+        raise Exception("Google Cloud Project ID is not configured")
+    
     try:
-        # STAGE 1: Basic optimization without priorities to get real route time
-        logger.info("Stage 1: Basic optimization to calculate route duration")
-        stage1_result = optimize_route_with_api(
-            addresses=addresses,
-            time_windows_config=None,           # No time windows
-            priority_addresses_config=None,     # No priorities
-            start_time_config=start_time_config,
-            objective_config=objective_config,
-            service_time_minutes=service_time_minutes
-        )
-        
-        if not stage1_result:
-            logger.error("Stage 1 optimization failed")
-            return None
+        with performance_stage('prepare'):
+            route_model = prepare_route_model(addresses, start_time_config, objective_config, service_time_minutes, known_coordinates)
+    except Exception as e:
+        logger.error(f"Failed to prepare route model: {str(e)}")
+        return None
+    
+    client = None
+    try:
+        if engine != 'local':
+            client = get_route_client()
         
-        # Extract actual end time from first stage
-        actual_end_time_str = stage1_result['timing_info']['vehicle_end_time']
-        logger.info(f"Stage 1 completed. Route ends at: {actual_end_time_str}")
+        stage1_result = None
+        estimate = None
+        if stage1_mode == 'estimate':
+            # STAGE 1 (estimate): local duration estimate instead of a full optimization
+            logger.info("Stage 1: Estimating route duration locally")
+            try:
+                with performance_stage('stage1_estimate'):
+                    estimate = estimate_route_duration(route_model)
+                actual_end_time = estimate['end_time']
+                logger.info(f"Stage 1 estimate: {round(estimate['duration_seconds'] / 60, 1)} minutes, route ends at {actual_end_time}")
+            except Exception as e:
+                logger.warning(f"Route duration estimate failed, solving stage 1 instead: {str(e)}")
         
-        # Parse the end time for use in stage 2
-        try:
-            from dateutil.parser import parse
-            actual_end_time = parse(actual_end_time_str.replace('Z', '+00:00'))
-            logger.info(f"Parsed end time: {actual_end_time}")
-        except Exception as e:
-            logger.error(f"Failed to parse end time '{actual_end_time_str}': {e}")
-            # Fallback: use stage 1 result without re-optimization
-            logger.warning("Using stage 1 result without priority re-optimization due to parsing error")
-            return stage1_result
+        if estimate is None:
+            # STAGE 1: Basic optimization without priorities to get real route time
+            logger.info("Stage 1: Basic optimization to calculate route duration")
+            with performance_stage('stage1_solve'):
+                stage1_result = solve_route_model(
+                    route_model,
+                    time_windows_config=None,           # No time windows
+                    priority_addresses_config=None,     # No priorities
+                    client=client,
+                    engine=engine
+                )
+            
+            if not stage1_result:
+                logger.error("Stage 1 optimization failed")
+                return None
+            
+            # Extract actual end time from first stage
+            actual_end_time_str = stage1_result['timing_info']['vehicle_end_time']
+            logger.info(f"Stage 1 completed. Route ends at: {actual_end_time_str}")
+            
+            # Parse the end time for use in stage 2
+            try:
+                from dateutil.parser import parse
+                actual_end_time = parse(actual_end_time_str.replace('Z', '+00:00'))
+                logger.info(f"Parsed end time: {actual_end_time}")
+            except Exception as e:
+                logger.error(f"Failed to parse end time '{actual_end_time_str}': {e}")
+                # Fallback: use stage 1 result without re-optimization
+                logger.warning("Using stage 1 result without priority re-optimization due to parsing error")
+                return stage1_result
         
         # STAGE 2: Re-optimization with priorities using calculated end time
         logger.info("Stage 2: Re-optimization with priority addresses using calculated route duration")
-        stage2_result = optimize_route_with_api(
-            addresses=addresses,
-            time_windows_config=None,
-            priority_addresses_config=priority_addresses_config,
-            start_time_config=start_time_config,
-            objective_config=objective_config,
-            service_time_minutes=service_time_minutes,
-            calculated_end_time=actual_end_time  # Pass the calculated end time
-        )
+        with performance_stage('stage2_solve'):
+            stage2_result = solve_route_model(
+                route_model,
+                time_windows_config=None,
+                priority_addresses_config=priority_addresses_config,
+                calculated_end_time=actual_end_time,  # Pass the calculated end time
+                client=client,
+                engine=engine
+            )
         
         if not stage2_result:
+            if stage1_result is None:
+                logger.warning("Stage 2 optimization failed, solving without priorities")
+                return solve_route_model(route_model, client=client, engine=engine)
             logger.warning("Stage 2 optimization failed, returning stage 1 result")
             return stage1_result
         
@@ -1099,8 +4401,29 @@ def two_stage_optimization(addresses, priority_addresses_config, start_time_conf
         
         # Add metadata to indicate this was a two-stage optimization
         stage2_result['two_stage_optimization'] = True
-        stage2_result['stage1_duration'] = stage1_result['timing_info']['total_duration_minutes']
         stage2_result['stage2_duration'] = stage2_result['timing_info']['total_duration_minutes']
+        if estimate is not None:
+            actual_seconds = stage2_result['timing_info']['total_duration_seconds']
+            error_seconds = estimate['duration_seconds'] - actual_seconds
+            stage2_result['stage1_duration'] = round(estimate['duration_seconds'] / 60, 1)
+            stage2_result['stage1_estimate'] = {
+                'method': 'calibrated_haversine' if estimate.get('calibrated') else 'local_haversine',
+                'estimated_duration_minutes': round(estimate['duration_seconds'] / 60, 1),
+                'estimated_travel_minutes': round(estimate['travel_seconds'] / 60, 1),
+                'actual_duration_minutes': stage2_result['timing_info']['total_duration_minutes'],
+                'error_minutes': round(error_seconds / 60, 1),
+                'error_percent': round(100 * error_seconds / actual_seconds, 1) if actual_seconds else None
+            }
+            if actual_seconds:
+                DURATION_ESTIMATE_ERROR.labels(stage2_result.get('engine', engine)).observe(error_seconds / actual_seconds)
+            logger.info(f"Stage 1 estimate error: {stage2_result['stage1_estimate']['error_minutes']} minutes")
+            return stage2_result
+        
+        stage2_result['stage1_duration'] = stage1_result['timing_info']['total_duration_minutes']
+        if 'response_cache' in stage2_result:
+            # The priority path is only a cache hit if both stages were served from the cache
+            both_hit = stage1_result.get('response_cache') == 'HIT' and stage2_result['response_cache'] == 'HIT'
+            stage2_result['response_cache'] = 'HIT' if both_hit else stage2_result['response_cache'].replace('HIT', 'MISS')
         
         return stage2_result
         
@@ -1109,17 +4432,20 @@ def two_stage_optimization(addresses, priority_addresses_config, start_time_conf
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
         
-        # Fallback: try single-stage optimization
+        # Fallback: try single-stage optimization on the already prepared model
         logger.warning("Falling back to single-stage optimization")
-        return optimize_route_with_api(
-            addresses=addresses,
+        return solve_route_model(
+            route_model,
             time_windows_config=None,
             priority_addresses_config=priority_addresses_config,
-            start_time_config=start_time_config,
-            objective_config=objective_config,
-            service_time_minutes=service_time_minutes
+            client=client,
+            engine=engine
         )
 
 
+if WARMUP_ON_START:
+    start_background_warm_up()
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080, debug=True) 
\ No newline at end of file
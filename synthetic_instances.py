@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Seeded synthetic route instances modelled on our German delivery workloads
+
+Generates /api/optimize payloads whose stops are clustered around real towns
+near a depot (Franconia / Upper Palatinate / Lower Bavaria, like the addresses in
+route_optimizer_test.json), with configurable stop counts, priority mixes over
+the five priority levels and soft time windows. Every instance comes with a
+matching geocoder fixture {address: [lat, lng]} for fake_maps_server.py, so the
+benchmarks run on 10 to 2,000-stop instances without Google APIs.
+
+Usage:
+    python synthetic_instances.py --stops 200 --seed 7 --output instance.json --geocodes geocodes.json
+    python synthetic_instances.py --stops 50 --priority-fraction 0.1 --time-window-fraction 0.2
+"""
+
+import argparse
+import json
+import math
+import random
+from datetime import datetime, timedelta
+
+# (town, postal code, latitude, longitude, relative size)
+TOWNS = [
+    ('Nürnberg', '90402', 49.4521, 11.0767, 10.0),
+    ('Fürth', '90762', 49.4771, 10.9887, 4.0),
+    ('Erlangen', '91052', 49.5897, 11.0120, 4.0),
+    ('Schwabach', '91126', 49.3292, 11.0235, 2.0),
+    ('Roth', '91154', 49.2459, 11.0909, 1.5),
+    ('Feucht', '90537', 49.3756, 11.2137, 1.0),
+    ('Altdorf bei Nürnberg', '90518', 49.3856, 11.3566, 1.0),
+    ('Lauf an der Pegnitz', '91207', 49.5103, 11.2772, 1.5),
+    ('Hersbruck', '91217', 49.5080, 11.4315, 1.0),
+    ('Allersberg', '90584', 49.2520, 11.2368, 1.0),
+    ('Hilpoltstein', '91161', 49.1905, 11.1913, 1.0),
+    ('Postbauer-Heng', '92353', 49.3047, 11.3560, 0.8),
+    ('Pilsach', '92367', 49.3222, 11.4970, 0.5),
+    ('Neumarkt in der Oberpfalz', '92318', 49.2796, 11.4597, 2.5),
+    ('Freystadt', '92342', 49.2000, 11.3333, 0.8),
+    ('Berching', '92334', 49.1057, 11.4412, 0.8),
+    ('Parsberg', '92331', 49.1606, 11.7194, 0.7),
+    ('Amberg', '92224', 49.4453, 11.8584, 3.0),
+    ('Regensburg', '93047', 49.0134, 12.1016, 6.0),
+    ('Kelheim', '93309', 48.9167, 11.8833, 1.2),
+    ('Ingolstadt', '85049', 48.7665, 11.4258, 5.0),
+    ('Landshut', '84028', 48.5372, 12.1522, 3.5),
+    ('Furth', '84095', 48.5833, 12.0333, 0.5),
+    ('Moosburg an der Isar', '85368', 48.4706, 11.9383, 1.2),
+]
+
+STREETS = [
+    'Hauptstraße', 'Bahnhofstraße', 'Schulstraße', 'Gartenstraße', 'Dorfstraße', 'Bergstraße',
+    'Kirchstraße', 'Lindenstraße', 'Am Anger', 'Mühlweg', 'Ringstraße', 'Birkenweg', 'Feldstraße',
+    'Industriestraße', 'Marktplatz', 'Neumarkter Straße', 'Nürnberger Straße', 'Seelstraße',
+    'Kolpingstraße', 'Am Klosterberg', 'Lippacher Straße', 'Waldstraße', 'Sonnenstraße', 'Rosenweg',
+]
+
+PRIORITY_LEVELS = ['critical_high', 'high', 'medium', 'low', 'critical_low']
+PREFERRED_WINDOWS = {
+    'critical_high': 'earliest',
+    'high': 'early',
+    'medium': 'middle',
+    'low': 'late',
+    'critical_low': 'latest',
+}
+DEPOT_TOWNS = ['Nürnberg', 'Neumarkt in der Oberpfalz', 'Allersberg', 'Regensburg', 'Landshut']
+
+MAX_STOPS = 2000
+KM_PER_DEGREE = 111.32
+
+
+def _distance_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371.0088 * math.asin(math.sqrt(h))
+
+
+def _scatter(rng, lat, lng, sigma_km):
+    """Gaussian offset around a point."""
+    lat_offset = rng.gauss(0, sigma_km) / KM_PER_DEGREE
+    lng_offset = rng.gauss(0, sigma_km) / (KM_PER_DEGREE * math.cos(math.radians(lat)))
+    return round(lat + lat_offset, 6), round(lng + lng_offset, 6)
+
+
+def generate_instance(stops, seed=0, depot_town=None, radius_km=45.0, clusters=6,
+                      priority_fraction=0.0, priority_mix=None, time_window_fraction=0.0,
+                      start_time='2024-12-21T08:00:00Z', round_trip=True):
+    """
+    Generate a seeded /api/optimize payload and its geocoder fixture.
+
+    Args:
+        stops: Total number of addresses including start and end point (3 to MAX_STOPS)
+        seed: Random seed; the same arguments always produce the same instance
+        depot_town: Town of the depot (default: picked from DEPOT_TOWNS by seed)
+        radius_km: Towns within this distance of the depot can receive stops
+        clusters: Number of towns the stops are clustered around
+        priority_fraction: Fraction of customer stops listed in priority_addresses
+        priority_mix: Optional {priority_level: weight} over the five levels (default: uniform)
+        time_window_fraction: Fraction of customer stops with a soft time window
+        start_time: Route start time (ISO format)
+        round_trip: End at the depot (True) or at the last generated stop (False)
+
+    Returns:
+        Tuple (payload, geocodes) of the request payload and {address: [lat, lng]}
+    """
+    if stops < 3 or stops > MAX_STOPS:
+        raise ValueError(f"stops must be between 3 and {MAX_STOPS}")
+
+    rng = random.Random(seed)
+    towns_by_name = {town[0]: town for town in TOWNS}
+    depot = towns_by_name[depot_town or DEPOT_TOWNS[seed % len(DEPOT_TOWNS)]]
+
+    # Towns near the depot, weighted by size and closeness
+    nearby = [town for town in TOWNS if _distance_km(depot[2], depot[3], town[2], town[3]) <= radius_km]
+    weights = [town[4] / (1 + _distance_km(depot[2], depot[3], town[2], town[3]) / 10) for town in nearby]
+    cluster_towns = []
+    while len(cluster_towns) < min(clusters, len(nearby)):
+        town = rng.choices(nearby, weights=weights)[0]
+        if town not in cluster_towns:
+            cluster_towns.append(town)
+
+    geocodes = {}
+    used = set()
+
+    def make_address(town):
+        while True:
+            street = rng.choice(STREETS)
+            number = rng.randint(1, 250)
+            address = f"{street} {number}, {town[1]} {town[0]}, Deutschland"
+            if address not in used:
+                used.add(address)
+                return address
+
+    depot_address = make_address(depot)
+    geocodes[depot_address] = list(_scatter(rng, depot[2], depot[3], 0.5))
+
+    customer_count = stops - 2 if round_trip else stops - 1
+    cluster_weights = [town[4] for town in cluster_towns]
+    customers = []
+    for _ in range(customer_count):
+        town = rng.choices(cluster_towns, weights=cluster_weights)[0]
+        address = make_address(town)
+        geocodes[address] = list(_scatter(rng, town[2], town[3], 0.8 + 0.4 * math.sqrt(town[4])))
+        customers.append(address)
+
+    addresses = [depot_address] + customers + ([depot_address] if round_trip else [])
+    payload = {'addresses': addresses, 'start_time': start_time}
+
+    customer_indices = list(range(1, len(addresses) - 1))
+    if priority_fraction > 0:
+        levels = list((priority_mix or {level: 1.0 for level in PRIORITY_LEVELS}).items())
+        selected = rng.sample(customer_indices, max(1, round(len(customer_indices) * priority_fraction)))
+        priority_addresses = []
+        for index in sorted(selected):
+            level = rng.choices([level for level, _ in levels], weights=[weight for _, weight in levels])[0]
+            priority_addresses.append({
+                'address': addresses[index],
+                'priority_level': level,
+                'preferred_time_window': PREFERRED_WINDOWS[level]
+            })
+        payload['priority_addresses'] = priority_addresses
+
+    if time_window_fraction > 0:
+        route_start = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+        selected = rng.sample(customer_indices, max(1, round(len(customer_indices) * time_window_fraction)))
+        windows = []
+        for index in sorted(selected):
+            window_start = route_start + timedelta(minutes=30 * rng.randint(0, 14))
+            window_end = window_start + timedelta(hours=rng.choice([1, 2, 3]))
+            windows.append({
+                'address_index': index,
+                'soft_start_time': window_start.isoformat().replace('+00:00', 'Z'),
+                'soft_end_time': window_end.isoformat().replace('+00:00', 'Z'),
+                'cost_per_hour_before': 5.0,
+                'cost_per_hour_after': 10.0
+            })
+        payload['time_windows'] = {'enabled': True, 'windows': windows}
+
+    return payload, geocodes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic /api/optimize instance and geocoder fixture')
+    parser.add_argument('--stops', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--depot-town', choices=DEPOT_TOWNS)
+    parser.add_argument('--clusters', type=int, default=6)
+    parser.add_argument('--priority-fraction', type=float, default=0.0)
+    parser.add_argument('--time-window-fraction', type=float, default=0.0)
+    parser.add_argument('--output', help='Payload JSON file (default: stdout)')
+    parser.add_argument('--geocodes', help='Geocoder fixture JSON file for fake_maps_server.py --geocodes')
+    args = parser.parse_args()
+
+    payload, geocodes = generate_instance(
+        args.stops, seed=args.seed, depot_town=args.depot_town, clusters=args.clusters,
+        priority_fraction=args.priority_fraction, time_window_fraction=args.time_window_fraction
+    )
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, indent=2, ensure_ascii=False)
+    else:
+        print(json.dumps(payload, indent=2, ensure_ascii=False))
+    if args.geocodes:
+        with open(args.geocodes, 'w', encoding='utf-8') as f:
+            json.dump(geocodes, f, indent=2, ensure_ascii=False)
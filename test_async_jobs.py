@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script for asynchronous optimization jobs
+Submits a route to /api/optimize/jobs and polls the job until it finishes
+"""
+
+import requests
+import time
+
+# Configuration
+API_BASE_URL = "http://localhost:8080"
+JOBS_ENDPOINT = f"{API_BASE_URL}/api/optimize/jobs"
+
+def run_async_job():
+    """Submit a job and poll its status URL"""
+    
+    test_data = {
+        "addresses": [
+            "Neumarkter Str. 39, 90584 Allersberg, Deutschland",
+            "Kolpingstraße 2, 90584 Allersberg, Deutschland",
+            "Dietkirchen 13, 92367 Pilsach, Deutschland",
+            "Seelstraße 20, 92318 Neumarkt in der Oberpfalz, Deutschland"
+        ]
+    }
+    
+    print("=" * 60)
+    print("TESTING ASYNCHRONOUS OPTIMIZATION JOBS")
+    print("=" * 60)
+    
+    try:
+        response = requests.post(JOBS_ENDPOINT, json=test_data, timeout=10)
+        print(f"Submit status: {response.status_code}")
+        
+        if response.status_code != 202:
+            print(f"Error response: {response.text}")
+            return
+        
+        job = response.json()
+        print(f"Job ID: {job['job_id']}")
+        status_url = f"{API_BASE_URL}{job['status_url']}"
+        
+        # Poll until the job is finished
+        for _ in range(60):
+            status = requests.get(status_url, timeout=10).json()
+            print(f"  Status: {status['status']}")
+            if status['status'] in ('succeeded', 'failed'):
+                break
+            time.sleep(2)
+        
+        if status['status'] == 'succeeded':
+            result = status['result']
+            print(f"\n✅ Job finished")
+            print(f"Route indices: {result['route_indices']}")
+            for i, addr in enumerate(result['optimized_addresses'], 1):
+                print(f"  {i}. {addr}")
+        else:
+            print(f"\n❌ Job did not succeed: {status.get('error', status['status'])}")
+        
+        # Unknown jobs return 404
+        response = requests.get(f"{JOBS_ENDPOINT}/does-not-exist", timeout=10)
+        print(f"\nUnknown job status: {response.status_code}")
+            
+    except requests.exceptions.RequestException as e:
+        print(f"Request failed: {e}")
+    except Exception as e:
+        print(f"Error: {e}")
+
+if __name__ == "__main__":
+    print("Make sure the Flask app is running on http://localhost:8080")
+    run_async_job()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test script for batch optimization with BatchOptimizeTours long-running operations
+Runs offline against the local fake Route Optimization server; addresses are
+served from the geocoding cache so no Google Maps calls are made
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('GOOGLE_MAPS_API_KEY', 'test-key')
+os.environ.setdefault('GOOGLE_CLOUD_PROJECT_ID', 'test-project')
+os.environ.setdefault('ROUTE_BATCH_POLL_SECONDS', '0.1')
+
+import main
+from fake_route_optimization_server import FakeRouteOptimizationServer
+
+# Test data - German addresses with known coordinates
+ADDRESSES = {
+    "Neumarkter Str. 39, 90584 Allersberg, Deutschland": (49.2520, 11.2368),
+    "Kolpingstraße 2, 90584 Allersberg, Deutschland": (49.2497, 11.2336),
+    "Dietkirchen 13, 92367 Pilsach, Deutschland": (49.3070, 11.4630),
+    "Harrhof 7, 90584 Allersberg, Deutschland": (49.2310, 11.2020),
+    "Seelstraße 20, 92318 Neumarkt in der Oberpfalz, Deutschland": (49.2790, 11.4590),
+}
+
+
+def test_batch_operation():
+    """Submit two routes as one batch operation and map the results back"""
+    print("=" * 60)
+    print("TESTING BATCH OPTIMIZATION OPERATION")
+    print("=" * 60)
+
+    addresses = list(ADDRESSES)
+    known_coordinates = dict(ADDRESSES)
+    routes = [
+        {"addresses": addresses, "start_time": "2024-12-21T08:00:00Z"},
+        {"addresses": [addresses[0], addresses[3], addresses[2], addresses[0]]},
+        {"addresses": [addresses[0]]},
+    ]
+
+    server = FakeRouteOptimizationServer(operation_polls=2).start()
+    original_calibration = main.travel_calibration
+    main.travel_calibration = None  # Test legs must not calibrate the default store
+    try:
+        client = main.RouteClientPool(size=1, endpoint=server.endpoint).get()
+        storage = main.BatchStorage(tempfile.mkdtemp(prefix='route-batches-'))
+
+        original_geocode_address_set = main.geocode_address_set
+        main.geocode_address_set = lambda batch_addresses: (known_coordinates, set())
+        try:
+            result = main.run_batch_operation_optimization(routes, client=client, storage=storage)
+        finally:
+            main.geocode_address_set = original_geocode_address_set
+
+        print(f"Server calls: {server.calls}")
+        print(f"Succeeded: {result['succeeded_count']}, failed: {result['failed_count']}")
+        for route_result in result['results']:
+            print(f"  Route {route_result['index']}: {route_result.get('route_indices', route_result.get('error'))}")
+
+        assert server.calls['BatchOptimizeTours'] == 1
+        assert server.calls['GetOperation'] >= 2
+        assert result['succeeded_count'] == 2
+
+        first = result['results'][0]
+        assert first['engine'] == 'batch_operation'
+        assert sorted(first['route_indices']) == list(range(len(addresses)))
+        assert first['route_indices'][0] == 0 and first['route_indices'][-1] == len(addresses) - 1
+        assert len(first['visit_schedule']) == len(addresses)
+        assert first['timing_info']['vehicle_start_time'] == '2024-12-21T08:00:00Z'
+
+        assert result['results'][2]['success'] is False
+        print("✅ Batch operation results mapped through the visit schedule builder")
+    finally:
+        main.travel_calibration = original_calibration
+        server.stop()
+
+
+def test_batch_operations_do_not_block_jobs():
+    """Long-polling batch operations run on their own executor, next to regular jobs"""
+    print("=" * 60)
+    print("TESTING BATCH OPERATION EXECUTOR")
+    print("=" * 60)
+
+    original_job_store = main.job_store
+    main.job_store = main.JobStore(os.path.join(tempfile.mkdtemp(prefix='job-store-test-'), 'jobs.sqlite3'), ttl_seconds=3600)
+    release = threading.Event()
+    # Occupy as many batch operation workers as there are job workers
+    blocking_jobs = [
+        main.submit_optimization_job(lambda: release.wait(30) and {'success': True}, executor=main.batch_operation_executor)
+        for _ in range(main.JOB_MAX_WORKERS)
+    ]
+    try:
+        job_id = main.submit_optimization_job(lambda: {'success': True})
+        deadline = time.time() + 10
+        while main.job_store.get(job_id)['status'] != 'succeeded':
+            assert time.time() < deadline, "Regular job blocked by batch operations"
+            time.sleep(0.05)
+        print("✅ Regular job finished while batch operations were polling")
+    finally:
+        release.set()
+        # Let the blocking jobs finish before their store is swapped back
+        deadline = time.time() + 10
+        while any(main.job_store.get(blocking_job)['status'] != 'succeeded' for blocking_job in blocking_jobs):
+            assert time.time() < deadline, "Blocking jobs did not finish"
+            time.sleep(0.05)
+        main.job_store = original_job_store
+
+
+if __name__ == "__main__":
+    test_batch_operation()
+    test_batch_operations_do_not_block_jobs()
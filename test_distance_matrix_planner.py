@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Test script for the Distance Matrix request planner
+Runs offline: only the tile plans are checked, no requests are sent
+"""
+
+import os
+
+os.environ.setdefault('GOOGLE_MAPS_API_KEY', 'test-key')
+
+import numpy as np
+
+import main
+
+
+def covers(tiles, missing):
+    covered = np.zeros_like(missing)
+    for rows, cols in tiles:
+        covered[np.ix_(rows, cols)] = True
+    return bool((covered | ~missing).all())
+
+
+def test_cold_matrix_plan():
+    """A cold n x n matrix never needs more requests than tiling the full grid"""
+    print("=" * 60)
+    print("TESTING COLD MATRIX PLANS")
+    print("=" * 60)
+
+    for n in [2, 3, 5, 10, 11, 24, 25, 26, 30, 50, 64, 65, 100, 150]:
+        missing = np.ones((n, n), dtype=bool)
+        np.fill_diagonal(missing, False)
+        tiles = main._plan_distance_matrix_tiles(missing)
+        assert covers(tiles, missing), n
+        assert len(tiles) <= main._tile_count(n, n), f"{n} stops: {len(tiles)} requests > {main._tile_count(n, n)}"
+        assert all(len(rows) <= main.DISTANCE_MATRIX_MAX_ORIGINS and len(cols) <= main.DISTANCE_MATRIX_MAX_DESTINATIONS
+                   and len(rows) * len(cols) <= main.DISTANCE_MATRIX_MAX_ELEMENTS for rows, cols in tiles)
+    print(f"100 stops: {len(main._plan_distance_matrix_tiles(~np.eye(100, dtype=bool)))} requests")
+    print("✅ Cold plans are never worse than the full grid")
+
+
+def test_new_stop_plan():
+    """One new stop in a cached matrix only requests its row and column"""
+    print("=" * 60)
+    print("TESTING NEW STOP PLAN")
+    print("=" * 60)
+
+    n = 101
+    missing = np.zeros((n, n), dtype=bool)
+    missing[-1, :-1] = True
+    missing[:-1, -1] = True
+    tiles = main._plan_distance_matrix_tiles(missing)
+    elements = sum(len(rows) * len(cols) for rows, cols in tiles)
+    print(f"{n} stops, 1 new: {len(tiles)} requests, {elements} elements")
+    assert covers(tiles, missing)
+    assert elements == int(missing.sum())
+    assert len(tiles) == 8
+    print("✅ Only the missing cells of the new stop are requested")
+
+
+if __name__ == "__main__":
+    test_cold_matrix_plan()
+    test_new_stop_plan()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test script for pre-geocoded addresses in /api/optimize
+Runs offline with the local OR-Tools engine; Google Geocoding is replaced by a
+counter so the test can check which addresses were geocoded
+"""
+
+import os
+
+os.environ.setdefault('GOOGLE_MAPS_API_KEY', 'test-key')
+os.environ['GEOCODE_CACHE_PATH'] = ''
+os.environ['LOCAL_SOLVER_TIME_LIMIT_SECONDS'] = '1'
+
+import main
+
+# Test data - German addresses with known coordinates
+ADDRESSES = {
+    "Neumarkter Str. 39, 90584 Allersberg, Deutschland": (49.2520, 11.2368),
+    "Kolpingstraße 2, 90584 Allersberg, Deutschland": (49.2497, 11.2336),
+    "Dietkirchen 13, 92367 Pilsach, Deutschland": (49.3070, 11.4630),
+    "Harrhof 7, 90584 Allersberg, Deutschland": (49.2310, 11.2020),
+    "Seelstraße 20, 92318 Neumarkt in der Oberpfalz, Deutschland": (49.2790, 11.4590),
+}
+
+
+def post(payload, geocoded):
+    """POST /api/optimize with geocode_address replaced by a recording fake."""
+    def fake_geocode_address(address):
+        geocoded.append(address)
+        return ADDRESSES[address]
+
+    original_geocode_address = main.geocode_address
+    original_calibration = main.travel_calibration
+    original_route_store = main.route_store
+    main.geocode_address = fake_geocode_address
+    # Keep test routes out of the default route store and calibration out of the local matrices
+    main.travel_calibration = None
+    main.route_store = None
+    try:
+        return main.app.test_client().post('/api/optimize', json={'engine': 'local', **payload})
+    finally:
+        main.geocode_address = original_geocode_address
+        main.travel_calibration = original_calibration
+        main.route_store = original_route_store
+
+
+def test_pregeocoded_addresses():
+    """Address objects and a parallel coordinates list bypass geocoding"""
+    print("=" * 60)
+    print("TESTING PRE-GEOCODED ADDRESSES")
+    print("=" * 60)
+
+    addresses = list(ADDRESSES)
+
+    # 1. Address objects with coordinates: no geocoding at all
+    geocoded = []
+    entries = [{"address": address, "latitude": lat, "longitude": lng} for address, (lat, lng) in ADDRESSES.items()]
+    response = post({"addresses": entries + [entries[0]]}, geocoded)
+    result = response.get_json()
+    print(f"Address objects: status {response.status_code}, geocoded {len(geocoded)}")
+    assert response.status_code == 200, result
+    assert geocoded == []
+    assert result['optimized_addresses'][0] == addresses[0]
+    assert result['address_coordinates'][addresses[2]] == {'latitude': 49.3070, 'longitude': 11.4630}
+
+    # 2. Parallel coordinates with a gap: only the missing entry is geocoded
+    geocoded = []
+    coordinates = [list(ADDRESSES[address]) for address in addresses]
+    coordinates[3] = None
+    response = post({"addresses": addresses, "coordinates": coordinates}, geocoded)
+    print(f"Parallel coordinates: status {response.status_code}, geocoded {geocoded}")
+    assert response.status_code == 200, response.get_json()
+    assert geocoded == [addresses[3]]
+
+    # 3. Mixed strings and objects; objects without an address are labelled "lat,lng"
+    geocoded = []
+    response = post({"addresses": [addresses[0], {"latitude": 49.3070, "longitude": 11.4630}, addresses[4]]}, geocoded)
+    result = response.get_json()
+    assert response.status_code == 200, result
+    assert sorted(geocoded) == sorted([addresses[0], addresses[4]])
+    assert "49.307,11.463" in result['address_coordinates']
+
+    # 4. Validation errors
+    invalid_payloads = [
+        {"addresses": [{"address": addresses[0], "latitude": 91, "longitude": 11.2}, addresses[1]]},
+        {"addresses": [{"address": addresses[0], "latitude": "49.2"}, addresses[1]]},
+        {"addresses": addresses, "coordinates": [[49.2, 11.2]]},
+        {"addresses": [{}, addresses[1]]},
+        {"addresses": [{"address": addresses[0], "latitude": 49.2, "longitude": 11.2}, addresses[1],
+                       {"address": addresses[0], "latitude": 49.3, "longitude": 11.3}]},
+    ]
+    for payload in invalid_payloads:
+        response = post(payload, [])
+        print(f"  Invalid payload -> {response.status_code}: {response.get_json()['error']}")
+        assert response.status_code == 400
+    print("✅ Pre-geocoded addresses skip geocoding and keep the response format")
+
+
+if __name__ == "__main__":
+    test_pregeocoded_addresses()
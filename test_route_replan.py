@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Test script for re-planning a stored route from the vehicle's current position
+Runs offline against the local fake Route Optimization server; geocoding is
+skipped with pre-geocoded addresses
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('GOOGLE_MAPS_API_KEY', 'test-key')
+os.environ.setdefault('GOOGLE_CLOUD_PROJECT_ID', 'test-project')
+os.environ['ROUTE_RESPONSE_CACHE_MAX_ENTRIES'] = '0'
+
+import main
+from fake_route_optimization_server import FakeRouteOptimizationServer
+
+# Test data - German addresses with known coordinates
+ADDRESSES = [
+    {"address": "Neumarkter Str. 39, 90584 Allersberg, Deutschland", "latitude": 49.2520, "longitude": 11.2368},
+    {"address": "Kolpingstraße 2, 90584 Allersberg, Deutschland", "latitude": 49.2497, "longitude": 11.2336},
+    {"address": "Dietkirchen 13, 92367 Pilsach, Deutschland", "latitude": 49.3070, "longitude": 11.4630},
+    {"address": "Harrhof 7, 90584 Allersberg, Deutschland", "latitude": 49.2310, "longitude": 11.2020},
+    {"address": "Seelstraße 20, 92318 Neumarkt in der Oberpfalz, Deutschland", "latitude": 49.2790, "longitude": 11.4590},
+    {"address": "Neumarkter Str. 39, 90584 Allersberg, Deutschland", "latitude": 49.2520, "longitude": 11.2368},
+]
+
+
+def test_route_replan():
+    """Remaining stops are re-optimized from the current position with their planned windows"""
+    print("=" * 60)
+    print("TESTING MID-ROUTE REPLAN")
+    print("=" * 60)
+
+    payload = {
+        "addresses": ADDRESSES,
+        "start_time": "2024-12-21T08:00:00Z",
+        "priority_addresses": [
+            {"address": ADDRESSES[4]["address"], "priority_level": "high", "preferred_time_window": "late"}
+        ]
+    }
+
+    server = FakeRouteOptimizationServer().start()
+    original_pool = main.route_client_pool
+    original_route_store = main.route_store
+    original_response_cache = main.route_response_cache
+    main.set_route_client_pool(main.RouteClientPool(size=1, endpoint=server.endpoint))
+    main.route_response_cache = None  # Engine calls are counted below
+    main.route_store = main.RouteStore(os.path.join(tempfile.mkdtemp(prefix='route-store-test-'), 'routes.sqlite3'), ttl_days=1)
+    original_calibration = main.travel_calibration
+    main.travel_calibration = None  # Test legs must not calibrate the default store
+    try:
+        client = main.app.test_client()
+        response = client.post('/api/optimize', json=payload)
+        planned = response.get_json()
+        assert response.status_code == 200, planned
+        route_id = planned['route_id']
+        calls = server.calls['OptimizeTours']
+
+        # Two stops done, the truck is at the second one
+        completed = [i for i in planned['route_indices'][1:-1] if i != 4][:2]
+        position = ADDRESSES[completed[-1]]
+        request = {
+            "latitude": position["latitude"] + 0.001, "longitude": position["longitude"],
+            "current_time": "2024-12-21T09:00:00Z", "completed_stops": completed
+        }
+        response = client.post(f'/api/routes/{route_id}/replan', json=request)
+        replanned = response.get_json()
+        print(f"Replan: {replanned.get('replan')}")
+        assert response.status_code == 200, replanned
+        assert server.calls['OptimizeTours'] == calls + 1  # Priorities became windows: one stage
+        assert replanned['replan']['remaining_stops'] == len(ADDRESSES) - 2 - len(completed)
+        assert replanned['timing_info']['vehicle_start_time'] == '2024-12-21T09:00:00Z'
+        indices = replanned['replan']['route_address_indices']
+        assert indices[0] is None and indices[-1] == len(ADDRESSES) - 1
+        assert sorted(indices[1:-1]) == sorted(set(range(1, len(ADDRESSES) - 1)) - set(completed))
+        assert [planned['original_addresses'][i] for i in indices[1:]] == replanned['optimized_addresses'][1:]
+
+        # The priority window keeps its planned time and follows its stop to the new index
+        stored = main.route_store.get(route_id)
+        replan_payload, address_indices = main.build_replan_payload(stored, request)
+        windows = replan_payload['time_windows']['windows']
+        assert len(windows) == 1
+        assert address_indices[windows[0]['address_index']] == 4
+        planned_windows = main.create_priority_time_windows(
+            planned['original_addresses'], payload['priority_addresses'],
+            main.datetime(2024, 12, 21, 8, tzinfo=main.pytz.UTC),
+            main.datetime(2024, 12, 21, 8, tzinfo=main.pytz.UTC) + main.timedelta(minutes=planned['stage1_duration'])
+        )['windows']
+        assert windows[0]['soft_end_time'] == planned_windows[0]['soft_end_time']
+        assert len(replan_payload['addresses']) == len(ADDRESSES) - len(completed)
+        assert stored['version'] == 1  # The stored plan is not changed
+
+        # Errors
+        assert client.post('/api/routes/unknown/replan', json=request).status_code == 404
+        assert client.post(f'/api/routes/{route_id}/replan', json={**request, "completed_stops": [0]}).status_code == 400
+        assert client.post(f'/api/routes/{route_id}/replan', json={**request, "latitude": None}).status_code == 400
+        assert client.post(f'/api/routes/{route_id}/replan', json={**request, "current_time": "soon"}).status_code == 400
+        print("✅ Remaining stops re-planned from the current position")
+    finally:
+        main.set_route_client_pool(original_pool)
+        main.route_store = original_route_store
+        main.route_response_cache = original_response_cache
+        main.travel_calibration = original_calibration
+        server.stop()
+
+
+def test_replan_after_closed_hard_window():
+    """A hard window that closed before the replan becomes a soft end with a late cost"""
+    print("=" * 60)
+    print("TESTING REPLAN AFTER A CLOSED HARD WINDOW")
+    print("=" * 60)
+
+    payload = {
+        "addresses": ADDRESSES,
+        "start_time": "2024-12-21T08:00:00Z",
+        "time_windows": {
+            "enabled": True,
+            "windows": [
+                {"address_index": 3, "hard_start_time": "2024-12-21T08:00:00Z", "hard_end_time": "2024-12-21T08:30:00Z"},
+                {"address_index": 2, "hard_start_time": "2024-12-21T08:00:00Z", "hard_end_time": "2024-12-21T12:00:00Z"}
+            ]
+        }
+    }
+
+    server = FakeRouteOptimizationServer().start()
+    original_pool = main.route_client_pool
+    original_route_store = main.route_store
+    original_response_cache = main.route_response_cache
+    main.set_route_client_pool(main.RouteClientPool(size=1, endpoint=server.endpoint))
+    main.route_response_cache = None
+    main.route_store = main.RouteStore(os.path.join(tempfile.mkdtemp(prefix='route-store-test-'), 'routes.sqlite3'), ttl_days=1)
+    original_calibration = main.travel_calibration
+    main.travel_calibration = None  # Test legs must not calibrate the default store
+    try:
+        client = main.app.test_client()
+        response = client.post('/api/optimize', json=payload)
+        planned = response.get_json()
+        assert response.status_code == 200, planned
+        route_id = planned['route_id']
+
+        # The driver is running late: stop 3 was due by 08:30
+        request = {
+            "latitude": ADDRESSES[1]["latitude"], "longitude": ADDRESSES[1]["longitude"],
+            "current_time": "2024-12-21T09:00:00Z", "completed_stops": [1]
+        }
+        replan_payload, address_indices = main.build_replan_payload(main.route_store.get(route_id), request)
+        windows = {address_indices[window['address_index']]: window for window in replan_payload['time_windows']['windows']}
+        print(f"Replanned windows: {windows}")
+        closed = windows[3]
+        assert 'hard_end_time' not in closed
+        assert closed['hard_start_time'] == '2024-12-21T09:00:00Z'
+        assert closed['soft_end_time'] == '2024-12-21T09:00:00Z'
+        assert closed['cost_per_hour_after'] == main.REPLAN_CLOSED_WINDOW_COST_PER_HOUR
+        # Open hard windows keep their end
+        assert windows[2]['hard_end_time'] == '2024-12-21T12:00:00Z'
+        assert windows[2]['hard_start_time'] == '2024-12-21T09:00:00Z'
+
+        response = client.post(f'/api/routes/{route_id}/replan', json=request)
+        replanned = response.get_json()
+        assert response.status_code == 200, replanned
+        assert 3 in replanned['replan']['route_address_indices']
+        # The local engine solves the relaxed windows as well
+        route_info = main.run_optimization({**replan_payload, "engine": "local"})
+        assert route_info and route_info['success'], route_info
+        assert len(route_info['route_indices']) == len(address_indices)
+        print("✅ Closed hard window relaxed to a soft end")
+    finally:
+        main.set_route_client_pool(original_pool)
+        main.route_store = original_route_store
+        main.route_response_cache = original_response_cache
+        main.travel_calibration = original_calibration
+        server.stop()
+
+
+if __name__ == "__main__":
+    test_route_replan()
+    test_replan_after_closed_hard_window()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test script for adding and removing stops of a stored route
+Runs offline against the local fake Route Optimization server; geocoding is
+skipped with pre-geocoded addresses
+"""
+
+import os
+import tempfile
+import time
+
+os.environ.setdefault('GOOGLE_MAPS_API_KEY', 'test-key')
+os.environ.setdefault('GOOGLE_CLOUD_PROJECT_ID', 'test-project')
+os.environ['ROUTE_RESPONSE_CACHE_MAX_ENTRIES'] = '0'
+
+import main
+from fake_route_optimization_server import FakeRouteOptimizationServer
+
+# Test data - German addresses with known coordinates
+ADDRESSES = [
+    {"address": "Neumarkter Str. 39, 90584 Allersberg, Deutschland", "latitude": 49.2520, "longitude": 11.2368},
+    {"address": "Kolpingstraße 2, 90584 Allersberg, Deutschland", "latitude": 49.2497, "longitude": 11.2336},
+    {"address": "Dietkirchen 13, 92367 Pilsach, Deutschland", "latitude": 49.3070, "longitude": 11.4630},
+    {"address": "Harrhof 7, 90584 Allersberg, Deutschland", "latitude": 49.2310, "longitude": 11.2020},
+    {"address": "Seelstraße 20, 92318 Neumarkt in der Oberpfalz, Deutschland", "latitude": 49.2790, "longitude": 11.4590},
+    {"address": "Neumarkter Str. 39, 90584 Allersberg, Deutschland", "latitude": 49.2520, "longitude": 11.2368},
+]
+# Close to Pilsach, so best insertion puts it next to that stop
+NEW_STOP = {"address": "Hauptstraße 1, 92367 Pilsach, Deutschland", "latitude": 49.3100, "longitude": 11.4600}
+
+
+def wait_for_job(client, status_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(status_url).get_json()
+        if job['status'] in ('succeeded', 'failed'):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"Job {status_url} did not finish")
+
+
+def test_route_stops():
+    """Stops are inserted and removed locally; reoptimize queues a full re-optimization"""
+    print("=" * 60)
+    print("TESTING INCREMENTAL ROUTE STOP CHANGES")
+    print("=" * 60)
+
+    server = FakeRouteOptimizationServer().start()
+    original_pool = main.route_client_pool
+    original_route_store = main.route_store
+    original_response_cache = main.route_response_cache
+    main.set_route_client_pool(main.RouteClientPool(size=1, endpoint=server.endpoint))
+    main.route_response_cache = None  # Engine calls are counted below
+    main.route_store = main.RouteStore(os.path.join(tempfile.mkdtemp(prefix='route-store-test-'), 'routes.sqlite3'), ttl_days=1)
+    original_job_store = main.job_store
+    original_calibration = main.travel_calibration
+    main.job_store = main.JobStore(os.path.join(tempfile.mkdtemp(prefix='job-store-test-'), 'jobs.sqlite3'), ttl_seconds=3600)
+    main.travel_calibration = None  # Test legs must not calibrate the default store
+    try:
+        client = main.app.test_client()
+        response = client.post('/api/optimize', json={"addresses": ADDRESSES, "start_time": "2024-12-21T08:00:00Z"})
+        result = response.get_json()
+        assert response.status_code == 200, result
+        route_id = result['route_id']
+        assert server.calls['OptimizeTours'] == 1
+
+        # 1. Best insertion: no engine call, the other stops keep their order
+        response = client.post(f'/api/routes/{route_id}/stops', json={"address": NEW_STOP})
+        inserted = response.get_json()
+        print(f"Inserted: {inserted.get('incremental_update')}, order {inserted.get('route_indices')}")
+        assert response.status_code == 200, inserted
+        assert server.calls['OptimizeTours'] == 1
+        assert inserted['route_version'] == 2
+        assert len(inserted['optimized_addresses']) == len(ADDRESSES) + 1
+        assert [i for i in inserted['route_indices'] if i != 5] == [6 if i == 5 else i for i in result['route_indices']]
+        stop = inserted['incremental_update']['stop_number']
+        assert ADDRESSES[2]['address'] in inserted['optimized_addresses'][stop - 2:stop + 1]
+        assert inserted['visit_schedule'][0]['arrival_time'] == '2024-12-21T08:00:00Z'
+
+        # 2. Removal repair by address and by stop number
+        response = client.delete(f'/api/routes/{route_id}/stops', json={"address": ADDRESSES[3]['address']})
+        removed = response.get_json()
+        assert response.status_code == 200, removed
+        assert ADDRESSES[3]['address'] not in removed['optimized_addresses']
+        response = client.delete(f'/api/routes/{route_id}/stops', json={"stop_number": 2})
+        assert response.status_code == 200
+        assert len(response.get_json()['optimized_addresses']) == len(ADDRESSES) - 1
+
+        # 3. Full re-optimization in the background replaces the stored route
+        response = client.post(f'/api/routes/{route_id}/stops', json={
+            "address": ADDRESSES[3], "priority_level": "high", "reoptimize": True
+        })
+        updated = response.get_json()
+        assert response.status_code == 200, updated
+        job = wait_for_job(client, updated['reoptimization_job']['status_url'])
+        print(f"Re-optimization job: {job['status']}")
+        assert job['status'] == 'succeeded', job
+        assert job['result']['route_version'] == updated['route_version'] + 1
+        stored = main.route_store.get(route_id)
+        assert stored['result']['two_stage_optimization'] is True
+        assert stored['payload']['priority_addresses'][0]['address'] == ADDRESSES[3]['address']
+        assert all('latitude' in entry for entry in stored['payload']['addresses'])
+
+        # 4. Errors
+        assert client.post('/api/routes/unknown/stops', json={"address": NEW_STOP}).status_code == 404
+        assert client.post(f'/api/routes/{route_id}/stops', json={"address": ADDRESSES[3]}).status_code == 400
+        assert client.delete(f'/api/routes/{route_id}/stops', json={"stop_number": 1}).status_code == 400
+        assert client.delete(f'/api/routes/{route_id}/stops', json={"address": "Unknown"}).status_code == 400
+        print("✅ Stops added and removed without re-optimizing from scratch")
+    finally:
+        main.set_route_client_pool(original_pool)
+        main.route_store = original_route_store
+        main.route_response_cache = original_response_cache
+        main.job_store = original_job_store
+        main.travel_calibration = original_calibration
+        server.stop()
+
+
+if __name__ == "__main__":
+    test_route_stops()
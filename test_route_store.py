@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test script for the persistent route store and GET /api/routes/<route_id>
+Runs offline with the local OR-Tools engine and pre-geocoded addresses
+"""
+
+import os
+import sqlite3
+import tempfile
+import time
+
+os.environ.setdefault('GOOGLE_MAPS_API_KEY', 'test-key')
+os.environ['LOCAL_SOLVER_TIME_LIMIT_SECONDS'] = '1'
+
+import main
+
+# Test data - German addresses with known coordinates
+ADDRESSES = [
+    {"address": "Neumarkter Str. 39, 90584 Allersberg, Deutschland", "latitude": 49.2520, "longitude": 11.2368},
+    {"address": "Kolpingstraße 2, 90584 Allersberg, Deutschland", "latitude": 49.2497, "longitude": 11.2336},
+    {"address": "Dietkirchen 13, 92367 Pilsach, Deutschland", "latitude": 49.3070, "longitude": 11.4630},
+    {"address": "Harrhof 7, 90584 Allersberg, Deutschland", "latitude": 49.2310, "longitude": 11.2020},
+    {"address": "Seelstraße 20, 92318 Neumarkt in der Oberpfalz, Deutschland", "latitude": 49.2790, "longitude": 11.4590},
+    {"address": "Neumarkter Str. 39, 90584 Allersberg, Deutschland", "latitude": 49.2520, "longitude": 11.2368},
+]
+
+
+def test_route_store():
+    """Results are stored compressed with payload, geocodes and request hash and retrieved by id"""
+    print("=" * 60)
+    print("TESTING ROUTE STORE")
+    print("=" * 60)
+
+    path = os.path.join(tempfile.mkdtemp(prefix='route-store-test-'), 'routes.sqlite3')
+    original_route_store = main.route_store
+    original_job_store = main.job_store
+    original_calibration = main.travel_calibration
+    main.route_store = main.RouteStore(path, ttl_days=1)
+    main.job_store = main.JobStore(os.path.join(tempfile.mkdtemp(prefix='job-store-test-'), 'jobs.sqlite3'), ttl_seconds=3600)
+    main.travel_calibration = None
+    try:
+        client = main.app.test_client()
+        payload = {"addresses": ADDRESSES, "start_time": "2024-12-21T08:00:00Z", "engine": "local"}
+        response = client.post('/api/optimize', json=payload)
+        result = response.get_json()
+        assert response.status_code == 200, result
+        route_id = result['route_id']
+
+        # 1. Retrieval by id
+        response = client.get(f'/api/routes/{route_id}')
+        stored = response.get_json()
+        print(f"Stored route {route_id}: version {stored['version']}, hash {stored['request_hash'][:12]}")
+        assert response.status_code == 200, stored
+        assert stored['version'] == 1
+        assert stored['payload'] == payload
+        assert stored['result']['route_indices'] == result['route_indices']
+        assert stored['result']['visit_schedule'] == result['visit_schedule']
+        assert stored['geocodes'][ADDRESSES[2]['address']] == [49.3070, 11.4630]
+        assert stored['request_hash'] == main.RouteStore.request_hash(dict(reversed(list(payload.items()))))
+        assert client.get('/api/routes/unknown').status_code == 404
+
+        # 2. Compressed on disk
+        stats = client.get('/health').get_json()['route_store']
+        print(f"Store stats: {stats}")
+        assert stats['routes'] == 1
+        assert 0 < stats['stored_bytes'] < stats['json_bytes'] / 2
+
+        # 3. Background jobs store their result too
+        response = client.post('/api/optimize/jobs', json=payload)
+        status_url = response.get_json()['status_url']
+        for _ in range(100):
+            job = client.get(status_url).get_json()
+            if job['status'] in ('succeeded', 'failed'):
+                break
+            time.sleep(0.1)
+        assert job['status'] == 'succeeded', job
+        assert main.route_store.get(job['result']['route_id'])['payload'] == payload
+
+        # 4. Expired routes are not returned
+        connection = sqlite3.connect(path)
+        connection.execute('UPDATE routes SET updated_at = ? WHERE route_id = ?', (time.time() - 2 * 86400, route_id))
+        connection.commit()
+        connection.close()
+        assert main.route_store.get(route_id) is None
+        print("✅ Routes stored compressed and retrieved by id")
+    finally:
+        main.route_store = original_route_store
+        main.job_store = original_job_store
+        main.travel_calibration = original_calibration
+
+
+if __name__ == "__main__":
+    test_route_store()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test script for the local stage 1 duration estimate of two-stage optimization
+Runs offline against the local fake Route Optimization server; geocoding is
+skipped with pre-geocoded addresses
+"""
+
+import os
+
+os.environ.setdefault('GOOGLE_MAPS_API_KEY', 'test-key')
+os.environ.setdefault('GOOGLE_CLOUD_PROJECT_ID', 'test-project')
+os.environ['ROUTE_RESPONSE_CACHE_MAX_ENTRIES'] = '0'
+
+import main
+from fake_route_optimization_server import FakeRouteOptimizationServer
+
+# Test data - German addresses with known coordinates
+ADDRESSES = [
+    {"address": "Neumarkter Str. 39, 90584 Allersberg, Deutschland", "latitude": 49.2520, "longitude": 11.2368},
+    {"address": "Kolpingstraße 2, 90584 Allersberg, Deutschland", "latitude": 49.2497, "longitude": 11.2336},
+    {"address": "Dietkirchen 13, 92367 Pilsach, Deutschland", "latitude": 49.3070, "longitude": 11.4630},
+    {"address": "Harrhof 7, 90584 Allersberg, Deutschland", "latitude": 49.2310, "longitude": 11.2020},
+    {"address": "Seelstraße 20, 92318 Neumarkt in der Oberpfalz, Deutschland", "latitude": 49.2790, "longitude": 11.4590},
+    {"address": "Neumarkter Str. 39, 90584 Allersberg, Deutschland", "latitude": 49.2520, "longitude": 11.2368},
+]
+
+
+def test_stage1_estimate():
+    """stage1_mode=estimate makes one OptimizeTours call instead of two and reports the estimate error"""
+    print("=" * 60)
+    print("TESTING STAGE 1 DURATION ESTIMATE")
+    print("=" * 60)
+
+    payload = {
+        "addresses": ADDRESSES,
+        "start_time": "2024-12-21T08:00:00Z",
+        "priority_addresses": [
+            {"address": ADDRESSES[2]["address"], "priority_level": "high", "preferred_time_window": "early"}
+        ]
+    }
+
+    server = FakeRouteOptimizationServer().start()
+    original_pool = main.route_client_pool
+    original_response_cache = main.route_response_cache
+    original_calibration = main.travel_calibration
+    original_route_store = main.route_store
+    main.set_route_client_pool(main.RouteClientPool(size=1, endpoint=server.endpoint))
+    main.route_response_cache = None  # main may have been imported with the cache enabled
+    # Keep test legs and routes out of the default stores (and their legs out of the estimate)
+    main.travel_calibration = None
+    main.route_store = None
+    try:
+        client = main.app.test_client()
+
+        response = client.post('/api/optimize', json=payload)
+        assert response.status_code == 200, response.get_json()
+        assert server.calls['OptimizeTours'] == 2
+        assert 'stage1_estimate' not in response.get_json()
+
+        response = client.post('/api/optimize', json={**payload, "stage1_mode": "estimate"})
+        result = response.get_json()
+        estimate = result['stage1_estimate']
+        print(f"OptimizeTours calls: {server.calls['OptimizeTours']}")
+        print(f"Stage 1 estimate: {estimate}")
+
+        assert response.status_code == 200, result
+        assert server.calls['OptimizeTours'] == 3
+        assert result['two_stage_optimization'] is True
+        assert result['stage1_duration'] == estimate['estimated_duration_minutes']
+        assert estimate['actual_duration_minutes'] == result['timing_info']['total_duration_minutes']
+        assert abs(estimate['error_minutes'] - (estimate['estimated_duration_minutes'] - estimate['actual_duration_minutes'])) <= 0.2
+        assert abs(estimate['error_percent']) < 100
+        assert 'stage1_estimate' in result['performance']['stages_ms']
+        assert 'stage1_solve' not in result['performance']['stages_ms']
+
+        response = client.post('/api/optimize', json={**payload, "stage1_mode": "guess"})
+        assert response.status_code == 400
+        print("✅ Priority route solved with one remote call and a local duration estimate")
+    finally:
+        main.set_route_client_pool(original_pool)
+        main.route_response_cache = original_response_cache
+        main.travel_calibration = original_calibration
+        main.route_store = original_route_store
+        server.stop()
+
+
+if __name__ == "__main__":
+    test_stage1_estimate()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test script for travel time calibration of the local haversine estimate
+Runs offline: the calibration store is fed synthetic legs, then with the legs of
+responses from the local fake Route Optimization server
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('GOOGLE_MAPS_API_KEY', 'test-key')
+os.environ.setdefault('GOOGLE_CLOUD_PROJECT_ID', 'test-project')
+os.environ['ROUTE_RESPONSE_CACHE_MAX_ENTRIES'] = '0'
+
+import main
+from fake_route_optimization_server import FakeRouteOptimizationServer
+
+# Test data - German addresses with known coordinates
+ADDRESSES = [
+    {"address": "Neumarkter Str. 39, 90584 Allersberg, Deutschland", "latitude": 49.2520, "longitude": 11.2368},
+    {"address": "Kolpingstraße 2, 90584 Allersberg, Deutschland", "latitude": 49.2497, "longitude": 11.2336},
+    {"address": "Dietkirchen 13, 92367 Pilsach, Deutschland", "latitude": 49.3070, "longitude": 11.4630},
+    {"address": "Harrhof 7, 90584 Allersberg, Deutschland", "latitude": 49.2310, "longitude": 11.2020},
+    {"address": "Seelstraße 20, 92318 Neumarkt in der Oberpfalz, Deutschland", "latitude": 49.2790, "longitude": 11.4590},
+    {"address": "Neumarkter Str. 39, 90584 Allersberg, Deutschland", "latitude": 49.2520, "longitude": 11.2368},
+]
+
+
+def create_store(max_legs=1000):
+    """Empty calibration store in a temporary directory."""
+    path = os.path.join(tempfile.mkdtemp(prefix='calibration-test-'), 'calibration.sqlite3')
+    return main.TravelCalibrationStore(path, max_legs=max_legs, region_degrees=0.25, min_legs=5)
+
+
+def test_calibration_store():
+    """Observed legs are fitted per region and hour, with fallbacks to the region and to all regions"""
+    print("=" * 60)
+    print("TESTING TRAVEL CALIBRATION STORE")
+    print("=" * 60)
+
+    store = create_store(max_legs=8)
+    origin = (49.2520, 11.2368)
+    destination = (49.3070, 11.4630)
+    straight_meters = main._haversine_meters(origin, destination)
+    road_meters = 1.6 * straight_meters
+    profile_seconds = main._speed_profile_seconds(road_meters)
+
+    # Morning legs are twice as slow as the speed profile, afternoon legs match it
+    stored = store.record([(origin, destination, 8, road_meters, 2 * profile_seconds)] * 6)
+    stored += store.record([(origin, destination, 15, road_meters, profile_seconds)] * 6)
+    stored += store.record([(origin, (49.2521, 11.2369), 8, 50, 10)])  # Too short, skipped
+    assert stored == 12
+
+    circuity, speed, calibrated = store.factors([origin, destination], hour=8)
+    print(f"08:00 factors: circuity {circuity}, speed {speed}, calibrated {calibrated}")
+    assert calibrated == 2
+    assert abs(circuity[0] - 1.6) < 0.01
+    assert abs(speed[0] - 2.0) < 0.01
+    # The destination's region has no own legs and uses the overall fit
+    assert abs(speed[1] - 1.5) < 0.01
+
+    _, speed, _ = store.factors([origin], hour=15)
+    assert abs(speed[0] - 1.0) < 0.01
+    _, speed, _ = store.factors([origin], hour=3)
+    assert abs(speed[0] - 1.5) < 0.01
+
+    stats = store.stats()
+    print(f"Stats: {stats}")
+    assert stats['legs'] == 8  # Bounded by max_legs
+    assert stats['observed_legs'] == 12
+    assert abs(stats['circuity_factor'] - 1.6) < 0.01
+
+    # Calibrated factors scale the haversine matrix row by row
+    matrix = main.build_haversine_matrix([origin, destination], circuity_factor=[1.6, 1.0], speed_factor=[2.0, 1.0])
+    default_matrix = main.build_haversine_matrix([origin, destination], circuity_factor=1.6)
+    assert abs(matrix.distances[0, 1] - road_meters) <= 1
+    assert abs(matrix.durations[0, 1] - 2 * default_matrix.durations[0, 1]) <= 1
+    print("✅ Calibration factors fitted with hour, region and overall fallbacks")
+
+
+def test_calibrated_estimate():
+    """Route Optimization responses calibrate the stage 1 estimate of later requests"""
+    print("=" * 60)
+    print("TESTING CALIBRATED STAGE 1 ESTIMATE")
+    print("=" * 60)
+
+    payload = {
+        "addresses": ADDRESSES,
+        "start_time": "2024-12-21T08:00:00Z",
+        "stage1_mode": "estimate",
+        "priority_addresses": [
+            {"address": ADDRESSES[2]["address"], "priority_level": "high", "preferred_time_window": "early"}
+        ]
+    }
+
+    server = FakeRouteOptimizationServer().start()
+    original_pool = main.route_client_pool
+    original_calibration = main.travel_calibration
+    original_route_store = main.route_store
+    main.set_route_client_pool(main.RouteClientPool(size=1, endpoint=server.endpoint))
+    main.travel_calibration = create_store()
+    main.route_store = None  # Keep test routes out of the default route store
+    try:
+        client = main.app.test_client()
+        coordinates = tuple((entry["latitude"], entry["longitude"]) for entry in ADDRESSES)
+        _, calibrated = main._local_travel_matrices(coordinates, source='haversine', departure_hour=8)
+        assert not calibrated
+        errors = []
+        for _ in range(3):
+            result = client.post('/api/optimize', json=payload).get_json()
+            assert result['success'], result
+            errors.append(result['stage1_estimate'])
+        print(f"Estimates: {errors}")
+
+        assert errors[0]['method'] == 'local_haversine'
+        assert errors[-1]['method'] == 'calibrated_haversine'
+        # Newly observed legs take effect on the cached matrices
+        _, calibrated = main._local_travel_matrices(coordinates, source='haversine', departure_hour=8)
+        assert calibrated
+        assert abs(errors[-1]['error_percent']) < abs(errors[0]['error_percent'])
+
+        health = client.get('/health').get_json()
+        assert health['travel_calibration']['observed_legs'] > 0
+        print("✅ Observed legs reduced the stage 1 estimate error")
+    finally:
+        main.set_route_client_pool(original_pool)
+        main.travel_calibration = original_calibration
+        main.route_store = original_route_store
+        main._cached_local_travel_matrices.cache_clear()
+        server.stop()
+
+
+if __name__ == "__main__":
+    test_calibration_store()
+    test_calibrated_estimate()